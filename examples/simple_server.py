@@ -6,14 +6,35 @@ text. The OpenAI API is used for the language model call if available.
 """
 
 from http.server import BaseHTTPRequestHandler, HTTPServer
+import functools
 import os
+import sys
+import threading
 
 try:
     import openai
 except ImportError:  # pragma: no cover - library may not be installed
     openai = None
 
-PREVIOUS_RESPONSE_ID = None
+try:
+    from vibestudio.backends import OpenAIBackend
+    from vibestudio.chain import ResponseChain
+except ImportError:  # run as a script from the examples directory
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from vibestudio.backends import OpenAIBackend
+    from vibestudio.chain import ResponseChain
+
+# Chained with previous_response_id, so each call only uploads the new prompt
+CHAIN = ResponseChain()
+CONVERSATION = []
+_CONVERSATION_LOCK = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def get_backend(api_key: str) -> OpenAIBackend:
+    """Return the backend shared by every request so its client is reused."""
+    return OpenAIBackend(openai, api_key)
+
 
 class Handler(BaseHTTPRequestHandler):
     """Basic request handler that proxies to an LLM."""
@@ -27,42 +48,19 @@ class Handler(BaseHTTPRequestHandler):
         gracefully.
         """
 
-        if openai is None:
-            raise RuntimeError("openai package is required for LLM calls")
-
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise RuntimeError("OPENAI_API_KEY environment variable not set")
-
-        openai.api_key = api_key
+        backend = get_backend(os.getenv("OPENAI_API_KEY"))
         model = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
         prompt = f"Echo the following HTTP path and query exactly:\n{path}"
 
+        with _CONVERSATION_LOCK:
+            messages = CONVERSATION + [{"role": "user", "content": prompt}]
         try:
-            global PREVIOUS_RESPONSE_ID
-            if hasattr(openai, "responses"):
-                response = openai.responses.create(
-                    model=model,
-                    messages=[{"role": "user", "content": prompt}],
-                    previous_response_id=PREVIOUS_RESPONSE_ID,
-                )
-                PREVIOUS_RESPONSE_ID = response.id
-                text = response.choices[0].message.content.strip()
-            elif hasattr(openai, "chat") and hasattr(openai.chat, "completions"):
-                response = openai.chat.completions.create(
-                    model=model,
-                    messages=[{"role": "user", "content": prompt}],
-                )
-                text = response.choices[0].message.content.strip()
-            else:
-                response = openai.ChatCompletion.create(
-                    model=model,
-                    messages=[{"role": "user", "content": prompt}],
-                )
-                text = response.choices[0].message["content"].strip()
-            return text
+            text = backend.complete(messages, model, CHAIN).text
         except Exception as exc:  # pragma: no cover - depends on network
             return f"LLM call failed: {exc}"
+        with _CONVERSATION_LOCK:
+            CONVERSATION[:] = messages + [{"role": "assistant", "content": text}]
+        return text
 
     def do_GET(self):
         response_text = ""
@@ -0,0 +1,481 @@
+"""asyncio proxy engine, an alternative to the threaded ``ProxyHandler`` server.
+
+Every connection is a coroutine instead of an OS thread, so slow LLM calls
+only cost a pending task while they wait.  Requests are turned into the same
+request text and replies are parsed with the same ``ReplyParser`` as
+``ProxyHandler``; sessions, the response cache, logging and compaction all go
+through the shared helpers in ``studio``.  Helpers that take the state lock
+or write shared state run on a small thread pool, never on the event loop.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import email.utils
+import http.client
+import io
+import logging
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+from . import metrics
+from .replyparser import ReplyParser, parse_reply
+from .resilience import lingering_attempts
+
+LOGGER = logging.getLogger(__name__)
+
+MAX_HEADER_BYTES = 65536
+# Seconds an idle keep-alive connection is held open
+KEEP_ALIVE_TIMEOUT = 75.0
+SERVER_NAME = "VibeStudio-asyncio"
+# Threads running the studio helpers that take STATE_LOCK or write shared state
+STATE_THREADS = 8
+# The methods ProxyHandler has a do_* method for; anything else gets a 501
+# before it can become a metric label
+METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"))
+
+
+class AsyncLLMClient:
+    """Asynchronous access to the shared LLM backend.
+
+    Backends with native async support (``openai.AsyncOpenAI`` or the
+    scripted stand-in) are awaited directly; otherwise the blocking
+    ``ProxyHandler.call_llm`` runs on a worker thread so the event loop is
+    never blocked.
+    """
+
+    def __init__(self, studio):
+        self.studio = studio
+
+    def _backend(self):
+        try:
+            backend = self.studio.get_backend()
+        except RuntimeError:
+            # call_llm raises the configuration error for the reply
+            return None
+        return backend if backend.native_async else None
+
+    def _model(self):
+        return self.studio._config().model or "gpt-3.5-turbo"
+
+    def _chain(self, session):
+        return session.chain if session is not None else self.studio.RESPONSE_CHAIN
+
+    async def complete(self, messages, session=None):
+        """Return the reply text for ``messages``."""
+        backend = self._backend()
+        if backend is None:
+            handler = types.SimpleNamespace(session=session)
+            return await asyncio.to_thread(self.studio.ProxyHandler.call_llm, handler, messages)
+        model = self._model()
+        completion = await self.studio.LLM_POLICY.acall(
+            lambda chain: backend.acomplete(messages, model, chain), self._chain(session)
+        )
+        account = self.studio._REQUEST_USAGE.get()
+        if account is not None:
+            account["usage"] = completion.usage
+        return completion.text
+
+    async def stream(self, messages, session=None):
+        """Yield the reply to ``messages`` in chunks as it is generated."""
+        backend = self._backend()
+        if backend is None or not backend.streaming:
+            yield await self.complete(messages, session)
+            return
+        account = self.studio._REQUEST_USAGE.get()
+        model = self._model()
+        try:
+            async for chunk in self.studio.LLM_POLICY.astream(lambda: backend.astream(messages, model)):
+                if account is not None:
+                    account.setdefault("usage", None)
+                yield chunk
+        except self.studio.LLMError:
+            raise
+        except Exception as exc:
+            raise self.studio.LLMError(f"LLM stream failed: {exc}") from exc
+
+
+def _reason(status):
+    try:
+        return HTTPStatus(status).phrase
+    except ValueError:
+        return ""
+
+
+class AsyncProxyServer:
+    """HTTP/1.1 proxy with keep-alive running on an asyncio event loop."""
+
+    def __init__(self, studio, host="localhost", port=8000, reuse_port=False):
+        self.studio = studio
+        self.host = host
+        self.port = port
+        # Let proxy worker processes share the port
+        self.reuse_port = reuse_port
+        self.llm = AsyncLLMClient(studio)
+        self.server_address = (host, port)
+        self._server = None
+        self._writers = set()
+        self._state_pool = ThreadPoolExecutor(STATE_THREADS, thread_name_prefix="vibestudio-state")
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port, limit=MAX_HEADER_BYTES, reuse_port=self.reuse_port or None
+        )
+        self.server_address = self._server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            # Idle keep-alive connections would otherwise hold wait_closed open
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+        self._state_pool.shutdown(wait=False)
+
+    async def _offload(self, func, *args):
+        """Run a blocking studio helper on the state threads, in the request's context.
+
+        The helpers take ``STATE_LOCK`` and, with proxy workers, SQLite
+        transactions that can wait on other processes; on the event loop
+        one slow write would stall every connection.
+        """
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self._state_pool, context.run, func, *args)
+
+    async def _handle_connection(self, reader, writer):
+        self._writers.add(writer)
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT)
+                except asyncio.LimitOverrunError:
+                    await self._send_error(writer, 431)
+                    break
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+                request_line, _, header_bytes = head.partition(b"\r\n")
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+                    await self._send_error(writer, 400)
+                    break
+                method, path, version = parts
+                if method not in METHODS:
+                    await self._send_error(writer, 501)
+                    break
+                headers = http.client.parse_headers(io.BytesIO(header_bytes))
+                try:
+                    length = int(headers.get("Content-Length", 0) or 0)
+                except ValueError:
+                    await self._send_error(writer, 400)
+                    break
+                config = await self._offload(self.studio._pin_config)
+                timer, token = self.studio._begin_request(method, path, config)
+                try:
+                    with metrics.span("read"):
+                        body = await reader.readexactly(length) if length else b""
+                    keep_alive = self._keep_alive(version, headers)
+                    keep_alive = await self._handle_request(writer, method, path, version, headers, body, keep_alive)
+                finally:
+                    entry = self.studio._end_request(timer, token, log=False)
+                    if entry is not None:
+                        await self._offload(self.studio._log_entry, entry)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            LOGGER.info("Client disconnected")
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    @staticmethod
+    def _keep_alive(version, headers):
+        connection = headers.get("Connection", "").lower()
+        if version == "HTTP/1.1":
+            return connection != "close"
+        return connection == "keep-alive"
+
+    def _head(self, status, headers, keep_alive, extra=()):
+        metrics.note(status=status, first_byte=True)
+        lines = [
+            f"HTTP/1.1 {status} {_reason(status)}",
+            f"Server: {SERVER_NAME}",
+            f"Date: {email.utils.formatdate(usegmt=True)}",
+        ]
+        content_type = False
+        for k, v in headers:
+            if k.lower() in self.studio._HOP_BY_HOP_HEADERS:
+                continue
+            content_type = content_type or k.lower() == "content-type"
+            lines.append(f"{k}: {v}")
+        # Framing and session headers computed by the proxy itself
+        lines.extend(f"{k}: {v}" for k, v in extra)
+        if not content_type:
+            lines.append("Content-Type: text/plain")
+        lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1", "replace")
+
+    async def _send_error(self, writer, status):
+        body = _reason(status).encode("ascii")
+        writer.write(self._head(status, [], False, [("Content-Length", str(len(body)))]) + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def _handle_request(self, writer, method, path, version, headers, body, keep_alive):
+        """Serve one request and return whether the connection stays open."""
+        studio = self.studio
+        LOGGER.info("Handling %s %s", method, path)
+        send_body = method != "HEAD"
+        if studio.PROXY_METRICS_PATH and method == "GET" and path == studio.PROXY_METRICS_PATH:
+            reply = await self._offload(studio._metrics_reply)
+            return await self._send_stored(writer, path, reply, send_body, keep_alive, [], "metrics", log=False)
+        fixed, source = await self._offload(studio._fixed_reply, method, path, headers)
+        if fixed is not None:
+            return await self._send_stored(writer, path, fixed, send_body, keep_alive, [], source)
+        request_text = studio.build_request_text(method, path, headers, body)
+        with metrics.span("lookup"):
+            session, conversation, cookie = await self._offload(studio._resolve_session, headers)
+            cache_key, cached = studio._cache_lookup(method, path, headers)
+        extra = [("Set-Cookie", cookie)] if cookie else []
+        if cached is not None:
+            return await self._send_stored(writer, path, cached, send_body, keep_alive, extra, "cached")
+        prefetched = await self._take_prefetched(method, path, headers, session)
+        reply = None
+        if prefetched is not None:
+            reply = await self._offload(studio._use_prefetched, conversation, path, prefetched, session)
+        if reply is not None:
+            keep_alive = await self._send_stored(
+                writer, path, reply, send_body, keep_alive, extra, "prefetched", log=False
+            )
+            source = studio.PrefetchSource(path, headers, session, conversation)
+            studio._plan_prefetch(source, reply.status, reply.headers, reply.body)
+            return keep_alive
+        flight, leader = studio._coalesce_join(method, path, headers, session)
+        if not leader:
+            with metrics.span("coalesce.wait"):
+                shared = await studio.COALESCER.wait_async(flight, studio.COALESCE_WAIT)
+            if shared is not None:
+                return await self._send_stored(writer, path, shared, send_body, keep_alive, extra, "coalesced")
+            # The leader failed or is too slow, make our own call
+            flight = None
+        targets = studio._reply_targets(method, path, headers, session, conversation, cache_key, flight)
+        client = studio._client_key(session, writer.get_extra_info("peername", ("",))[0])
+        try:
+            refused = await self._offload(studio._check_tokens, conversation, request_text, client)
+            if refused is not None:
+                return await self._send_stored(writer, path, refused, send_body, keep_alive, extra, "budget")
+            async with self._llm_slot("interactive", client):
+                return await self._forward(
+                    writer, path, version, conversation, request_text, session, send_body, targets, keep_alive, extra
+                )
+        except studio.Overloaded as exc:
+            LOGGER.warning("Shedding %s %s: %s", method, path, exc)
+            return await self._send_stored(writer, path, studio._shed_reply(exc), send_body, keep_alive, extra, "shed")
+        finally:
+            if flight is not None:
+                # Release the followers if no reply was published
+                studio.COALESCER.finish(flight, None)
+
+    @contextlib.asynccontextmanager
+    async def _llm_slot(self, priority, client):
+        """Await one of the scheduler's LLM call slots, like ``studio._llm_slot``."""
+        scheduler = self.studio.SCHEDULER
+        if scheduler is None:
+            yield
+            return
+        with metrics.span("admission"):
+            admitted = await scheduler.acquire_async(priority, client)
+        with lingering_attempts() as lingering:
+            try:
+                yield
+            finally:
+                scheduler.release_after(admitted, lingering)
+
+    async def _take_prefetched(self, method, path, headers, session):
+        """Return the prefetched page for a request, awaiting one under way."""
+        studio = self.studio
+        key = studio._prefetch_key(method, path, headers, session)
+        if key is None:
+            return None
+        future = studio.PREFETCHER.pending(key)
+        if future is not None:
+            with metrics.span("prefetch.wait"):
+                try:
+                    await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), studio.PREFETCH_WAIT)
+                except Exception:
+                    pass
+        return studio.PREFETCHER.take(key)
+
+    async def _send_stored(self, writer, path, reply, send_body, keep_alive, extra, source, log=True):
+        """Send a stored reply without calling the LLM; ``source`` marks its log entry."""
+        metrics.lap("queue")
+        metrics.note(source=source, size=len(reply.body))
+        if log:
+            await self._offload(self.studio._log_cached, path, reply, source)
+        extra.append(("Content-Length", str(len(reply.body))))
+        with metrics.span("write"):
+            writer.write(self._head(reply.status, reply.headers, keep_alive, extra))
+            if send_body:
+                writer.write(reply.body)
+            await writer.drain()
+        metrics.lap("write")
+        return keep_alive
+
+    async def _forward(
+        self, writer, path, version, conversation, request_text, session, send_body, targets, keep_alive, extra
+    ):
+        """Append the request to the conversation and relay the LLM's reply."""
+        studio = self.studio
+        llm_request = await self._offload(studio._append_request, conversation, request_text)
+        if studio.STREAMING:
+            return await self._relay_stream(
+                writer, path, version, conversation, llm_request, session, send_body, targets, keep_alive, extra
+            )
+
+        status = 200
+        metrics.lap("queue")
+        started = time.monotonic()
+        try:
+            with metrics.span("llm"):
+                response_text = await self.llm.complete(llm_request, session)
+        except Exception as exc:
+            LOGGER.error("LLM invocation failed: %s", exc)
+            status = studio._error_status(exc)
+            response_text = f"LLM error: {exc}"
+        metrics.lap("llm")
+        with metrics.span("parse"):
+            reply = parse_reply(response_text)
+        metrics.lap("parse")
+        if reply.status is not None:
+            status = reply.status
+        with metrics.span("record"):
+            await self._offload(
+                studio._record_exchange,
+                conversation, path, llm_request, response_text, reply, status, reply.body, studio._timings(started),
+            )
+            await self._offload(studio._publish, targets, status, reply.headers, reply.body)
+        extra.append(("Content-Length", str(len(reply.body))))
+        with metrics.span("write"):
+            writer.write(self._head(status, reply.headers, keep_alive, extra))
+            if send_body:
+                writer.write(reply.body)
+            await writer.drain()
+        metrics.note(size=len(reply.body))
+        metrics.lap("write")
+        LOGGER.info("Responding with status %s", status)
+        return keep_alive
+
+    async def _relay_stream(
+        self, writer, path, version, conversation, llm_request, session, send_body, targets, keep_alive, extra
+    ):
+        """Relay the body with chunked encoding while the LLM generates it."""
+        studio = self.studio
+        chunked = send_body and version == "HTTP/1.1"
+        if send_body and not chunked:
+            # HTTP/1.0 clients see the end of the body as the connection closing
+            keep_alive = False
+        if chunked:
+            extra.append(("Transfer-Encoding", "chunked"))
+        parser = ReplyParser()
+        status = 200
+        chunks = []
+        body_parts = []
+        head_sent = False
+        started = time.monotonic()
+        first_chunk = None
+
+        async def write_body(data):
+            if chunked:
+                data = f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n"
+            writer.write(data)
+            await writer.drain()
+
+        metrics.lap("queue")
+        try:
+            async for chunk in self.llm.stream(llm_request, session):
+                metrics.lap("llm")
+                if first_chunk is None:
+                    first_chunk = time.monotonic()
+                chunks.append(chunk)
+                ready = parser.feed(chunk)
+                body_parts.append(ready)
+                metrics.lap("parse")
+                if not head_sent and parser.head_complete:
+                    writer.write(self._head(parser.status or 200, parser.headers, keep_alive, extra))
+                    head_sent = True
+                if head_sent and ready and send_body:
+                    await write_body(ready)
+                metrics.lap("write")
+        except Exception as exc:
+            if head_sent:
+                LOGGER.error("LLM stream failed after headers were sent: %s", exc)
+                body = b"".join(body_parts) + parser.close()
+                timings = studio._timings(started, first_chunk)
+                await self._offload(
+                    studio._record_exchange, conversation, path, llm_request, "".join(chunks), parser, 502, body, timings
+                )
+                return False
+            LOGGER.error("LLM invocation failed: %s", exc)
+            status = studio._error_status(exc)
+            chunks = [f"LLM error: {exc}"]
+            parser = ReplyParser()
+            body_parts = [parser.feed(chunks[0])]
+        metrics.lap("llm")
+        studio._stream_spans(started, first_chunk)
+        rest = parser.close()
+        body_parts.append(rest)
+        if parser.status is not None:
+            status = parser.status
+        body = b"".join(body_parts)
+        metrics.lap("parse")
+        timings = studio._timings(started, first_chunk)
+        with metrics.span("record"):
+            await self._offload(
+                studio._record_exchange, conversation, path, llm_request, "".join(chunks), parser, status, body, timings
+            )
+            await self._offload(studio._publish, targets, status, parser.headers, body)
+        write_started = time.monotonic()
+        if not head_sent:
+            writer.write(self._head(status, parser.headers, keep_alive, extra))
+        if send_body:
+            if rest:
+                await write_body(rest)
+            if chunked:
+                writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        metrics.add_span("write", write_started, time.monotonic())
+        metrics.note(size=len(body))
+        metrics.lap("write")
+        return keep_alive
+
+
+class AsyncProxyServerThread(threading.Thread):
+    """Run an :class:`AsyncProxyServer` on its own event loop thread."""
+
+    def __init__(self, studio, host="localhost", port=8000, reuse_port=False):
+        super().__init__(daemon=True)
+        self.loop = asyncio.new_event_loop()
+        self.proxy = AsyncProxyServer(studio, host, port, reuse_port)
+        # Bind in the caller so address errors surface like ThreadingHTTPServer's
+        self.loop.run_until_complete(self.proxy.start())
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        LOGGER.info("Async proxy server started on http://%s:%s", *self.proxy.server_address)
+        try:
+            self.loop.run_forever()
+        finally:
+            pending = asyncio.all_tasks(self.loop)
+            for task in pending:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self.loop.close()
+
+    def stop(self):
+        LOGGER.info("Stopping async proxy server")
+        asyncio.run_coroutine_threadsafe(self.proxy.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
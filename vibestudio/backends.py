@@ -0,0 +1,338 @@
+"""Pluggable LLM backends shared by the proxy engines.
+
+A backend is created once and shared by every request thread.  The OpenAI
+backends hold a single client whose HTTP connection pool is reused across
+calls instead of configuring the ``openai`` module on every request.  The
+scripted backend answers deterministically with configurable latency so
+the proxy can be load-tested offline.
+"""
+
+import asyncio
+import json
+import logging
+import re
+import threading
+import time
+from collections import namedtuple
+
+from .chain import canonical_messages
+from .tokens import estimate_text_tokens, estimate_tokens
+
+LOGGER = logging.getLogger(__name__)
+
+# ``usage`` is a dict with ``input_tokens`` and ``output_tokens`` when known
+Completion = namedtuple("Completion", "text response_id usage")
+
+BACKENDS = ("openai", "compatible", "mock")
+
+_TOKEN_CHUNK_RE = re.compile(r"\S+\s*|\s+")
+
+
+class LLMBackend:
+    """Interface implemented by every backend."""
+
+    name = "base"
+    # Whether ``stream`` yields incremental chunks rather than one reply
+    streaming = False
+    # Whether ``acomplete``/``astream`` avoid blocking a thread
+    native_async = False
+
+    def complete(self, messages, model, chain=None):
+        """Return a :class:`Completion` for ``messages``.
+
+        ``chain`` is the :class:`~vibestudio.chain.ResponseChain` of the
+        conversation for backends that support server-side chaining.
+        """
+        raise NotImplementedError
+
+    def stream(self, messages, model):
+        """Yield the reply text in chunks."""
+        yield self.complete(messages, model).text
+
+    async def acomplete(self, messages, model, chain=None):
+        return await asyncio.to_thread(self.complete, messages, model, chain)
+
+    async def astream(self, messages, model):
+        completion = await self.acomplete(messages, model)
+        yield completion.text
+
+
+def _chain_errors(module):
+    """Return the errors the provider raises for an expired or unknown ``previous_response_id``."""
+    names = ("BadRequestError", "NotFoundError")
+    return tuple(error for error in (getattr(module, name, None) for name in names) if isinstance(error, type))
+
+
+def _usage(response):
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None
+    input_tokens = getattr(usage, "input_tokens", None) or getattr(usage, "prompt_tokens", None)
+    output_tokens = getattr(usage, "output_tokens", None) or getattr(usage, "completion_tokens", None)
+    if input_tokens is None and output_tokens is None:
+        return None
+    return {"input_tokens": input_tokens or 0, "output_tokens": output_tokens or 0}
+
+
+class OpenAIBackend(LLMBackend):
+    """OpenAI backend holding one long-lived, connection-pooled client.
+
+    With ``openai>=1.0`` a single ``openai.OpenAI`` client is shared by all
+    threads.  Older module-level APIs are configured once and used directly.
+    """
+
+    name = "openai"
+
+    def __init__(self, module, api_key, base_url=None):
+        if module is None:
+            raise RuntimeError("openai package is required for LLM calls")
+        if not api_key:
+            raise RuntimeError("OPENAI_API_KEY environment variable not set")
+        self._module = module
+        self._api_key = api_key
+        self._base_url = base_url
+        if hasattr(module, "OpenAI"):
+            self.client = module.OpenAI(api_key=api_key, base_url=base_url)
+        else:
+            module.api_key = api_key
+            self.client = module
+        self.streaming = hasattr(self.client, "chat") and hasattr(self.client.chat, "completions")
+        self.native_async = hasattr(module, "AsyncOpenAI")
+        self._async_client = None
+        # Anything else (rate limits, timeouts, 5xx) is not worth a full resend
+        self._chain_errors = _chain_errors(module)
+
+    def _use_responses(self):
+        return hasattr(self.client, "responses")
+
+    def complete(self, messages, model, chain=None):
+        client = self.client
+        if self._use_responses() and chain is not None:
+            previous_id, payload = chain.prepare(messages)
+            try:
+                response = client.responses.create(
+                    model=model,
+                    input=payload,
+                    previous_response_id=previous_id,
+                )
+            except self._chain_errors:
+                if previous_id is None:
+                    raise
+                payload = self._restart_chain(chain, messages, previous_id)
+                response = client.responses.create(
+                    model=model,
+                    input=payload,
+                    previous_response_id=None,
+                )
+            return self._commit(chain, messages, response)
+        if hasattr(client, "chat") and hasattr(client.chat, "completions"):
+            response = client.chat.completions.create(
+                model=model,
+                messages=canonical_messages(messages),
+            )
+            text = response.choices[0].message.content.strip()
+        else:
+            response = client.ChatCompletion.create(
+                model=model,
+                messages=canonical_messages(messages),
+            )
+            text = response.choices[0].message["content"].strip()
+        return Completion(text, getattr(response, "id", None), _usage(response))
+
+    @staticmethod
+    def _restart_chain(chain, messages, previous_id):
+        # The chain expired or was lost, resend the whole history
+        LOGGER.warning("Response chain %s rejected, resending history", previous_id)
+        chain.reset()
+        return chain.prepare(messages)[1]
+
+    @staticmethod
+    def _commit(chain, messages, response):
+        # The Responses API joins the text of every output message for us
+        text = response.output_text.strip()
+        response_id = getattr(response, "id", None)
+        chain.commit(messages, text, response_id)
+        return Completion(text, response_id, _usage(response))
+
+    def stream(self, messages, model):
+        stream = self.client.chat.completions.create(  # pragma: no cover - network dependent
+            model=model,
+            messages=canonical_messages(messages),
+            stream=True,
+        )
+        for chunk in stream:  # pragma: no cover - network dependent
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def _async(self):
+        if self._async_client is None:
+            self._async_client = self._module.AsyncOpenAI(api_key=self._api_key, base_url=self._base_url)
+        return self._async_client
+
+    async def acomplete(self, messages, model, chain=None):
+        if not self.native_async:
+            return await super().acomplete(messages, model, chain)
+        client = self._async()
+        if self._use_responses() and chain is not None:
+            previous_id, payload = chain.prepare(messages)
+            try:
+                response = await client.responses.create(
+                    model=model,
+                    input=payload,
+                    previous_response_id=previous_id,
+                )
+            except self._chain_errors:
+                if previous_id is None:
+                    raise
+                payload = self._restart_chain(chain, messages, previous_id)
+                response = await client.responses.create(
+                    model=model,
+                    input=payload,
+                    previous_response_id=None,
+                )
+            return self._commit(chain, messages, response)
+        response = await client.chat.completions.create(  # pragma: no cover - network dependent
+            model=model,
+            messages=canonical_messages(messages),
+        )
+        text = response.choices[0].message.content.strip()  # pragma: no cover
+        return Completion(text, getattr(response, "id", None), _usage(response))  # pragma: no cover
+
+    async def astream(self, messages, model):
+        if not self.native_async:
+            async for chunk in super().astream(messages, model):
+                yield chunk
+            return
+        stream = await self._async().chat.completions.create(  # pragma: no cover - network dependent
+            model=model,
+            messages=canonical_messages(messages),
+            stream=True,
+        )
+        async for chunk in stream:  # pragma: no cover - network dependent
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class OpenAICompatibleBackend(OpenAIBackend):
+    """Any server speaking the OpenAI chat completions API, e.g. a local model.
+
+    Such servers rarely implement the ``responses`` API, so the full history
+    is always sent with ``chat.completions``.
+    """
+
+    name = "compatible"
+
+    def __init__(self, module, base_url, api_key=None):
+        if not base_url:
+            raise RuntimeError("OPENAI_BASE_URL must be set for an OpenAI-compatible backend")
+        # Local servers usually ignore the key, but the client requires one
+        super().__init__(module, api_key or "not-needed", base_url)
+
+    def _use_responses(self):
+        return False
+
+
+def _default_reply(messages):
+    """Echo the request line as a small HTML page."""
+    request_line = messages[-1]["content"].split("\n", 1)[0] if messages else ""
+    body = f"<html><body><h1>{request_line}</h1><p>{len(messages)} messages</p></body></html>"
+    return f"HTTP/1.1 200 OK\nContent-Type: text/html\n\n{body}"
+
+
+class ScriptedBackend(LLMBackend):
+    """Deterministic stand-in for a model.
+
+    Replies come from ``script`` in order (cycling when exhausted) or, with
+    no script, echo the request line as HTML.  ``latency`` is the delay
+    before the first token and ``tokens_per_second`` paces the rest of the
+    reply, so timing behaves like a real model without any network calls.
+    """
+
+    name = "mock"
+    streaming = True
+    native_async = True
+
+    def __init__(self, script=None, latency=0.0, tokens_per_second=0.0):
+        self.script = list(script or [])
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self._lock = threading.Lock()
+        self._index = 0
+        self.calls = 0
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """Load replies from a JSON list or a JSONL file of strings."""
+        with open(path, "r", encoding="utf-8") as fh:
+            text = fh.read()
+        try:
+            script = json.loads(text)
+        except ValueError:
+            script = [json.loads(line) for line in text.splitlines() if line.strip()]
+        return cls(script, **kwargs)
+
+    def _next_reply(self, messages):
+        with self._lock:
+            self.calls += 1
+            if not self.script:
+                return _default_reply(messages)
+            reply = self.script[self._index % len(self.script)]
+            self._index += 1
+            return reply
+
+    @staticmethod
+    def _chunks(text):
+        # Words with their trailing whitespace stand in for tokens
+        return _TOKEN_CHUNK_RE.findall(text)
+
+    def _generation_time(self, text):
+        if not self.tokens_per_second:
+            return 0.0
+        return estimate_text_tokens(text) / self.tokens_per_second
+
+    def _completion(self, messages, text):
+        usage = {"input_tokens": estimate_tokens(messages), "output_tokens": estimate_text_tokens(text)}
+        return Completion(text, f"mock-{self.calls}", usage)
+
+    def complete(self, messages, model, chain=None):
+        text = self._next_reply(messages)
+        time.sleep(self.latency + self._generation_time(text))
+        return self._completion(messages, text)
+
+    def stream(self, messages, model):
+        text = self._next_reply(messages)
+        time.sleep(self.latency)
+        delay = 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+        for chunk in self._chunks(text):
+            if delay:
+                time.sleep(delay)
+            yield chunk
+
+    async def acomplete(self, messages, model, chain=None):
+        text = self._next_reply(messages)
+        await asyncio.sleep(self.latency + self._generation_time(text))
+        return self._completion(messages, text)
+
+    async def astream(self, messages, model):
+        text = self._next_reply(messages)
+        await asyncio.sleep(self.latency)
+        delay = 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+        for chunk in self._chunks(text):
+            if delay:
+                await asyncio.sleep(delay)
+            yield chunk
+
+
+def create_backend(kind, module=None, api_key=None, base_url=None, script_path=None,
+                   latency=0.0, tokens_per_second=0.0):
+    """Create the backend named ``kind`` (one of :data:`BACKENDS`)."""
+    if kind == "openai":
+        return OpenAIBackend(module, api_key, base_url)
+    if kind == "compatible":
+        return OpenAICompatibleBackend(module, base_url, api_key)
+    if kind == "mock":
+        options = {"latency": latency, "tokens_per_second": tokens_per_second}
+        if script_path:
+            return ScriptedBackend.from_file(script_path, **options)
+        return ScriptedBackend(**options)
+    raise ValueError(f"unknown LLM backend {kind!r}")
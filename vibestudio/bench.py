@@ -0,0 +1,460 @@
+"""Benchmarks for the proxy path.
+
+``python -m vibestudio.bench proxy`` starts the proxy in a child process with
+the scripted ``mock`` backend, replays a request corpus against it at a given
+concurrency and arrival rate, and reports latency percentiles, time to first
+byte, throughput, errors and the CPU time the proxy process itself spent.
+
+``python -m vibestudio.bench parser`` times the reply parser on large
+generated pages, whole and fed in chunks, against the original line-popping
+parser.
+
+Results can be saved as JSON and compared with an earlier run.
+"""
+
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+import timeit
+from http.client import HTTPConnection
+from urllib.parse import urlparse
+
+from .replyparser import ReplyParser, parse_reply
+
+DEFAULT_PORT = 8090
+
+
+def percentile(values, pct):
+    """Return the ``pct`` percentile of ``values`` using the nearest rank."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = min(len(ordered), max(1, math.ceil(pct / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def summarize(values):
+    """Return p50/p95/p99/max of ``values`` in milliseconds."""
+    summary = {}
+    for name, pct in (("p50", 50), ("p95", 95), ("p99", 99), ("max", 100)):
+        value = percentile(values, pct)
+        summary[name] = None if value is None else round(value * 1000, 3)
+    return summary
+
+
+def load_corpus(path):
+    """Load requests from a JSON list or JSONL file.
+
+    Each item is either a request ``{"method", "path", "headers", "body"}``
+    or a traffic log entry as returned by ``/api/logs`` or
+    ``/api/transcript``, whose ``http`` entries are replayed as ``GET``.
+    Other items are skipped.
+    """
+    with open(path, "r", encoding="utf-8") as fh:
+        text = fh.read()
+    try:
+        items = json.loads(text)
+    except ValueError:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(items, dict):
+        items = items.get("entries", [])
+    corpus = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        if "path" in item:
+            corpus.append(
+                {
+                    "method": item.get("method", "GET"),
+                    "path": item["path"],
+                    "headers": item.get("headers", {}),
+                    "body": item.get("body", ""),
+                }
+            )
+        elif item.get("type") == "http" and item.get("request"):
+            corpus.append({"method": "GET", "path": item["request"], "headers": {}, "body": ""})
+    return corpus
+
+
+def synthetic_corpus(count):
+    return [{"method": "GET", "path": f"/bench/{i}", "headers": {}, "body": ""} for i in range(count)]
+
+
+def _send(host, port, request, timeout):
+    """Send one request and return ``(status, ttfb, total)`` in seconds."""
+    start = time.perf_counter()
+    conn = HTTPConnection(host, port, timeout=timeout)
+    try:
+        body = request["body"].encode("utf-8") if request["body"] else None
+        conn.request(request["method"], request["path"], body=body, headers=request["headers"])
+        resp = conn.getresponse()
+        first = resp.read(1)
+        ttfb = time.perf_counter() - start
+        if first:
+            resp.read()
+        return resp.status, ttfb, time.perf_counter() - start
+    finally:
+        conn.close()
+
+
+def run_load(host, port, corpus, total, concurrency=1, rate=0.0, timeout=60.0):
+    """Replay ``total`` requests from ``corpus`` and collect timings.
+
+    With ``rate`` the requests follow an open-loop schedule of ``rate``
+    arrivals per second and latency is measured from the scheduled start,
+    so a stalled proxy is charged for the queueing it causes.  Without it
+    each of the ``concurrency`` workers sends its next request as soon as
+    the previous one finished.
+    """
+    lock = threading.Lock()
+    next_index = [0]
+    results = []
+    started = time.perf_counter()
+
+    def worker():
+        while True:
+            with lock:
+                index = next_index[0]
+                if index >= total:
+                    return
+                next_index[0] += 1
+            scheduled = started + index / rate if rate else time.perf_counter()
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            wait = max(0.0, time.perf_counter() - scheduled)
+            try:
+                status, ttfb, latency = _send(host, port, corpus[index % len(corpus)], timeout)
+                error = None if status < 500 else f"HTTP {status}"
+            except (OSError, ValueError) as exc:
+                status, ttfb, latency, error = None, None, None, type(exc).__name__
+            with lock:
+                results.append(
+                    {
+                        "status": status,
+                        "error": error,
+                        "ttfb": None if ttfb is None else ttfb + wait,
+                        "latency": None if latency is None else latency + wait,
+                    }
+                )
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+    ok = [r for r in results if r["error"] is None]
+    errors = {}
+    for r in results:
+        if r["error"] is not None:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    return {
+        "requests": len(results),
+        "ok": len(ok),
+        "errors": errors,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(ok) / duration, 2) if duration else None,
+        "latency_ms": summarize([r["latency"] for r in ok]),
+        "ttfb_ms": summarize([r["ttfb"] for r in ok]),
+    }
+
+
+class ProxyProcess:
+    """The proxy served by ``python -m vibestudio.bench serve`` in a child process."""
+
+    def __init__(self, port=DEFAULT_PORT, engine="threading", latency=0.0, tokens_per_second=0.0,
+                 streaming=False, script=None):
+        env = dict(os.environ)
+        env.update(
+            {
+                "VIBESTUDIO_BACKEND": "mock",
+                "VIBESTUDIO_MOCK_LATENCY": str(latency),
+                "VIBESTUDIO_MOCK_TOKENS_PER_SEC": str(tokens_per_second),
+                "VIBESTUDIO_STREAMING": "1" if streaming else "0",
+            }
+        )
+        if script:
+            env["VIBESTUDIO_MOCK_SCRIPT"] = script
+        self.port = port
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "vibestudio.bench", "serve", "--port", str(port), "--engine", engine],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            env=env,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+        line = self.process.stdout.readline()
+        if line.strip() != "ready":
+            self.process.kill()
+            raise RuntimeError(f"proxy failed to start: {line.strip() or 'no output'}")
+
+    def cpu_seconds(self):
+        """Return the user and system CPU seconds used by the proxy so far."""
+        self.process.stdin.write("cpu\n")
+        self.process.stdin.flush()
+        return float(self.process.stdout.readline())
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def serve(port, engine):
+    """Run only the proxy and answer ``cpu`` queries on stdin until EOF."""
+    import logging
+
+    from . import studio
+
+    logging.getLogger().setLevel(logging.WARNING)
+    # Per-request access lines on stderr would dominate the measured CPU time
+    studio.ProxyHandler.log_message = lambda self, *args: None
+    if engine == "asyncio":
+        from .aioproxy import AsyncProxyServerThread
+
+        thread = AsyncProxyServerThread(studio, port=port)
+    else:
+        thread = studio._ProxyServerThread(port=port)
+    thread.start()
+    print("ready", flush=True)
+    for line in sys.stdin:
+        if line.strip() == "cpu":
+            times = os.times()
+            print(times.user + times.system, flush=True)
+    thread.stop()
+    thread.join()
+
+
+def bench_proxy(args):
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.requests)
+    if not corpus:
+        raise SystemExit(f"no requests found in {args.corpus}")
+    config = {
+        "engine": args.engine,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "rate": args.rate,
+        "latency": args.latency,
+        "tokens_per_second": args.tokens_per_sec,
+        "streaming": args.streaming,
+        "corpus": args.corpus,
+        "url": args.url,
+    }
+    if args.url:
+        target = urlparse(args.url)
+        results = run_load(target.hostname, target.port or 80, corpus, args.requests,
+                           args.concurrency, args.rate, args.timeout)
+        results["proxy_cpu_s"] = None
+    else:
+        proxy = ProxyProcess(args.port, args.engine, args.latency, args.tokens_per_sec,
+                             args.streaming, args.script)
+        try:
+            # Warm up imports and the backend before measuring
+            run_load("localhost", args.port, corpus, min(len(corpus), args.concurrency), args.concurrency)
+            cpu_before = proxy.cpu_seconds()
+            results = run_load("localhost", args.port, corpus, args.requests,
+                               args.concurrency, args.rate, args.timeout)
+            results["proxy_cpu_s"] = round(proxy.cpu_seconds() - cpu_before, 4)
+        finally:
+            proxy.close()
+    if results["proxy_cpu_s"] is not None and results["requests"]:
+        results["proxy_cpu_ms_per_request"] = round(results["proxy_cpu_s"] * 1000 / results["requests"], 3)
+    return {"benchmark": "proxy", "config": config, "results": results}
+
+
+def legacy_parse(text):
+    """The original ``splitlines``/``pop(0)`` parser, kept as a reference."""
+    status = 200
+    lines = text.splitlines()
+    while lines and not lines[0].strip():
+        lines.pop(0)
+    meta = []
+    suffix_meta = []
+    while lines and lines[0].lstrip().startswith("{{{") and lines[0].rstrip().endswith("}}}"):
+        meta.append(lines.pop(0).strip()[3:-3].strip())
+    while lines and not lines[0].strip():
+        lines.pop(0)
+    headers = {}
+    if lines and lines[0].lstrip().startswith("HTTP/"):
+        parts = lines.pop(0).strip().split()
+        if len(parts) >= 2 and parts[1].isdigit():
+            status = int(parts[1])
+        while lines:
+            line = lines.pop(0)
+            if not line.strip():
+                break
+            if ":" in line:
+                k, v = line.split(":", 1)
+                headers[k.strip()] = v.strip()
+    while lines and lines[-1].lstrip().startswith("{{{") and lines[-1].rstrip().endswith("}}}"):
+        suffix_meta.insert(0, lines.pop().strip()[3:-3].strip())
+        while lines and not lines[-1].strip():
+            lines.pop()
+    return status, headers, "\n".join(lines).encode("utf-8"), meta, suffix_meta
+
+
+def sample_reply(kind, size):
+    """Return a generated reply of about ``size`` bytes.
+
+    ``css`` is a page with a long inline stylesheet, ``table`` a data table
+    with one row per line and ``minified`` a single-line script.
+    """
+    head = "{{{ generated page }}}\nHTTP/1.1 200 OK\nContent-Type: text/html\nCache-Control: no-cache\n\n"
+    tail = "\n{{{ page done }}}\n"
+    parts = ["<html><head><style>\n"] if kind == "css" else ["<html><body>\n"]
+    length = 0
+    i = 0
+    while length < size:
+        if kind == "css":
+            part = f".c{i} {{ margin: {i % 9}px; color: #{i % 4096:03x}; }}\n"
+        elif kind == "table":
+            part = f"<tr><td>{i}</td><td>row {i}</td><td>{i * 3.25:.2f}</td></tr>\n"
+        else:
+            part = f"var v{i}=function(a){{return a*{i}}};"
+        parts.append(part)
+        length += len(part)
+        i += 1
+    parts.append("\n</style></head></html>" if kind == "css" else "\n</body></html>")
+    return head + "".join(parts) + tail
+
+
+def _stream_parse(data, chunk_size):
+    parser = ReplyParser()
+    body = [parser.feed(data[i:i + chunk_size]) for i in range(0, len(data), chunk_size)]
+    body.append(parser.close())
+    return body
+
+
+def bench_parser(args):
+    kinds = args.kinds.split(",")
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = {}
+    for kind in kinds:
+        for size in sizes:
+            text = sample_reply(kind, size)
+            data = text.encode("utf-8")
+            cases = {
+                "legacy": lambda: legacy_parse(text),
+                "parse_reply": lambda: parse_reply(text),
+                f"feed_{args.chunk}": lambda: _stream_parse(data, args.chunk),
+            }
+            row = {}
+            for name, func in cases.items():
+                best = min(timeit.repeat(func, number=args.number, repeat=args.repeat)) / args.number
+                row[name] = {"us": round(best * 1e6, 1), "mb_per_s": round(len(data) / best / 1e6, 1)}
+            results[f"{kind}_{size}"] = row
+    config = {"kinds": kinds, "sizes": sizes, "chunk": args.chunk, "number": args.number, "repeat": args.repeat}
+    return {"benchmark": "parser", "config": config, "results": results}
+
+
+def _flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict) and key != "errors":
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(baseline, current):
+    """Return ``(metric, baseline, current, change_pct)`` rows for two runs."""
+    before = _flatten(baseline["results"])
+    after = _flatten(current["results"])
+    rows = []
+    for metric, value in after.items():
+        if metric not in before:
+            continue
+        old = before[metric]
+        change = round((value - old) * 100.0 / old, 1) if old else None
+        rows.append((metric, old, value, change))
+    return rows
+
+
+def _print_report(report, out=None):
+    out = out or sys.stdout
+    results = report["results"]
+    if report["benchmark"] == "parser":
+        for case, row in results.items():
+            values = "  ".join(f"{name} {r['us']} us ({r['mb_per_s']} MB/s)" for name, r in row.items())
+            print(f"{case:<16} {values}", file=out)
+        return
+    print(f"requests   {results['requests']}  ok {results['ok']}  errors {results['errors'] or 0}", file=out)
+    print(f"duration   {results['duration_s']} s  throughput {results['throughput_rps']} req/s", file=out)
+    for name in ("latency_ms", "ttfb_ms"):
+        values = "  ".join(f"{k} {v}" for k, v in results[name].items())
+        print(f"{name:<10} {values}", file=out)
+    if results.get("proxy_cpu_s") is not None:
+        print(
+            f"proxy cpu  {results['proxy_cpu_s']} s  ({results['proxy_cpu_ms_per_request']} ms/request)",
+            file=out,
+        )
+
+
+def _print_comparison(rows, out=None):
+    out = out or sys.stdout
+    print(f"{'metric':<28}{'baseline':>12}{'current':>12}{'change %':>10}", file=out)
+    for metric, old, new, change in rows:
+        print(f"{metric:<28}{old:>12}{new:>12}{'' if change is None else change:>10}", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m vibestudio.bench", description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    proxy = commands.add_parser("proxy", help="load-test the proxy against the mock backend")
+    proxy.add_argument("--engine", choices=("threading", "asyncio"), default="threading")
+    proxy.add_argument("--requests", type=int, default=200, help="number of requests to send")
+    proxy.add_argument("--concurrency", type=int, default=8, help="number of client workers")
+    proxy.add_argument("--rate", type=float, default=0.0, help="arrivals per second (default: closed loop)")
+    proxy.add_argument("--latency", type=float, default=0.05, help="mock seconds before the first token")
+    proxy.add_argument("--tokens-per-sec", type=float, default=0.0, help="mock generation speed")
+    proxy.add_argument("--streaming", action="store_true", help="enable VIBESTUDIO_STREAMING in the proxy")
+    proxy.add_argument("--corpus", help="JSON/JSONL requests or a recorded traffic log to replay")
+    proxy.add_argument("--script", help="JSON/JSONL replies for the mock backend")
+    proxy.add_argument("--port", type=int, default=DEFAULT_PORT)
+    proxy.add_argument("--url", help="benchmark an already running proxy instead")
+    proxy.add_argument("--timeout", type=float, default=60.0)
+    proxy.add_argument("--output", help="write the results as JSON")
+    proxy.add_argument("--compare", help="JSON results of an earlier run to compare with")
+
+    parser_cmd = commands.add_parser("parser", help="time the reply parser on large generated pages")
+    parser_cmd.add_argument("--kinds", default="css,table,minified", help="comma-separated page kinds")
+    parser_cmd.add_argument("--sizes", default="65536,1048576", help="comma-separated body sizes in bytes")
+    parser_cmd.add_argument("--chunk", type=int, default=64, help="bytes per feed() call when streaming")
+    parser_cmd.add_argument("--number", type=int, default=5, help="parses per timing")
+    parser_cmd.add_argument("--repeat", type=int, default=3, help="timings to take the best of")
+    parser_cmd.add_argument("--output", help="write the results as JSON")
+    parser_cmd.add_argument("--compare", help="JSON results of an earlier run to compare with")
+
+    serve_cmd = commands.add_parser("serve", help=argparse.SUPPRESS)
+    serve_cmd.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_cmd.add_argument("--engine", default="threading")
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        serve(args.port, args.engine)
+        return 0
+    report = bench_parser(args) if args.command == "parser" else bench_proxy(args)
+    _print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as fh:
+            _print_comparison(compare(json.load(fh), report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+"""Token accounting and budgets for LLM calls.
+
+A :class:`TokenLedger` counts the tokens every call sends and receives,
+using the provider's reported usage when there is one and the offline
+estimate from :mod:`vibestudio.tokens` otherwise.  Before a call it checks
+the estimated prompt against three optional budgets:
+
+* ``context`` – the prompt of a single call;
+* ``session`` – tokens one client spent in the last ``window`` seconds;
+* ``global`` – tokens all clients spent in the last ``window`` seconds.
+
+An exceeded budget is answered with the configured action: ``warn``,
+``compact`` or ``reject``.  What the action means is up to the caller.
+"""
+
+import collections
+import math
+import threading
+import time
+
+ACTIONS = ("warn", "compact", "reject")
+
+# Clients whose totals are remembered; the least recently seen is forgotten
+MAX_CLIENTS = 1000
+
+# Returned by :meth:`TokenLedger.check` for a call over budget.  ``reason``
+# is the budget exceeded; ``retry_after`` is when enough spend has aged out
+# of the window, ``None`` when waiting would not help
+Decision = collections.namedtuple("Decision", "action reason retry_after")
+
+
+class _Spend:
+    """Tokens spent by one client, in total and within the window."""
+
+    __slots__ = ("calls", "input_tokens", "output_tokens", "recent", "recent_tokens")
+
+    def __init__(self):
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.recent = collections.deque()
+        self.recent_tokens = 0
+
+    def add(self, now, window, input_tokens, output_tokens):
+        self.calls += 1
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        self.recent_tokens += input_tokens + output_tokens
+        if window:
+            self.recent.append((now, input_tokens + output_tokens))
+            self.expire(now, window)
+
+    def expire(self, now, window):
+        """Return the tokens spent in the last ``window`` seconds; 0 means ever."""
+        if window:
+            while self.recent and self.recent[0][0] <= now - window:
+                self.recent_tokens -= self.recent.popleft()[1]
+        return self.recent_tokens
+
+    def retry_after(self, now, window, excess):
+        """Seconds until at least ``excess`` tokens have left the window."""
+        if not window:
+            return None
+        freed = 0
+        for spent_at, tokens in self.recent:
+            freed += tokens
+            if freed >= excess:
+                return max(1, math.ceil(spent_at + window - now))
+        return None
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "recent_tokens": self.recent_tokens,
+        }
+
+
+class TokenLedger:
+    """Count tokens per client and overall and enforce the token budgets.
+
+    Budgets of ``0`` are off.  Spend budgets cover the last ``window``
+    seconds, or everything since start when ``window`` is ``0``.
+    """
+
+    def __init__(self, context_budget=0, session_budget=0, global_budget=0, window=3600.0, action="warn",
+                 max_clients=MAX_CLIENTS, clock=time.monotonic):
+        if action not in ACTIONS:
+            raise ValueError(f"unknown token budget action {action!r}")
+        self.context_budget = context_budget
+        self.session_budget = session_budget
+        self.global_budget = global_budget
+        self.window = window
+        self.action = action
+        self.max_clients = max_clients
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._total = _Spend()
+        self._clients = collections.OrderedDict()
+        self.reported = 0
+        self.estimated = 0
+        self.reported_input = 0
+        self.estimated_input = 0
+        self.largest_prompt = 0
+        self.over_budget = collections.Counter()
+        self.actions = collections.Counter()
+
+    @property
+    def enforcing(self):
+        """Whether any budget is set."""
+        return bool(self.context_budget or self.session_budget or self.global_budget)
+
+    def check(self, client, prompt_tokens, count=True):
+        """Return a :class:`Decision` when a call of ``prompt_tokens`` exceeds a budget, else ``None``.
+
+        ``client`` is ``None`` for calls only the global budget applies to.
+        ``count=False`` leaves the over-budget counters alone, for calls that
+        are merely skipped, such as speculative ones.
+        """
+        with self._lock:
+            now = self._clock()
+            reason, retry_after = None, None
+            if self.context_budget and prompt_tokens > self.context_budget:
+                reason = "context"
+            else:
+                # A client that has spent nothing yet is still held to its budget
+                session = (self._clients.get(client) or _Spend()) if client is not None else None
+                for name, limit, spend in (
+                    ("session", self.session_budget, session),
+                    ("global", self.global_budget, self._total),
+                ):
+                    if not limit or spend is None:
+                        continue
+                    excess = spend.expire(now, self.window) + prompt_tokens - limit
+                    if excess > 0:
+                        reason = name
+                        retry_after = spend.retry_after(now, self.window, excess)
+                        break
+            if reason is None:
+                return None
+            if count:
+                self.over_budget[reason] += 1
+                self.actions[self.action] += 1
+        return Decision(self.action, reason, retry_after)
+
+    def record(self, client, input_tokens, output_tokens, reported=False, estimated_input=None):
+        """Account a finished call; ``reported`` marks usage the provider reported.
+
+        ``estimated_input`` is the offline estimate of the prompt, used to
+        track how closely estimates match reported usage.  Returns the tokens
+        spent so far overall and by ``client``.
+        """
+        with self._lock:
+            now = self._clock()
+            self._total.add(now, self.window, input_tokens, output_tokens)
+            client_total = None
+            if client is not None:
+                spend = self._clients.pop(client, None) or _Spend()
+                spend.add(now, self.window, input_tokens, output_tokens)
+                self._clients[client] = spend
+                client_total = spend.input_tokens + spend.output_tokens
+                while len(self._clients) > self.max_clients:
+                    self._clients.popitem(last=False)
+            if reported:
+                self.reported += 1
+                if estimated_input:
+                    self.reported_input += input_tokens
+                    self.estimated_input += estimated_input
+            else:
+                self.estimated += 1
+            self.largest_prompt = max(self.largest_prompt, input_tokens)
+            return self._total.input_tokens + self._total.output_tokens, client_total
+
+    def stats(self):
+        with self._lock:
+            now = self._clock()
+            self._total.expire(now, self.window)
+            top = sorted(self._clients.items(), key=lambda item: item[1].recent_tokens, reverse=True)[:10]
+            return {
+                "calls": self._total.calls,
+                "input_tokens": self._total.input_tokens,
+                "output_tokens": self._total.output_tokens,
+                "total_tokens": self._total.input_tokens + self._total.output_tokens,
+                "window_tokens": self._total.recent_tokens,
+                "reported": self.reported,
+                "estimated": self.estimated,
+                # Reported over estimated prompt size; 1.0 means exact estimates
+                "estimate_ratio": self.reported_input / self.estimated_input if self.estimated_input else None,
+                "largest_prompt": self.largest_prompt,
+                "clients": len(self._clients),
+                "warnings": self.actions["warn"],
+                "compactions": self.actions["compact"],
+                "rejections": self.actions["reject"],
+                "over_budget": dict(self.over_budget),
+                "budgets": {
+                    "context": self.context_budget,
+                    "session": self.session_budget,
+                    "global": self.global_budget,
+                    "window": self.window,
+                    "action": self.action,
+                },
+                "top_clients": [dict(spend.to_dict(), client=client) for client, spend in top],
+            }
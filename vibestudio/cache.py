@@ -0,0 +1,115 @@
+"""Response cache for idempotent proxy requests."""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from urllib.parse import parse_qsl, urlsplit
+
+CACHEABLE_METHODS = ("GET", "HEAD")
+
+# Request headers that can change what the model generates for a page
+HEADER_ALLOWLIST = ("accept", "accept-language")
+
+CachedReply = namedtuple("CachedReply", "status headers body")
+
+
+def request_key(prompt, meta_prompt, model, method, path, headers, allowlist=HEADER_ALLOWLIST):
+    """Return a stable hash for a request under the active prompts and model.
+
+    The query string is sorted and only ``allowlist`` headers are included so
+    equivalent requests share one entry.
+    """
+    parts = urlsplit(path)
+    query = sorted(parse_qsl(parts.query, keep_blank_values=True))
+    selected = sorted(
+        (k.lower(), v.strip()) for k, v in headers.items() if k.lower() in allowlist
+    )
+    canonical = json.dumps(
+        [prompt, meta_prompt, model, method.upper(), parts.path or "/", query, selected],
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Thread-safe LRU cache of parsed replies with TTL and a memory cap."""
+
+    def __init__(self, max_entries=256, ttl=300.0, max_bytes=16 * 1024 * 1024, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _size(reply):
+        return len(reply.body) + sum(len(k) + len(v) for k, v in reply.headers)
+
+    def get(self, key):
+        """Return the cached reply for ``key`` or ``None`` on a miss."""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and item[0] <= self._clock():
+                self._remove(key)
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def peek(self, key):
+        """Return the cached reply for ``key`` without counting a hit or miss."""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None or item[0] <= self._clock():
+                return None
+            return item[1]
+
+    def put(self, key, status, headers, body):
+        """Store a reply, evicting least recently used entries as needed."""
+        reply = CachedReply(status, list(headers), body)
+        size = self._size(reply)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self._clock() + self.ttl, reply, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self):
+        """Drop every entry, e.g. after the prompts change."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.invalidations += 1
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,92 @@
+"""Delta uploads for conversations chained with ``previous_response_id``."""
+
+import threading
+
+
+def canonical_messages(messages):
+    """Return ``messages`` with only ``role`` and ``content`` in a fixed order.
+
+    Serialising every message the same way keeps the stable meta and service
+    prefix byte-identical across calls so provider prompt caching can hit.
+    """
+    return [{"role": m["role"], "content": m["content"]} for m in messages]
+
+
+class ResponseChain:
+    """Track which messages the provider already holds for a response chain.
+
+    After each call the provider stores the messages it was given plus its
+    own reply under the returned response id.  :meth:`prepare` sends only the
+    messages appended since then, and falls back to the full history when
+    the local conversation no longer starts with what the provider holds,
+    e.g. after compaction or a failed call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.response_id = None
+        self._held = []
+        self.delta_calls = 0
+        self.full_calls = 0
+        self.messages_skipped = 0
+
+    def prepare(self, messages):
+        """Return ``(previous_response_id, messages_to_send)`` for a call."""
+        with self._lock:
+            held = self._held
+            if (
+                self.response_id is not None
+                and len(messages) > len(held)
+                and all(a == b for a, b in zip(messages, held))
+            ):
+                self.delta_calls += 1
+                self.messages_skipped += len(held)
+                return self.response_id, canonical_messages(messages[len(held):])
+            self.full_calls += 1
+            return None, canonical_messages(messages)
+
+    def commit(self, messages, reply, response_id):
+        """Record that the provider now holds ``messages`` and ``reply``."""
+        with self._lock:
+            self.response_id = response_id
+            self._held = list(messages) + [{"role": "assistant", "content": reply}]
+
+    def fork(self):
+        """Return a copy that can be extended without moving this chain.
+
+        Used for speculative calls, which build on the current response but
+        must not become the conversation's history unless they are used.
+        """
+        other = ResponseChain()
+        with self._lock:
+            other.response_id = self.response_id
+            other._held = list(self._held)
+        return other
+
+    def adopt(self, fork):
+        """Continue from ``fork``, a copy whose call became the conversation's reply."""
+        with fork._lock:
+            response_id, held = fork.response_id, list(fork._held)
+            counts = fork.delta_calls, fork.full_calls, fork.messages_skipped
+        with self._lock:
+            self.response_id = response_id
+            self._held = held
+            self.delta_calls += counts[0]
+            self.full_calls += counts[1]
+            self.messages_skipped += counts[2]
+
+    def reset(self):
+        """Forget the chain so the next call resends the full history."""
+        with self._lock:
+            self.response_id = None
+            self._held = []
+
+    def stats(self):
+        with self._lock:
+            return {
+                "response_id": self.response_id,
+                "held_messages": len(self._held),
+                "delta_calls": self.delta_calls,
+                "full_calls": self.full_calls,
+                "messages_skipped": self.messages_skipped,
+            }
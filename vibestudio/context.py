@@ -0,0 +1,149 @@
+"""Bounded conversation windows with compaction of older exchanges."""
+
+from .tokens import estimate_tokens
+
+# The meta prompt and service prompt always open the conversation
+PINNED_MESSAGES = 2
+
+POLICIES = ("drop", "keep_posts", "summarize")
+
+SUMMARY_PREFIX = "{{{Summary of earlier traffic:"
+
+STATE_CHANGING_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+# Keep summaries themselves bounded
+MAX_SUMMARY_LINES = 50
+
+
+def _is_summary(message):
+    return message["content"].startswith(SUMMARY_PREFIX)
+
+
+def _group_exchanges(messages):
+    """Split messages into exchanges, each a user message plus its replies."""
+    exchanges = []
+    for message in messages:
+        if message["role"] == "user" or not exchanges:
+            exchanges.append([message])
+        else:
+            exchanges[-1].append(message)
+    return exchanges
+
+
+def _request_method(exchange):
+    first = exchange[0]["content"].split(" ", 1)[0]
+    return first if first.isupper() else None
+
+
+def _is_state_changing(exchange):
+    content = exchange[0]["content"]
+    # Meta chat instructions change behaviour just like a POST does
+    return content.startswith("{{{") or _request_method(exchange) in STATE_CHANGING_METHODS
+
+
+def _digest(exchange):
+    """Return a one-line description of an exchange for the summary."""
+    request = exchange[0]["content"]
+    if request.startswith("{{{"):
+        return "meta: " + request.strip("{} \n")[:200]
+    line = request.split("\n", 1)[0].rsplit(" HTTP/", 1)[0]
+    status = ""
+    for reply in exchange[1:]:
+        for reply_line in reply["content"].split("\n", 20)[:20]:
+            if reply_line.lstrip().startswith("HTTP/"):
+                parts = reply_line.split()
+                status = parts[1] if len(parts) > 1 else ""
+                break
+        if status:
+            break
+    if _request_method(exchange) in STATE_CHANGING_METHODS:
+        body = request.split("\n\n", 1)[1] if "\n\n" in request else ""
+        if body.strip():
+            line += " " + body.strip().replace("\n", " ")[:200]
+    return f"{line} -> {status}" if status else line
+
+
+class ContextWindow:
+    """Keep a conversation within a message or estimated token budget.
+
+    The first :data:`PINNED_MESSAGES` messages are never removed.  When the
+    budget is exceeded the oldest exchanges are dropped, preferring to keep
+    state-changing requests with the ``keep_posts`` policy, or folded into a
+    single summary message with the ``summarize`` policy.
+    """
+
+    def __init__(self, max_messages=0, max_tokens=0, policy="summarize"):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown context policy {policy!r}")
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self.policy = policy
+        self.compactions = 0
+        self.dropped_messages = 0
+
+    def over_budget(self, conversation):
+        if self.max_messages and len(conversation) > self.max_messages:
+            return True
+        return bool(self.max_tokens) and estimate_tokens(conversation) > self.max_tokens
+
+    def _fits(self, message_count, tokens):
+        if self.max_messages and message_count > self.max_messages:
+            return False
+        return not self.max_tokens or tokens <= self.max_tokens
+
+    def compact(self, conversation):
+        """Return a compacted copy of ``conversation`` that fits the budget."""
+        pinned = list(conversation[:PINNED_MESSAGES])
+        rest = list(conversation[PINNED_MESSAGES:])
+        summary_lines = []
+        if rest and _is_summary(rest[0]):
+            summary_lines = rest.pop(0)["content"][len(SUMMARY_PREFIX):-3].strip().split("\n")
+        exchanges = _group_exchanges(rest)
+        if not exchanges:
+            return pinned
+        # Reserve room for the summary message so the result stays in budget
+        reserve = [{"role": "user", "content": SUMMARY_PREFIX + "}}}"}] if self.policy == "summarize" else []
+
+        # Running totals of what is kept, so each exchange is estimated once
+        sizes = [estimate_tokens(ex) for ex in exchanges]
+        kept = {len(exchanges) - 1}
+        kept_messages = len(pinned) + len(reserve) + len(exchanges[-1])
+        kept_tokens = estimate_tokens(pinned + reserve) + sizes[-1]
+        passes = [True, False] if self.policy == "keep_posts" else [None]
+        for state_changing in passes:
+            for i in range(len(exchanges) - 2, -1, -1):
+                if i in kept:
+                    continue
+                if state_changing is not None and _is_state_changing(exchanges[i]) != state_changing:
+                    continue
+                if self._fits(kept_messages + len(exchanges[i]), kept_tokens + sizes[i]):
+                    kept.add(i)
+                    kept_messages += len(exchanges[i])
+                    kept_tokens += sizes[i]
+                elif state_changing is None:
+                    # Keep the window contiguous for the plain policies
+                    break
+
+        dropped = [ex for i, ex in enumerate(exchanges) if i not in kept]
+        if not dropped:
+            return list(conversation)
+        self.compactions += 1
+        self.dropped_messages += sum(len(ex) for ex in dropped)
+        result = pinned
+        if self.policy == "summarize":
+            summary_lines = (summary_lines + [_digest(ex) for ex in dropped])[-MAX_SUMMARY_LINES:]
+            content = SUMMARY_PREFIX + "\n" + "\n".join(line for line in summary_lines if line) + "}}}"
+            result = result + [{"role": "user", "content": content}]
+        for i, ex in enumerate(exchanges):
+            if i in kept:
+                result.extend(ex)
+        return result
+
+    def stats(self):
+        return {
+            "max_messages": self.max_messages,
+            "max_tokens": self.max_tokens,
+            "policy": self.policy,
+            "compactions": self.compactions,
+            "dropped_messages": self.dropped_messages,
+        }
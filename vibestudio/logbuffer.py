@@ -0,0 +1,177 @@
+"""Bounded log storage with cursor-based reads."""
+
+import json
+import queue
+import threading
+import time
+
+# Queued for subscribers when the log is cleared
+CLEARED = object()
+
+
+class Subscription:
+    """Bounded queue of entries appended to a :class:`LogBuffer`.
+
+    A subscriber that falls more than ``maxsize`` entries behind stops
+    receiving entries and is flagged as ``overflowed``; it catches up from
+    the buffer itself with :meth:`resync` so a slow reader never makes the
+    queue grow.
+    """
+
+    def __init__(self, buffer, maxsize):
+        self._buffer = buffer
+        self._queue = queue.Queue(maxsize)
+        self.overflowed = False
+
+    def _offer(self, item):
+        if self.overflowed:
+            return
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout=None):
+        """Return the next entry or :data:`CLEARED`, ``None`` on timeout."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def resync(self, seq):
+        """Discard queued entries and return the buffer page after ``seq``."""
+        with self._buffer._lock:
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self.overflowed = False
+            return self._buffer._since(seq, None)
+
+    def close(self):
+        self._buffer._unsubscribe(self)
+
+
+class LogBuffer:
+    """Fixed-capacity ring buffer of log entries.
+
+    Every appended entry is stamped with a monotonically increasing ``seq``
+    and a ``ts`` timestamp.  Readers poll with :meth:`since` using the last
+    sequence number they have seen, so each poll only returns new entries.
+    Once ``capacity`` entries are held the oldest is overwritten, after
+    being appended to ``spill_path`` as a JSON line when one is given.
+    """
+
+    def __init__(self, capacity=10000, spill_path=None, clock=time.time):
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._items = [None] * capacity
+        self._next_seq = 1
+        self._count = 0
+        self._dropped_through = 0
+        self._cleared_through = 0
+        self._spill = None
+        self._subscribers = []
+
+    @property
+    def first_seq(self):
+        return self._next_seq - self._count
+
+    @property
+    def last_seq(self):
+        return self._next_seq - 1
+
+    def append(self, entry):
+        with self._lock:
+            seq = self._next_seq
+            entry["seq"] = seq
+            entry["ts"] = self._clock()
+            slot = seq % self.capacity
+            if self._count == self.capacity:
+                self._evict(self._items[slot])
+            else:
+                self._count += 1
+            self._items[slot] = entry
+            self._next_seq = seq + 1
+            for subscriber in self._subscribers:
+                subscriber._offer(entry)
+
+    def _evict(self, entry):
+        self._dropped_through = entry["seq"]
+        if self.spill_path:
+            if self._spill is None:
+                self._spill = open(self.spill_path, "a", encoding="utf-8")
+            self._spill.write(json.dumps(entry) + "\n")
+            self._spill.flush()
+
+    def since(self, seq=0, limit=None):
+        """Return entries with a sequence number greater than ``seq``.
+
+        The result holds the ``entries``, the ``next`` cursor to pass back,
+        whether ``more`` entries remain beyond ``limit``, how many entries
+        the reader ``missed`` because they were evicted before it caught
+        up, and the sequence number up to which the log was last
+        ``cleared``.
+        """
+        with self._lock:
+            return self._since(seq, limit)
+
+    def _since(self, seq, limit):
+        start = max(seq + 1, self.first_seq)
+        stop = self._next_seq
+        if limit is not None:
+            stop = min(stop, start + limit)
+        entries = [self._items[s % self.capacity] for s in range(start, stop)]
+        return {
+            "entries": entries,
+            "next": max(seq, stop - 1),
+            "more": stop < self._next_seq,
+            "missed": max(0, self._dropped_through - seq),
+            "cleared": self._cleared_through,
+        }
+
+    def clear(self):
+        """Drop every entry; sequence numbers keep increasing afterwards."""
+        with self._lock:
+            self._items = [None] * self.capacity
+            self._count = 0
+            self._cleared_through = self._next_seq - 1
+            for subscriber in self._subscribers:
+                subscriber._offer(CLEARED)
+
+    def subscribe(self, maxsize=1000):
+        """Return a :class:`Subscription` receiving entries as they are appended."""
+        subscription = Subscription(self, maxsize)
+        with self._lock:
+            self._subscribers.append(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def snapshot(self):
+        """Return the retained entries as a list, oldest first."""
+        with self._lock:
+            return [self._items[s % self.capacity] for s in range(self.first_seq, self._next_seq)]
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def __getitem__(self, index):
+        with self._lock:
+            if index < 0:
+                index += self._count
+            if not 0 <= index < self._count:
+                raise IndexError("log index out of range")
+            return self._items[(self.first_seq + index) % self.capacity]
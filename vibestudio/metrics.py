@@ -0,0 +1,368 @@
+"""Prometheus-style counters, gauges and histograms for the proxy.
+
+Metric values are split over :data:`SHARDS` shards, each with its own lock,
+and a thread always records into the shard it was given, round robin, the
+first time it recorded.  Threads therefore rarely contend for a lock, and
+rendering sums the shards.  The
+request being served is tracked in a context variable, which both proxy
+engines get for free: each handler thread and each asyncio connection task
+has its own context.
+
+Requests can also record named spans (request read, lock wait, model call,
+parse, write...) that are logged per request and exported as Chrome
+trace-event JSON by :func:`chrome_trace`.
+"""
+
+import bisect
+import contextlib
+import contextvars
+import itertools
+import threading
+import time
+
+# Seconds; spans a cached reply (sub-millisecond) to a slow model call
+LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+PHASES = ("queue", "llm", "parse", "write")
+# Lock stripes per metric; a power of two larger than typical core counts
+SHARDS = 16
+
+_REQUEST = contextvars.ContextVar("vibestudio_request", default=None)
+
+# Thread identifiers are aligned addresses, so ``get_ident() % SHARDS`` would
+# put every thread in the same shard; threads are numbered instead
+_THREAD = threading.local()
+_THREAD_NUMBERS = itertools.count()
+
+
+def _shard_index():
+    try:
+        return _THREAD.shard
+    except AttributeError:
+        _THREAD.shard = next(_THREAD_NUMBERS) % SHARDS
+        return _THREAD.shard
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Sharded:
+    """Base for metrics whose values live in lock-striped shards."""
+
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._shards = [(threading.Lock(), {}) for _ in range(SHARDS)]
+
+    def _shard(self):
+        return self._shards[_shard_index()]
+
+    def _merged(self):
+        merged = {}
+        for lock, values in self._shards:
+            with lock:
+                items = [(key, self._copy(value)) for key, value in values.items()]
+            for key, value in items:
+                merged[key] = self._combine(merged.get(key), value)
+        return merged
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Sharded):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        lock, values = self._shard()
+        with lock:
+            values[labels] = values.get(labels, 0) + amount
+
+    @staticmethod
+    def _combine(total, value):
+        return value if total is None else total + value
+
+    def value(self, *labels):
+        return self._merged().get(labels, 0)
+
+    def render(self):
+        lines = self.header()
+        for key, value in sorted(self._merged().items()):
+            lines.append(f"{self.name}{_labels(self.labels, key)} {_number(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    """A counter that may go down, e.g. requests in flight."""
+
+    kind = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Sharded):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        lock, values = self._shard()
+        with lock:
+            counts = values.get(labels)
+            if counts is None:
+                # One slot per bucket plus +Inf, then the sum
+                counts = values[labels] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    @staticmethod
+    def _copy(value):
+        return list(value)
+
+    @staticmethod
+    def _combine(total, value):
+        return value if total is None else [a + b for a, b in zip(total, value)]
+
+    def snapshot(self, *labels):
+        """Return ``(count, sum)`` observed for ``labels``."""
+        counts = self._merged().get(labels)
+        if counts is None:
+            return 0, 0.0
+        return sum(counts[:-1]), counts[-1]
+
+    def render(self):
+        lines = self.header()
+        for key, counts in sorted(self._merged().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = (("le", _number(bound)),)
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(counts[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class CallbackGauge:
+    """Gauge whose samples are read from ``fn()`` at render time.
+
+    ``fn`` returns a number, or a list of ``(label_values, number)`` pairs.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, fn, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.fn = fn
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        samples = self.fn()
+        if not isinstance(samples, list):
+            samples = [((), samples)]
+        for key, value in samples:
+            if value is not None:
+                lines.append(f"{self.name}{_labels(self.labels, key)} {_number(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class RequestTimer:
+    """Splits one request's time into :data:`PHASES` as it is served.
+
+    With ``spans`` it also keeps ``(name, start, end)`` intervals on the
+    monotonic clock for the per-request waterfall.
+    """
+
+    __slots__ = (
+        "method", "path", "started", "_last", "phases", "first_byte", "status", "source", "size", "spans",
+    )
+
+    def __init__(self, method, path=None, spans=False):
+        self.method = method
+        self.path = path
+        self.spans = [] if spans else None
+        self.started = self._last = time.monotonic()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.first_byte = None
+        self.status = None
+        self.source = "llm"
+        self.size = 0
+
+    def lap(self, phase):
+        now = time.monotonic()
+        self.phases[phase] += now - self._last
+        self._last = now
+
+
+class ProxyMetrics:
+    """The proxy's request metrics; wrap each request in :meth:`start` and :meth:`finish`."""
+
+    def __init__(self, registry, prefix="vibestudio"):
+        self.requests = registry.register(Counter(
+            f"{prefix}_requests_total", "Proxy requests served, by where the reply came from.",
+            ("method", "status", "source"),
+        ))
+        self.in_flight = registry.register(Gauge(f"{prefix}_requests_in_flight", "Proxy requests being served."))
+        self.phase = registry.register(Histogram(
+            f"{prefix}_request_phase_seconds", "Time spent per request in each phase.", ("phase",),
+        ))
+        self.duration = registry.register(Histogram(
+            f"{prefix}_request_duration_seconds", "Total time to serve a proxy request.",
+        ))
+        self.ttfb = registry.register(Histogram(
+            f"{prefix}_time_to_first_byte_seconds", "Time until the reply's status line was written.",
+        ))
+        self.reply_bytes = registry.register(Histogram(
+            f"{prefix}_reply_bytes", "Size of reply bodies sent to clients.", buckets=SIZE_BUCKETS,
+        ))
+
+    def start(self, method, path=None, spans=False):
+        timer = RequestTimer(method, path, spans)
+        self.in_flight.inc()
+        return timer, _REQUEST.set(timer)
+
+    def finish(self, timer, token):
+        _REQUEST.reset(token)
+        self.in_flight.dec()
+        end = time.monotonic()
+        status = timer.status if timer.status is not None else "none"
+        self.requests.inc(timer.method, str(status), timer.source)
+        for phase, seconds in timer.phases.items():
+            if seconds:
+                self.phase.observe(seconds, phase)
+        self.duration.observe(end - timer.started)
+        if timer.first_byte is not None:
+            self.ttfb.observe(timer.first_byte - timer.started)
+        self.reply_bytes.observe(timer.size)
+        return end
+
+
+def lap(phase):
+    """Charge the time since the last lap of the current request to ``phase``."""
+    timer = _REQUEST.get()
+    if timer is not None:
+        timer.lap(phase)
+
+
+def note(status=None, source=None, size=None, first_byte=False):
+    """Record facts about the reply of the current request."""
+    timer = _REQUEST.get()
+    if timer is None:
+        return
+    if status is not None:
+        timer.status = status
+    if source is not None:
+        timer.source = source
+    if size is not None:
+        timer.size = size
+    if first_byte and timer.first_byte is None:
+        timer.first_byte = time.monotonic()
+
+
+@contextlib.contextmanager
+def span(name):
+    """Record the ``with`` block as a span of the current request."""
+    timer = _REQUEST.get()
+    if timer is None or timer.spans is None:
+        yield
+        return
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        timer.spans.append((name, start, time.monotonic()))
+
+
+def add_span(name, start, end):
+    """Record a span measured by the caller on the monotonic clock."""
+    timer = _REQUEST.get()
+    if timer is not None and timer.spans is not None:
+        timer.spans.append((name, start, end))
+
+
+def trace_entry(timer, end):
+    """Return the ``trace`` log entry for a finished request."""
+
+    def ms(seconds):
+        return round(seconds * 1000, 3)
+
+    return {
+        "type": "trace",
+        "method": timer.method,
+        "request": timer.path,
+        "status": timer.status,
+        "source": timer.source,
+        "duration_ms": ms(end - timer.started),
+        "phases_ms": {phase: ms(seconds) for phase, seconds in timer.phases.items()},
+        "spans": [
+            {"name": name, "start_ms": ms(start - timer.started), "duration_ms": ms(stop - start)}
+            for name, start, stop in sorted(timer.spans, key=lambda s: s[1])
+        ],
+    }
+
+
+def chrome_trace(entries):
+    """Convert ``trace`` log entries to Chrome trace-event JSON (a dict).
+
+    Each request gets its own row (``tid``) holding one complete event for
+    the whole request with its spans nested below it.  Load the result in
+    ``chrome://tracing`` or Perfetto.
+    """
+    events = []
+    for row, entry in enumerate((e for e in entries if e.get("type") == "trace"), 1):
+        # Log entries are stamped when the request finishes
+        start_us = entry.get("ts", 0) * 1e6 - entry["duration_ms"] * 1000
+        name = f"{entry['method']} {entry['request']}"
+        args = {"status": entry["status"], "source": entry["source"], "seq": entry.get("seq")}
+        events.append({"name": name, "cat": "request", "ph": "X", "ts": round(start_us, 1),
+                       "dur": round(entry["duration_ms"] * 1000, 1), "pid": 1, "tid": row, "args": args})
+        events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": row, "args": {"name": name}})
+        for item in entry["spans"]:
+            events.append({"name": item["name"], "cat": "span", "ph": "X",
+                           "ts": round(start_us + item["start_ms"] * 1000, 1),
+                           "dur": round(item["duration_ms"] * 1000, 1), "pid": 1, "tid": row})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
@@ -0,0 +1,245 @@
+"""Speculative generation of the pages linked from a served HTML page."""
+
+import collections
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urlencode, urljoin, urlsplit
+
+LOGGER = logging.getLogger(__name__)
+
+# Form fields whose value is only sent when the user picks them
+_UNSENT_INPUTS = ("submit", "button", "reset", "file", "image", "checkbox", "radio")
+
+
+class _LinkParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links = []
+        self.forms = []
+        self._form = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "a" and attrs.get("href"):
+            self.links.append(attrs["href"])
+        elif tag == "form":
+            if (attrs.get("method") or "get").lower() == "get":
+                self._form = (attrs.get("action") or "", [])
+                self.forms.append(self._form)
+            else:
+                self._form = None
+        elif tag == "input" and self._form is not None and attrs.get("name"):
+            kind = (attrs.get("type") or "text").lower()
+            if kind not in _UNSENT_INPUTS or "checked" in attrs:
+                self._form[1].append((attrs["name"], attrs.get("value") or ""))
+
+    def handle_endtag(self, tag):
+        if tag == "form":
+            self._form = None
+
+
+def extract_links(html, base_path, host=None):
+    """Return same-site paths linked from ``html``, most likely first.
+
+    Anchors come first in document order, then the URLs that submitting each
+    ``GET`` form with its default values would request.  Fragments, other
+    schemes and links to other hosts are ignored, as is ``base_path`` itself.
+    """
+    parser = _LinkParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:  # pragma: no cover - HTMLParser is lenient
+        LOGGER.debug("Could not parse links from %s", base_path)
+    targets = list(parser.links)
+    for action, fields in parser.forms:
+        url = urljoin(base_path, action or base_path)
+        targets.append(url.split("?", 1)[0] + "?" + urlencode(fields))
+    base = urlsplit(base_path)
+    paths = []
+    for target in targets:
+        parts = urlsplit(urljoin(base_path, target.strip()))
+        if parts.scheme not in ("", "http", "https"):
+            continue
+        if parts.netloc and parts.netloc != host:
+            continue
+        path = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+        if path == (base.path or "/") + ("?" + base.query if base.query else ""):
+            continue
+        if path not in paths:
+            paths.append(path)
+    return paths
+
+
+class Prefetcher:
+    """Run speculative generations on a bounded pool and hold their results briefly.
+
+    :meth:`schedule` takes ``(key, cost, job)`` candidates.  ``job()``
+    returns ``(entry, tokens_spent)`` and runs on one of ``workers``
+    threads.  At most ``fanout`` candidates per page are started, never
+    more than ``workers * fanout`` are queued, and estimated ``cost`` plus
+    actual spend stays below ``token_budget`` per ``window`` seconds.
+    Entries expire after ``ttl`` seconds; any entry that is dropped without
+    being taken counts as a wasted generation.
+    """
+
+    def __init__(self, workers=2, fanout=3, token_budget=50000, window=60.0, ttl=60.0,
+                 max_entries=64, clock=time.monotonic):
+        self.workers = workers
+        self.fanout = fanout
+        self.token_budget = token_budget
+        self.window = window
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._pending = {}
+        self._spend = collections.deque()
+        self._executor = None
+        self._planner = None
+        self._planning = 0
+        self._generation = 0
+        self.scheduled = 0
+        self.generated = 0
+        self.failed = 0
+        self.hits = 0
+        self.misses = 0
+        self.wasted = 0
+        self.skipped_budget = 0
+        self.skipped_busy = 0
+        self.tokens_spent = 0
+
+    def _spent(self, now):
+        while self._spend and self._spend[0][0] <= now - self.window:
+            self._spend.popleft()
+        return sum(tokens for _, tokens in self._spend)
+
+    def _expire(self, now):
+        while self._entries:
+            key, (expires, _) = next(iter(self._entries.items()))
+            if expires > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+            self.wasted += 1
+
+    def plan(self, fn, *args):
+        """Run ``fn(*args)`` on the planning thread; it picks candidates to :meth:`schedule`.
+
+        Finding the links of a page is left to this thread so the request
+        that served the page is not held up by it.
+        """
+        with self._lock:
+            if self._planner is None:
+                self._planner = ThreadPoolExecutor(1, thread_name_prefix="prefetch-plan")
+            self._planning += 1
+        future = self._planner.submit(fn, *args)
+        future.add_done_callback(self._planned)
+        return future
+
+    def _planned(self, future):
+        with self._lock:
+            self._planning -= 1
+        if future.exception() is not None:
+            LOGGER.warning("Planning prefetches failed: %s", future.exception())
+
+    def schedule(self, candidates):
+        """Start up to ``fanout`` of ``candidates`` that are not cached or pending."""
+        started = 0
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            for key, cost, job in candidates:
+                if started >= self.fanout:
+                    break
+                if key in self._entries or key in self._pending:
+                    continue
+                if len(self._pending) >= self.workers * self.fanout:
+                    self.skipped_busy += 1
+                    break
+                if self.token_budget and self._spent(now) + cost > self.token_budget:
+                    self.skipped_budget += 1
+                    break
+                # Reserve the estimate now, the actual spend replaces it later
+                reservation = [now, cost]
+                self._spend.append(reservation)
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="prefetch")
+                future = self._executor.submit(self._run, key, job, reservation, self._generation)
+                self._pending[key] = future
+                self.scheduled += 1
+                started += 1
+        return started
+
+    def _run(self, key, job, reservation, generation):
+        try:
+            entry, tokens = job()
+        except Exception as exc:
+            LOGGER.info("Prefetch of %s failed: %s", key, exc)
+            entry, tokens = None, reservation[1]
+        with self._lock:
+            reservation[1] = tokens
+            self.tokens_spent += tokens
+            self._pending.pop(key, None)
+            if entry is None:
+                self.failed += 1
+            elif generation != self._generation:
+                # Invalidated while generating
+                self.wasted += 1
+            else:
+                self.generated += 1
+                self._entries[key] = (self._clock() + self.ttl, entry)
+                self._expire(self._clock())
+        return entry
+
+    def pending(self, key):
+        """Return the future of a generation in progress for ``key``, if any."""
+        with self._lock:
+            return self._pending.get(key)
+
+    def take(self, key):
+        """Remove and return the prefetched entry for ``key``, or ``None``."""
+        with self._lock:
+            self._expire(self._clock())
+            item = self._entries.pop(key, None)
+            if item is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return item[1]
+
+    def discard(self):
+        """Count an entry returned by :meth:`take` that could not be used as wasted."""
+        with self._lock:
+            self.hits -= 1
+            self.misses += 1
+            self.wasted += 1
+
+    def invalidate(self):
+        """Drop every entry and discard generations still in progress."""
+        with self._lock:
+            self.wasted += len(self._entries)
+            self._entries.clear()
+            self._generation += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "planning": self._planning,
+                "pending": len(self._pending),
+                "scheduled": self.scheduled,
+                "generated": self.generated,
+                "failed": self.failed,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "wasted": self.wasted,
+                "skipped_budget": self.skipped_budget,
+                "skipped_busy": self.skipped_busy,
+                "tokens_spent": self.tokens_spent,
+            }
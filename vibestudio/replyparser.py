@@ -0,0 +1,217 @@
+"""Single-pass parser for raw HTTP replies generated by the LLM.
+
+A reply looks like::
+
+    {{{ prefix meta }}}
+    HTTP/1.1 200 OK
+    Content-Type: text/html
+
+    <html>...</html>
+    {{{ suffix meta }}}
+
+The parser works on UTF-8 bytes and walks the reply once with index
+offsets.  Head lines are decoded as they are reached; the body is never
+split into lines or re-joined, it is returned as slices of the input.
+"""
+
+import re
+from collections import namedtuple
+
+# A blank line or a ``{{{ meta }}}`` line, either of which may precede suffix meta
+_HOLD_RE = re.compile(rb"\s*(?:\{\{\{.*\}\}\}\s*)?")
+# An unfinished line whose first character rules out a meta block
+_PENDING_RE = re.compile(rb"[ \t\f\v]*[^\s{]")
+_CR = ord("\r")
+# Released body bytes are dropped from the buffer once this many accumulate
+_COMPACT_BYTES = 65536
+
+ParsedReply = namedtuple("ParsedReply", "status headers body meta suffix_meta")
+
+
+def is_meta_line(line):
+    """Return whether ``line`` (str) is a ``{{{ ... }}}`` meta block."""
+    stripped = line.strip()
+    return stripped.startswith("{{{") and stripped.endswith("}}}")
+
+
+def get_header(headers, name, default=None):
+    """Return the first value of ``name`` in a list of header pairs."""
+    name = name.lower()
+    for k, v in headers:
+        if k.lower() == name:
+            return v
+    return default
+
+
+class ReplyParser:
+    """Incremental parser; :meth:`feed` returns body bytes as soon as they are final.
+
+    ``headers`` is a list of ``(name, value)`` pairs so repeated headers such
+    as ``Set-Cookie`` survive.  Body lines are not classified one by one:
+    each feed only looks back from the newest complete line for the last
+    line that is neither blank nor meta, and holds back what follows it
+    until more body arrives or :meth:`close` shows it ends the reply.
+    """
+
+    def __init__(self):
+        self.meta = []
+        self.suffix_meta = []
+        self.status = None
+        self.headers = []
+        self.head_complete = False
+        self._buf = bytearray()
+        self._in_headers = False
+        # Start of the first line not examined yet
+        self._scan = 0
+        # Bytes before this offset were already searched for newlines
+        self._seen = 0
+        # Body bytes before this offset have been returned
+        self._released = 0
+        # End of the last body line that is neither blank nor meta
+        self._content_end = 0
+
+    def header(self, name, default=None):
+        return get_header(self.headers, name, default)
+
+    def feed(self, data):
+        """Consume ``data`` (bytes or str) and return body bytes ready to send."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._buf += data
+        start, end = self._advance(self._buf, False)
+        out = bytes(self._buf[start:end])
+        self._compact()
+        return out
+
+    def close(self):
+        """Finish parsing and return the remaining body bytes."""
+        start, end = self._advance(self._buf, True)
+        out = bytes(self._buf[start:end])
+        self._buf = bytearray()
+        self._scan = self._seen = self._released = self._content_end = 0
+        return out
+
+    def _advance(self, buf, final):
+        """Examine new data in ``buf`` and return the releasable body span."""
+        n = len(buf)
+        scan = self._scan
+        # A pending line holds no newline up to ``seen``, so never search it twice
+        seen, self._seen = self._seen, n
+        while not self.head_complete and scan < n:
+            nl = buf.find(b"\n", max(scan, seen))
+            if nl < 0:
+                if not final:
+                    break
+                nl = n
+            end = nl - 1 if nl > scan and buf[nl - 1] == _CR else nl
+            self._head_line(buf, scan, end, min(nl + 1, n))
+            scan = nl + 1
+        if not self.head_complete:
+            self._scan = min(scan, n)
+            if not final:
+                return 0, 0
+            self._start_body(n)
+        scan = max(scan, self._scan)
+        if final:
+            last = n
+        else:
+            last = buf.rfind(b"\n", max(scan, seen), n)
+        if last >= scan:
+            content_end = _last_content(buf, scan, last)
+            if content_end is not None:
+                self._content_end = content_end
+            scan = last + 1
+        self._scan = min(scan, n)
+        if final:
+            end = self._final_end(buf, n)
+        elif _PENDING_RE.match(buf, self._scan, n):
+            # The unfinished line cannot be a meta block, relay it early
+            end = n - 1 if buf[n - 1] == _CR else n
+        else:
+            end = self._content_end
+        start = self._released
+        if end <= start:
+            return start, start
+        self._released = end
+        return start, end
+
+    def _head_line(self, buf, start, end, next_line):
+        text = bytes(buf[start:end]).decode("utf-8", "replace")
+        stripped = text.strip()
+        if self._in_headers:
+            if not stripped:
+                self._start_body(next_line)
+                self._scan = next_line
+            elif ":" in text:
+                k, v = text.split(":", 1)
+                self.headers.append((k.strip(), v.strip()))
+        elif not stripped:
+            pass
+        elif is_meta_line(stripped):
+            self.meta.append(stripped[3:-3].strip())
+        elif stripped.startswith("HTTP/"):
+            parts = stripped.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                self.status = int(parts[1])
+            self._in_headers = True
+        else:
+            # No status line: the reply is all body, starting with this line
+            self._start_body(start)
+            self._content_end = end
+            self._scan = next_line
+
+    def _start_body(self, offset):
+        self.head_complete = True
+        self._released = self._content_end = offset
+
+    def _final_end(self, buf, n):
+        held_start = self._content_end
+        held = bytes(buf[held_start:n]).decode("utf-8", "replace").split("\n")
+        meta = [line.strip()[3:-3].strip() for line in held if is_meta_line(line)]
+        if meta:
+            self.suffix_meta.extend(meta)
+            return held_start
+        # Only blank lines follow the body: keep them but drop the final newline
+        end = n
+        if end > held_start and buf[end - 1] == ord("\n"):
+            end -= 1
+            if end > held_start and buf[end - 1] == _CR:
+                end -= 1
+        return max(end, self._released)
+
+    def _compact(self):
+        if not self.head_complete:
+            return
+        cut = min(self._released, self._content_end)
+        if cut < _COMPACT_BYTES or cut * 2 < len(self._buf):
+            return
+        del self._buf[:cut]
+        self._scan -= cut
+        self._seen -= cut
+        self._released -= cut
+        self._content_end -= cut
+
+
+def _last_content(buf, lo, end):
+    """Return the end of the last line in ``buf[lo:end]`` that is not blank or meta."""
+    while True:
+        start = max(buf.rfind(b"\n", lo, end) + 1, lo)
+        line_end = end - 1 if end > start and buf[end - 1] == _CR else end
+        if not _HOLD_RE.fullmatch(buf, start, line_end):
+            return line_end
+        if start == lo:
+            return None
+        end = start - 1
+
+
+def parse_reply(data):
+    """Parse a complete reply in one pass.
+
+    The returned ``body`` is a ``memoryview`` into ``data`` (encoded first
+    when given a str), so large bodies are not copied.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    parser = ReplyParser()
+    start, end = parser._advance(data, True)
+    return ParsedReply(parser.status, parser.headers, memoryview(data)[start:end], parser.meta, parser.suffix_meta)
@@ -0,0 +1,356 @@
+"""Deadlines, retries and hedged requests for LLM calls.
+
+A :class:`CallPolicy` runs a backend call as a series of attempts.  Each
+attempt may be given a deadline and, when hedging, a second identical call
+is started once the first has taken longer than the recent 95th percentile;
+whichever finishes first wins.  Failed attempts that look transient
+(timeouts, connection errors, rate limits, 5xx) are retried with jittered
+exponential backoff.  What finally fails is raised as :class:`LLMError`,
+whose ``status`` is the HTTP status the proxy answers with.
+
+Calls on threads cannot be interrupted, so a losing or timed-out threaded
+attempt runs to completion in the background and its result is discarded.
+Inside :func:`lingering_attempts` the futures of such attempts are collected,
+so the caller can keep its scheduler slot until they are done.  Async
+attempts are cancelled.  Attempts that may overlap are given a fork of the
+conversation's response chain, and only the winner's fork is adopted.
+
+Streams cannot be retried once relayed, but :meth:`CallPolicy.stream` and
+:meth:`CallPolicy.astream` give their first chunk the attempt deadline.
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import contextvars
+import logging
+import random
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+# Provider statuses worth another attempt
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+# Transient error classes of the openai package (v1 and the legacy API)
+RETRYABLE_ERRORS = {
+    "APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError",
+    "Timeout", "ServiceUnavailableError", "TryAgain",
+}
+
+
+class LLMError(Exception):
+    """An LLM call failed; answer with ``status`` (502 Bad Gateway)."""
+
+    status = 502
+
+
+class LLMTimeout(LLMError):
+    """An LLM call missed its deadline; answer with 504 Gateway Timeout."""
+
+    status = 504
+
+
+def is_retryable(exc):
+    """Return whether ``exc`` looks like a transient provider failure."""
+    if isinstance(exc, (LLMTimeout, TimeoutError, ConnectionError)):
+        return True
+    status = getattr(exc, "status_code", None) or getattr(exc, "http_status", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUSES
+    return any(cls.__name__ in RETRYABLE_ERRORS for cls in type(exc).__mro__)
+
+
+class LatencyTracker:
+    """Durations of the most recent successful calls."""
+
+    def __init__(self, window=200):
+        self._lock = threading.Lock()
+        self._samples = collections.deque(maxlen=window)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q):
+        """Return the ``q`` quantile of the window, ``None`` when empty."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+_LINGERING = contextvars.ContextVar("vibestudio_lingering_attempts", default=None)
+
+
+@contextlib.contextmanager
+def lingering_attempts():
+    """Collect the futures of threaded attempts still running when their call gave up.
+
+    Yields the list they are appended to; calls made on other threads see it
+    too when they run in a copy of this context.
+    """
+    lingering = []
+    token = _LINGERING.set(lingering)
+    try:
+        yield lingering
+    finally:
+        _LINGERING.reset(token)
+
+
+def _linger(futures):
+    """Drop ``futures`` whose threads are still running, noting them for the caller."""
+    lingering = _LINGERING.get()
+    for future in futures:
+        # Threads cannot be stopped, the result is simply dropped
+        if not future.cancel() and lingering is not None:
+            lingering.append(future)
+
+
+def _spawn(fn, arg):
+    """Run ``fn(arg)`` on a daemon thread and return its future."""
+    future = concurrent.futures.Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(arg))
+        except BaseException as exc:
+            future.set_exception(exc)
+
+    threading.Thread(target=run, name="vibestudio-llm", daemon=True).start()
+    return future
+
+
+class CallPolicy:
+    """How LLM calls are bounded, retried and hedged.
+
+    ``timeout`` is the deadline of one attempt in seconds (0 for none) and
+    ``retries`` the number of extra attempts after a retryable failure.  The
+    n-th retry waits a random time up to ``backoff * 2**n`` seconds, capped
+    at ``max_backoff``.  With ``hedge`` a second call is started when an
+    attempt has run longer than the p95 of recent calls, or ``hedge_after``
+    seconds until ``min_samples`` calls have been timed.
+    """
+
+    def __init__(self, timeout=0.0, retries=0, backoff=0.5, max_backoff=8.0, hedge=False, hedge_after=2.0,
+                 min_samples=20, sleep=time.sleep, rng=random.random):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        self.min_samples = min_samples
+        self._sleep = sleep
+        self._rng = rng
+        self.latency = LatencyTracker()
+        self._lock = threading.Lock()
+        self.counts = collections.Counter()
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    @property
+    def _managed(self):
+        """Whether attempts run on their own thread or task."""
+        return bool(self.timeout) or self.hedge
+
+    def hedge_delay(self):
+        """Seconds after which an attempt is hedged."""
+        if len(self.latency) < self.min_samples:
+            return self.hedge_after
+        return self.latency.quantile(0.95)
+
+    def _backoff(self, retry):
+        return self._rng() * min(self.max_backoff, self.backoff * 2 ** retry)
+
+    def _retry_delay(self, retry, exc):
+        """Return the backoff before retrying after ``exc``, ``None`` to give up."""
+        if retry >= self.retries or not is_retryable(exc):
+            return None
+        delay = self._backoff(retry)
+        LOGGER.warning("LLM call failed (%s), retry %d in %.2fs", exc, retry + 1, delay)
+        self._count("retries")
+        return delay
+
+    def _failed(self, exc):
+        self._count("timeouts" if isinstance(exc, LLMTimeout) else "failures")
+        if isinstance(exc, LLMError):
+            return exc
+        return LLMError(f"LLM call failed: {exc}")
+
+    def _won(self, result, attempt, launched, chain, forks):
+        self.latency.record(time.monotonic() - launched[attempt])
+        if attempt:
+            self._count("hedge_wins")
+        if chain is not None and forks[attempt] is not chain:
+            chain.adopt(forks[attempt])
+        return result
+
+    def call(self, fn, chain=None):
+        """Return ``fn(chain)``, raising :class:`LLMError` once all attempts failed."""
+        self._count("calls")
+        retry = 0
+        while True:
+            try:
+                return self._attempt(fn, chain)
+            except Exception as exc:
+                delay = self._retry_delay(retry, exc)
+                if delay is None:
+                    raise self._failed(exc) from exc
+            self._sleep(delay)
+            retry += 1
+
+    def _attempt(self, fn, chain):
+        if not self._managed:
+            started = time.monotonic()
+            result = fn(chain)
+            self.latency.record(time.monotonic() - started)
+            return result
+        started = time.monotonic()
+        deadline = started + self.timeout if self.timeout else None
+        hedge_at = started + self.hedge_delay() if self.hedge else None
+        forks, launched, futures = [], [], {}
+
+        def launch():
+            forks.append(chain.fork() if chain is not None else None)
+            launched.append(time.monotonic())
+            futures[_spawn(fn, forks[-1])] = len(forks) - 1
+
+        launch()
+        error = None
+        try:
+            while futures:
+                limits = [t for t in (deadline, hedge_at) if t is not None]
+                wait = max(0.0, min(limits) - time.monotonic()) if limits else None
+                done, _ = concurrent.futures.wait(futures, wait, concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    attempt = futures.pop(future)
+                    if future.exception() is None:
+                        return self._won(future.result(), attempt, launched, chain, forks)
+                    error = future.exception()
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    raise LLMTimeout(f"LLM call timed out after {self.timeout:g}s")
+                if hedge_at is not None and now >= hedge_at and futures:
+                    hedge_at = None
+                    self._count("hedged")
+                    launch()
+        finally:
+            _linger(futures)
+        raise error
+
+    async def acall(self, fn, chain=None):
+        """Like :meth:`call` for a coroutine function ``fn``; losers are cancelled."""
+        self._count("calls")
+        retry = 0
+        while True:
+            try:
+                return await self._aattempt(fn, chain)
+            except Exception as exc:
+                delay = self._retry_delay(retry, exc)
+                if delay is None:
+                    raise self._failed(exc) from exc
+            await asyncio.sleep(delay)
+            retry += 1
+
+    async def _aattempt(self, fn, chain):
+        if not self._managed:
+            started = time.monotonic()
+            result = await fn(chain)
+            self.latency.record(time.monotonic() - started)
+            return result
+        started = time.monotonic()
+        deadline = started + self.timeout if self.timeout else None
+        hedge_at = started + self.hedge_delay() if self.hedge else None
+        forks, launched, tasks = [], [], {}
+
+        def launch():
+            forks.append(chain.fork() if chain is not None else None)
+            launched.append(time.monotonic())
+            tasks[asyncio.ensure_future(fn(forks[-1]))] = len(forks) - 1
+
+        launch()
+        error = None
+        try:
+            while tasks:
+                limits = [t for t in (deadline, hedge_at) if t is not None]
+                wait = max(0.0, min(limits) - time.monotonic()) if limits else None
+                done, _ = await asyncio.wait(tasks, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    attempt = tasks.pop(task)
+                    if task.exception() is None:
+                        return self._won(task.result(), attempt, launched, chain, forks)
+                    error = task.exception()
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    raise LLMTimeout(f"LLM call timed out after {self.timeout:g}s")
+                if hedge_at is not None and now >= hedge_at and tasks:
+                    hedge_at = None
+                    self._count("hedged")
+                    launch()
+        finally:
+            for task in tasks:
+                task.cancel()
+        raise error
+
+    def stream(self, fn):
+        """Yield the chunks of the iterator ``fn()`` returns, the first within the deadline.
+
+        Raises :class:`LLMTimeout` when no chunk arrived in time.
+        """
+        if not self.timeout:
+            yield from fn()
+            return
+
+        def first(_):
+            chunks = iter(fn())
+            return chunks, next(chunks, None)
+
+        future = _spawn(first, None)
+        try:
+            chunks, chunk = future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            _linger([future])
+            self._count("timeouts")
+            raise LLMTimeout(f"LLM stream sent nothing for {self.timeout:g}s") from None
+        if chunk is None:
+            return
+        yield chunk
+        yield from chunks
+
+    async def astream(self, fn):
+        """Like :meth:`stream` for an async iterator; a stream that misses the deadline is closed."""
+        chunks = fn()
+        if not self.timeout:
+            async for chunk in chunks:
+                yield chunk
+            return
+        try:
+            chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+        except StopAsyncIteration:
+            return
+        except asyncio.TimeoutError:
+            await chunks.aclose()
+            self._count("timeouts")
+            raise LLMTimeout(f"LLM stream sent nothing for {self.timeout:g}s") from None
+        yield chunk
+        async for chunk in chunks:
+            yield chunk
+
+    def stats(self):
+        with self._lock:
+            stats = {name: self.counts[name] for name in
+                     ("calls", "retries", "timeouts", "failures", "hedged", "hedge_wins")}
+        p95 = self.latency.quantile(0.95)
+        stats["p95_ms"] = round(p95 * 1000, 3) if p95 is not None else None
+        stats["hedge_delay_ms"] = round(self.hedge_delay() * 1000, 3) if self.hedge else None
+        return stats
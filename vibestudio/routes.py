@@ -0,0 +1,203 @@
+"""Deterministic replies for requests that never needed the model.
+
+Browsers fetch ``/favicon.ico`` and ``/robots.txt`` on their own, send
+``OPTIONS`` preflights before cross-origin requests and ``HEAD`` requests to
+check links.  A :class:`RouteTable` answers such requests before the LLM is
+called, so they cost no model time and stay out of the conversation.
+
+A route matches a method and a path pattern and answers with one of:
+
+- a fixed reply: ``status``, ``headers`` and ``body``;
+- ``file``: a static file, or ``directory``: files below a directory;
+- ``handler``: a function ``handler(method, path, headers)`` returning a
+  :class:`~vibestudio.cache.CachedReply`, or ``None`` to pass the request
+  on to the model.  Give a built-in name or ``"package.module:function"``.
+
+Routes are tried in order and the first reply wins.
+"""
+
+import fnmatch
+import importlib
+import json
+import mimetypes
+import os
+import threading
+from urllib.parse import unquote, urlsplit
+
+from .cache import CachedReply
+
+ALLOWED_METHODS = "GET, HEAD, POST, PUT, DELETE, PATCH, OPTIONS"
+
+
+def preflight(method, path, headers):
+    """Answer an ``OPTIONS`` request, allowing any CORS preflight."""
+    reply_headers = [("Allow", ALLOWED_METHODS)]
+    origin = headers.get("Origin")
+    if origin and headers.get("Access-Control-Request-Method"):
+        reply_headers += [
+            ("Access-Control-Allow-Origin", origin),
+            ("Access-Control-Allow-Methods", ALLOWED_METHODS),
+            ("Access-Control-Max-Age", "600"),
+            ("Vary", "Origin"),
+        ]
+        requested = headers.get("Access-Control-Request-Headers")
+        if requested:
+            reply_headers.append(("Access-Control-Allow-Headers", requested))
+    return CachedReply(204, reply_headers, b"")
+
+
+# Handlers routes can name without a module; the Studio adds ``head``
+HANDLERS = {"preflight": preflight}
+
+DEFAULT_ROUTES = [
+    {"method": "GET HEAD", "path": "/favicon.ico", "status": 204,
+     "headers": [["Cache-Control", "max-age=86400"]]},
+    # Every crawled page would be a model call
+    {"method": "GET HEAD", "path": "/robots.txt", "headers": [["Content-Type", "text/plain"]],
+     "body": "User-agent: *\nDisallow: /\n"},
+    {"method": "OPTIONS", "path": "*", "handler": "preflight"},
+    {"method": "HEAD", "path": "*", "handler": "head"},
+]
+
+
+def _not_found():
+    return CachedReply(404, [("Content-Type", "text/plain")], b"Not found\n")
+
+
+def _file_reply(path):
+    try:
+        with open(path, "rb") as fh:
+            body = fh.read()
+    except FileNotFoundError:
+        return _not_found()
+    except OSError:
+        # E.g. a directory or a file the proxy may not read
+        return CachedReply(500, [("Content-Type", "text/plain")], b"Could not read file\n")
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    return CachedReply(200, [("Content-Type", content_type)], body)
+
+
+def _resolve_handler(name, handlers):
+    if name in handlers:
+        return handlers[name]
+    module, sep, attr = name.partition(":")
+    if not sep:
+        raise ValueError(f"unknown route handler {name!r}")
+    return getattr(importlib.import_module(module), attr)
+
+
+class Route:
+    """One entry of a :class:`RouteTable`, built from its JSON form."""
+
+    def __init__(self, spec, handlers, base_dir="."):
+        methods = spec.get("method", "*").replace(",", " ").upper().split()
+        self.methods = None if "*" in methods else frozenset(methods)
+        self.method = " ".join(methods)
+        self.path = spec.get("path", "*")
+        self.hits = 0
+        self._handler = None
+        self._file = None
+        self._directory = None
+        self._reply = None
+        if "handler" in spec:
+            self.kind = "handler"
+            self._handler = _resolve_handler(spec["handler"], handlers)
+        elif "file" in spec:
+            self.kind = "file"
+            self._file = os.path.join(base_dir, spec["file"])
+        elif "directory" in spec:
+            self.kind = "directory"
+            self._directory = os.path.realpath(os.path.join(base_dir, spec["directory"]))
+            # The part of the path below the pattern's literal prefix names the file
+            self._prefix = self.path.split("*", 1)[0]
+        else:
+            self.kind = "fixed"
+            body = spec.get("body", "")
+            self._reply = CachedReply(
+                int(spec.get("status", 200)),
+                [tuple(h) for h in spec.get("headers", [])],
+                body.encode("utf-8") if isinstance(body, str) else bytes(body),
+            )
+
+    def matches(self, method, path):
+        if self.methods is not None and method not in self.methods:
+            return False
+        return fnmatch.fnmatchcase(path, self.path)
+
+    def reply(self, method, path, target, headers):
+        """Return the reply for a matching request, ``None`` to pass it on.
+
+        ``target`` is the decoded ``path`` without its query string.
+        """
+        if self.kind == "handler":
+            return self._handler(method, path, headers)
+        if self.kind == "fixed":
+            return self._reply
+        if self.kind == "file":
+            return _file_reply(self._file)
+        name = os.path.realpath(os.path.join(self._directory, target[len(self._prefix):].lstrip("/")))
+        if not name.startswith(self._directory + os.sep) or not os.path.isfile(name):
+            return _not_found()
+        return _file_reply(name)
+
+    def describe(self):
+        return {"method": self.method, "path": self.path, "kind": self.kind, "hits": self.hits}
+
+
+class RouteTable:
+    """Ordered routes answering requests without the model."""
+
+    def __init__(self, routes, handlers=None, base_dir="."):
+        handlers = {**HANDLERS, **(handlers or {})}
+        self.routes = [Route(spec, handlers, base_dir) for spec in routes]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.routes)
+
+    def get(self, method, path, headers):
+        """Return the reply of the first route answering the request, ``None`` on a miss."""
+        target = unquote(urlsplit(path).path) or "/"
+        for route in self.routes:
+            if not route.matches(method, target):
+                continue
+            reply = route.reply(method, path, target, headers)
+            if reply is not None:
+                with self._lock:
+                    route.hits += 1
+                    self.hits += 1
+                return reply
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "routes": len(self.routes),
+                "hits": self.hits,
+                "misses": self.misses,
+                "table": [route.describe() for route in self.routes],
+            }
+
+
+def load_routes(spec, handlers=None):
+    """Build the table named by ``spec``: ``"default"`` or a JSON file.
+
+    The file holds a list of routes, or an object with ``routes`` and
+    ``"defaults": false`` to leave out :data:`DEFAULT_ROUTES`, which
+    otherwise follow the file's own routes.  Paths in ``file`` and
+    ``directory`` are relative to the file.
+    """
+    if spec == "default":
+        return RouteTable(DEFAULT_ROUTES, handlers)
+    with open(spec, "r", encoding="utf-8") as fh:
+        config = json.load(fh)
+    if isinstance(config, list):
+        config = {"routes": config}
+    routes = list(config.get("routes", []))
+    if config.get("defaults", True):
+        routes += DEFAULT_ROUTES
+    return RouteTable(routes, handlers, os.path.dirname(os.path.abspath(spec)))
@@ -0,0 +1,251 @@
+"""Admission control and priority scheduling of LLM calls."""
+
+import asyncio
+import collections
+import math
+import threading
+import time
+
+# Most important first
+PRIORITIES = ("meta", "interactive", "background")
+
+
+class Overloaded(Exception):
+    """No LLM call slot is available; retry after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after, reason="queue full"):
+        super().__init__(f"LLM capacity exhausted ({reason}), retry after {retry_after}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ("priority", "client", "enqueued", "outcome", "_event", "_callbacks")
+
+    def __init__(self, priority, client, enqueued):
+        self.priority = priority
+        self.client = client
+        self.enqueued = enqueued
+        # None while queued, then True (admitted) or an Overloaded error
+        self.outcome = None
+        self._event = threading.Event()
+        self._callbacks = []
+
+    def _wake(self):
+        self._event.set()
+        for callback in self._callbacks:
+            callback()
+
+
+class CallScheduler:
+    """Run at most ``max_concurrent`` LLM calls, queueing the rest by priority.
+
+    Waiting calls are served most important priority first (see
+    :data:`PRIORITIES`) and round-robin between clients within a priority,
+    so one busy client cannot monopolise the slots.  The queue holds at most
+    ``max_queue`` calls.  When it is full, a newcomer displaces the newest
+    waiter of a less important priority, or of a client with more calls
+    queued than it has; otherwise it is refused.  Refused, displaced and
+    timed-out calls get :class:`Overloaded` with a ``retry_after`` estimate.
+    """
+
+    def __init__(self, max_concurrent=4, max_queue=64, timeout=30.0, clock=time.monotonic):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._queues = {priority: collections.OrderedDict() for priority in PRIORITIES}
+        self._queued = 0
+        self.active = 0
+        # Moving average of how long a call holds its slot
+        self._service_time = 1.0
+        self.admitted = collections.Counter()
+        self.rejected = 0
+        self.displaced = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        # Slots held for attempts that were given up on but are still running
+        self.lingering = 0
+
+    def _retry_after(self):
+        waves = (self._queued + 1) / self.max_concurrent
+        return max(1, min(60, math.ceil(waves * self._service_time)))
+
+    def _enqueue(self, priority, client):
+        """Admit, queue or refuse a call under the lock.
+
+        Returns ``(None, None)`` when admitted at once, else the new waiter
+        and the waiter it displaced (or ``None``).
+        """
+        if priority not in self._queues:
+            raise ValueError(f"unknown priority {priority!r}")
+        if self.active < self.max_concurrent and not self._queued:
+            self.active += 1
+            self.admitted[priority] += 1
+            return None, None
+        victim = None
+        if self._queued >= self.max_queue:
+            victim = self._victim(priority, client)
+            if victim is None:
+                self.rejected += 1
+                raise Overloaded(self._retry_after())
+        waiter = _Waiter(priority, client, self._clock())
+        self._queues[priority].setdefault(client, collections.deque()).append(waiter)
+        self._queued += 1
+        return waiter, victim
+
+    def _victim(self, priority, client):
+        """Remove and return the waiter to shed for a newcomer, if any."""
+        rank = PRIORITIES.index(priority)
+        for level in reversed(PRIORITIES[rank:]):
+            clients = self._queues[level]
+            if not clients:
+                continue
+            heaviest = max(clients, key=lambda c: len(clients[c]))
+            own = len(clients.get(client, ())) if level == priority else -1
+            if level == priority and len(clients[heaviest]) <= own + 1:
+                return None
+            waiter = clients[heaviest].pop()
+            if not clients[heaviest]:
+                del clients[heaviest]
+            self._queued -= 1
+            self.displaced += 1
+            waiter.outcome = Overloaded(self._retry_after(), "displaced by a more urgent call")
+            return waiter
+        return None
+
+    def _next(self):
+        for priority in PRIORITIES:
+            clients = self._queues[priority]
+            if clients:
+                client, waiters = next(iter(clients.items()))
+                waiter = waiters.popleft()
+                if waiters:
+                    # Round robin: this client goes to the back of its priority
+                    clients.move_to_end(client)
+                else:
+                    del clients[client]
+                self._queued -= 1
+                return waiter
+        return None
+
+    def _remove(self, waiter):
+        clients = self._queues[waiter.priority]
+        waiters = clients.get(waiter.client)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del clients[waiter.client]
+            self._queued -= 1
+
+    def _admit(self, waiter):
+        self.active += 1
+        self.admitted[waiter.priority] += 1
+        self.wait_seconds += self._clock() - waiter.enqueued
+        waiter.outcome = True
+
+    def acquire(self, priority="interactive", client=None, timeout=None):
+        """Block until a slot is free; return the admission time.
+
+        Pass the result to :meth:`release` when the call is done.
+        """
+        with self._lock:
+            waiter, victim = self._enqueue(priority, client)
+            if waiter is None:
+                return self._clock()
+        if victim is not None:
+            victim._wake()
+        waiter._event.wait(self.timeout if timeout is None else timeout)
+        return self._settled(waiter)
+
+    async def acquire_async(self, priority="interactive", client=None, timeout=None):
+        """Like :meth:`acquire`, awaiting the slot instead of blocking."""
+        with self._lock:
+            waiter, victim = self._enqueue(priority, client)
+            if waiter is None:
+                return self._clock()
+            loop = asyncio.get_running_loop()
+            ready = loop.create_future()
+
+            def wake():
+                loop.call_soon_threadsafe(lambda: ready.done() or ready.set_result(None))
+
+            waiter._callbacks.append(wake)
+        if victim is not None:
+            victim._wake()
+        try:
+            await asyncio.wait_for(asyncio.shield(ready), self.timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self._settled(waiter)
+
+    def _settled(self, waiter):
+        """Return the admission time, or raise if ``waiter`` was refused or timed out."""
+        with self._lock:
+            if waiter.outcome is None:
+                self._remove(waiter)
+                self.timeouts += 1
+                waiter.outcome = Overloaded(self._retry_after(), "timed out in queue")
+        if waiter.outcome is not True:
+            raise waiter.outcome
+        return self._clock()
+
+    def release(self, admitted_at):
+        """Free the slot taken at ``admitted_at`` and admit the next waiter."""
+        with self._lock:
+            held = self._clock() - admitted_at
+            self._service_time = 0.8 * self._service_time + 0.2 * held
+            self.active -= 1
+            waiter = self._next() if self.active < self.max_concurrent else None
+            if waiter is not None:
+                self._admit(waiter)
+        if waiter is not None:
+            waiter._wake()
+
+    def release_after(self, admitted_at, futures):
+        """Like :meth:`release`, but only once every future in ``futures`` is done.
+
+        A call that gave up on attempts still running on their threads keeps
+        its slot until they finish, so they are not hidden from the limit.
+        """
+        pending = [future for future in futures if not future.done()]
+        if not pending:
+            self.release(admitted_at)
+            return
+        with self._lock:
+            self.lingering += 1
+        remaining = [len(pending)]
+        lock = threading.Lock()
+
+        def finished(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            with self._lock:
+                self.lingering -= 1
+            self.release(admitted_at)
+
+        for future in pending:
+            future.add_done_callback(finished)
+
+    def stats(self):
+        with self._lock:
+            admitted = sum(self.admitted.values())
+            stats = {
+                "max_concurrent": self.max_concurrent,
+                "active": self.active,
+                "lingering": self.lingering,
+                "queued": self._queued,
+                "admitted": admitted,
+                "rejected": self.rejected,
+                "displaced": self.displaced,
+                "timeouts": self.timeouts,
+                "avg_wait": self.wait_seconds / admitted if admitted else 0.0,
+                "service_time": self._service_time,
+            }
+            for priority in PRIORITIES:
+                stats[f"queued_{priority}"] = sum(len(w) for w in self._queues[priority].values())
+                stats[f"admitted_{priority}"] = self.admitted[priority]
+            return stats
@@ -0,0 +1,142 @@
+"""Per-client conversation sessions for the proxy."""
+
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from http.cookies import CookieError, SimpleCookie
+
+from .chain import ResponseChain
+
+COOKIE_NAME = "vibe_session"
+HEADER_NAME = "X-Vibe-Session"
+
+
+class Session:
+    """Conversation history and response chain belonging to one client."""
+
+    def __init__(self, session_id, conversation, now):
+        self.id = session_id
+        self.conversation = conversation
+        self.chain = ResponseChain()
+        self.created = now
+        self.last_used = now
+
+
+class SessionManager:
+    """Map clients to sessions with idle expiry and LRU eviction.
+
+    Clients are identified by the ``X-Vibe-Session`` header or the
+    ``vibe_session`` cookie.  Unknown or expired identifiers start a new
+    session whose conversation is produced by ``factory``.
+
+    When sessions are shared with other processes, ``bind(session_id,
+    conversation)`` returns the stored conversation of a new session and
+    ``resume(session_id)`` the conversation of a session this process has
+    not seen, or ``None`` if there is no such session or it has been idle
+    too long.  ``drop(session_id, max_idle)`` deletes the stored
+    conversation of a session this process evicted (``max_idle`` is
+    ``None``) or let expire, in which case it is only deleted if no other
+    process used it in the last ``max_idle`` seconds.
+    """
+
+    def __init__(self, factory, idle_timeout=1800.0, max_sessions=100, clock=time.monotonic):
+        self.factory = factory
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self.bind = None
+        self.resume = None
+        self.drop = None
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+    @staticmethod
+    def client_id(headers):
+        """Return the session id presented by the client, if any."""
+        value = headers.get(HEADER_NAME)
+        if value:
+            return value.strip()
+        cookie_header = headers.get("Cookie")
+        if not cookie_header:
+            return None
+        cookies = SimpleCookie()
+        try:
+            cookies.load(cookie_header)
+        except CookieError:
+            return None
+        morsel = cookies.get(COOKIE_NAME)
+        return morsel.value if morsel else None
+
+    def lookup(self, headers):
+        """Return ``(session, created)`` for the client sending ``headers``."""
+        session_id = self.client_id(headers)
+        now = self._clock()
+        with self._lock:
+            expired = self._expire(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is not None:
+                session.last_used = now
+                self._sessions.move_to_end(session_id)
+        self._drop(expired, self.idle_timeout)
+        if session is not None:
+            return session, False
+        # Build the conversation outside the lock, the factory may take its own
+        conversation = self.resume(session_id) if self.resume is not None and session_id else None
+        created = conversation is None
+        if created:
+            session_id = secrets.token_urlsafe(16)
+            conversation = self.factory()
+            if self.bind is not None:
+                conversation = self.bind(session_id, conversation)
+        session = Session(session_id, conversation, now)
+        evicted = []
+        with self._lock:
+            self._sessions[session.id] = session
+            self.created += created
+            while len(self._sessions) > self.max_sessions:
+                evicted.append(self._sessions.popitem(last=False)[0])
+                self.evicted += 1
+        self._drop(evicted, None)
+        return session, created
+
+    def _expire(self, now):
+        expired = []
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_used < self.idle_timeout:
+                break
+            del self._sessions[oldest.id]
+            self.expired += 1
+            expired.append(oldest.id)
+        return expired
+
+    def _drop(self, session_ids, max_idle):
+        if self.drop is not None:
+            for session_id in session_ids:
+                self.drop(session_id, max_idle)
+
+    def reset(self):
+        """Drop every session, e.g. when the service restarts."""
+        with self._lock:
+            self._sessions.clear()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": len(self._sessions),
+                "created": self.created,
+                "expired": self.expired,
+                "evicted": self.evicted,
+            }
+
+
+def session_cookie(session):
+    """Return the ``Set-Cookie`` value that binds a client to ``session``."""
+    return f"{COOKIE_NAME}={session.id}; Path=/; HttpOnly; SameSite=Lax"
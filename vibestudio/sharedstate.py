@@ -0,0 +1,326 @@
+"""State shared between the Studio and its proxy worker processes.
+
+One SQLite file (in WAL mode, so readers never wait for the writer) holds
+what the processes must agree on:
+
+- ``config``: the prompts and model last published by the Studio, with a
+  generation number that workers compare before each request.
+- ``messages``: the conversations, keyed by session id (``""`` for the
+  shared conversation), one row per message so appending stays cheap.
+- ``sessions``: when a message was last added to each session, so idle
+  sessions expire across processes.
+- ``logs``: Traffic and meta chat entries written by workers, which the
+  Studio moves into its own log buffers with a :class:`LogTailer`.
+- ``worker_stats``: the latest counters each worker published, because
+  token budgets, admission control and metrics are kept per process.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+# Key of the conversation shared by every client without a session
+MAIN = ""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS config (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    generation INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation TEXT NOT NULL,
+    pos INTEGER NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_conversation ON messages (conversation, pos);
+CREATE TABLE IF NOT EXISTS sessions (
+    conversation TEXT PRIMARY KEY,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_by_last_used ON sessions (last_used);
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    log TEXT NOT NULL,
+    entry TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS worker_stats (
+    pid INTEGER PRIMARY KEY,
+    updated REAL NOT NULL,
+    data TEXT NOT NULL
+);
+"""
+
+
+class SharedState:
+    """Access to the shared SQLite file; safe to use from any thread."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit; multi-statement changes open their own transaction
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        return _Transaction(conn)
+
+    # Configuration
+
+    def publish(self, **config):
+        """Store ``config`` under a new generation and return its number."""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT generation FROM config WHERE id = 1").fetchone()
+            generation = (row[0] if row else 0) + 1
+            conn.execute(
+                "INSERT OR REPLACE INTO config (id, generation, data) VALUES (1, ?, ?)",
+                (generation, json.dumps(config)),
+            )
+        return generation
+
+    def generation(self):
+        row = self._conn().execute("SELECT generation FROM config WHERE id = 1").fetchone()
+        return row[0] if row else 0
+
+    def config(self):
+        """Return ``(generation, config)`` as last published."""
+        row = self._conn().execute("SELECT generation, data FROM config WHERE id = 1").fetchone()
+        return (row[0], json.loads(row[1])) if row else (0, {})
+
+    # Conversations
+
+    def conversation(self, key=MAIN, initial=None):
+        """Return the conversation ``key``, first replacing it with ``initial`` if given."""
+        conversation = SharedConversation(self, key)
+        if initial is not None:
+            conversation.reset(initial)
+        return conversation
+
+    def has_conversation(self, key, max_idle=None):
+        """Whether conversation ``key`` exists; with ``max_idle``, also used in the last ``max_idle`` seconds.
+
+        A session idle for longer is deleted.
+        """
+        if max_idle is not None and key != MAIN:
+            self.drop_session(key, max_idle)
+        row = self._conn().execute("SELECT 1 FROM messages WHERE conversation = ? LIMIT 1", (key,)).fetchone()
+        return row is not None
+
+    def drop_session(self, key, max_idle=None):
+        """Delete session ``key``; with ``max_idle``, only if idle for longer than that.
+
+        Other sessions idle for longer than ``max_idle`` go with it.
+        """
+        with self._transaction() as conn:
+            if max_idle is None:
+                conn.execute("DELETE FROM messages WHERE conversation = ?", (key,))
+                conn.execute("DELETE FROM sessions WHERE conversation = ?", (key,))
+                return
+            idle = [row[0] for row in conn.execute(
+                "SELECT conversation FROM sessions WHERE last_used < ?", (time.time() - max_idle,)
+            )]
+            for stale in idle:
+                conn.execute("DELETE FROM messages WHERE conversation = ?", (stale,))
+                conn.execute("DELETE FROM sessions WHERE conversation = ?", (stale,))
+
+    def drop_sessions(self):
+        """Delete every conversation except the shared one."""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM messages WHERE conversation != ?", (MAIN,))
+            conn.execute("DELETE FROM sessions")
+
+    # Logs
+
+    def append_log(self, log, entry):
+        self._conn().execute("INSERT INTO logs (log, entry) VALUES (?, ?)", (log, json.dumps(entry, default=str)))
+
+    def take_logs(self, limit=1000):
+        """Remove and return up to ``limit`` of the oldest ``(log, entry)`` rows."""
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT id, log, entry FROM logs ORDER BY id LIMIT ?", (limit,)).fetchall()
+            if rows:
+                conn.execute("DELETE FROM logs WHERE id <= ?", (rows[-1][0],))
+        return [(log, json.loads(entry)) for _, log, entry in rows]
+
+    # Worker statistics
+
+    def publish_stats(self, pid, stats):
+        """Store the latest ``stats`` of worker ``pid``."""
+        self._conn().execute(
+            "INSERT OR REPLACE INTO worker_stats (pid, updated, data) VALUES (?, ?, ?)",
+            (pid, time.time(), json.dumps(stats, default=str)),
+        )
+
+    def worker_stats(self):
+        """Return ``{pid: stats}`` as last published by each worker, with ``updated`` added."""
+        rows = self._conn().execute("SELECT pid, updated, data FROM worker_stats ORDER BY pid").fetchall()
+        return {pid: dict(json.loads(data), updated=updated) for pid, updated, data in rows}
+
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+class SharedConversation:
+    """A conversation stored in :class:`SharedState`, used like a list.
+
+    It supports what the proxy does with conversations: appending, reading
+    (iteration, ``len``, indexing, ``==``) and rewriting it, e.g. with its
+    compacted form (:meth:`rewrite`).  Every operation is atomic across
+    processes.
+    """
+
+    def __init__(self, state, key=MAIN):
+        self.state = state
+        self.key = key
+
+    def _read(self, conn):
+        rows = conn.execute(
+            "SELECT message FROM messages WHERE conversation = ? ORDER BY pos", (self.key,)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    @staticmethod
+    def _insert(conn, key, message):
+        conn.execute(
+            "INSERT INTO messages (conversation, pos, message) "
+            "SELECT ?, COALESCE(MAX(pos) + 1, 0), ? FROM messages WHERE conversation = ?",
+            (key, json.dumps(message), key),
+        )
+        if key != MAIN:
+            conn.execute("INSERT OR REPLACE INTO sessions (conversation, last_used) VALUES (?, ?)", (key, time.time()))
+
+    def append(self, message):
+        with self.state._transaction() as conn:
+            self._insert(conn, self.key, message)
+
+    def append_and_read(self, message):
+        """Append ``message`` and return the conversation ending with it."""
+        with self.state._transaction() as conn:
+            self._insert(conn, self.key, message)
+            return self._read(conn)
+
+    def reset(self, messages):
+        """Replace the whole conversation with ``messages``."""
+        with self.state._transaction() as conn:
+            conn.execute("DELETE FROM messages WHERE conversation = ?", (self.key,))
+            for message in messages:
+                self._insert(conn, self.key, message)
+
+    def __iter__(self):
+        return iter(self._read(self.state._conn()))
+
+    def __len__(self):
+        row = self.state._conn().execute(
+            "SELECT COUNT(*) FROM messages WHERE conversation = ?", (self.key,)
+        ).fetchone()
+        return row[0]
+
+    def __getitem__(self, index):
+        return self._read(self.state._conn())[index]
+
+    def __eq__(self, other):
+        return self._read(self.state._conn()) == list(other)
+
+    __hash__ = None
+
+    def rewrite(self, rewrite):
+        """Replace the messages with ``rewrite(messages)`` in one transaction.
+
+        ``rewrite`` sees the conversation as it is inside the transaction, so
+        messages other processes appended or replaced meanwhile are never
+        lost; it returns ``None`` to leave the conversation alone.  Returns
+        the messages it saw and what it returned.
+        """
+        with self.state._transaction() as conn:
+            messages = self._read(conn)
+            rewritten = rewrite(list(messages))
+            if rewritten is not None:
+                conn.execute("DELETE FROM messages WHERE conversation = ?", (self.key,))
+                for message in rewritten:
+                    self._insert(conn, self.key, message)
+        return messages, rewritten
+
+    def __repr__(self):
+        return f"SharedConversation({self.key!r})"
+
+
+class SharedLog:
+    """Write-only stand-in for a worker's ``LogBuffer``; entries go to the Studio."""
+
+    def __init__(self, state, name):
+        self.state = state
+        self.name = name
+        self.appended = 0
+        self.pid = os.getpid()
+
+    def append(self, entry):
+        entry.setdefault("worker", self.pid)
+        self.state.append_log(self.name, entry)
+        self.appended += 1
+
+    def clear(self):
+        """Clearing is up to the Studio, which owns the log buffers."""
+
+    def __len__(self):
+        # Entries written by this worker, the Studio holds the log itself
+        return self.appended
+
+    def __iter__(self):
+        return iter(())
+
+
+class LogTailer(threading.Thread):
+    """Move log entries written by workers to ``sink(log, entry)`` in the Studio."""
+
+    def __init__(self, state, sink, interval=0.1):
+        super().__init__(daemon=True, name="vibestudio-log-tailer")
+        self.state = state
+        self.sink = sink
+        self.interval = interval
+        self._halt = threading.Event()
+        self.moved = 0
+
+    def poll(self):
+        """Move the pending entries now; return how many were moved."""
+        rows = self.state.take_logs()
+        for log, entry in rows:
+            self.sink(log, entry)
+        self.moved += len(rows)
+        return len(rows)
+
+    def run(self):
+        while not self._halt.is_set():
+            try:
+                # Keep going without waiting while a backlog remains
+                if self.poll():
+                    continue
+            except sqlite3.Error:
+                LOGGER.exception("Reading worker logs failed")
+            self._halt.wait(self.interval)
+
+    def stop(self):
+        self._halt.set()
@@ -0,0 +1,105 @@
+"""Coalescing of identical requests that are in flight at the same time."""
+
+import asyncio
+import threading
+
+
+class Flight:
+    """One LLM call that concurrent identical requests wait on."""
+
+    def __init__(self, key):
+        self.key = key
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._callbacks = []
+        self.result = None
+
+    def _finish(self, result):
+        with self._lock:
+            if self._done.is_set():
+                return
+            self.result = result
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(result)
+
+    def add_done_callback(self, callback):
+        """Call ``callback(result)`` once the flight lands, immediately if it has."""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self.result)
+
+
+class SingleFlight:
+    """Let the first request for a key make the call and the rest share its result.
+
+    :meth:`join` returns the :class:`Flight` for a key and whether the caller
+    leads it.  The leader makes the call and publishes the outcome with
+    :meth:`finish`; followers block in :meth:`wait` (or ``await``
+    :meth:`wait_async`) for at most ``timeout`` seconds.  A result of
+    ``None`` means the leader failed or the wait timed out, and the follower
+    should make its own call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.leaders = 0
+        self.followers = 0
+        self.timeouts = 0
+        self.failures = 0
+
+    def join(self, key):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.followers += 1
+                return flight, False
+            flight = self._flights[key] = Flight(key)
+            self.leaders += 1
+            return flight, True
+
+    def finish(self, flight, result):
+        """Publish ``result`` to the followers of ``flight``; later calls are ignored."""
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            if result is None and not flight._done.is_set():
+                self.failures += 1
+        flight._finish(result)
+
+    def wait(self, flight, timeout):
+        if not flight._done.wait(timeout):
+            with self._lock:
+                self.timeouts += 1
+            return None
+        return flight.result
+
+    async def wait_async(self, flight, timeout):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve(result):
+            if not future.done():
+                future.set_result(result)
+
+        flight.add_done_callback(lambda result: loop.call_soon_threadsafe(resolve, result))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "timeouts": self.timeouts,
+                "failures": self.failures,
+            }
@@ -0,0 +1,144 @@
+"""Frozen route tables compiled from observed replies.
+
+A snapshot file holds the last reply observed for each ``GET``/``HEAD``
+route::
+
+    MAGIC | index offset (8 bytes) | index length (8 bytes) | bodies... | index
+
+The index is JSON mapping ``"METHOD path"`` to ``[status, headers, offset,
+length]``.  :class:`Snapshot` memory-maps the file, so bodies are served as
+slices of the map without being read into the heap.
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from .cache import CACHEABLE_METHODS, CachedReply
+from .replyparser import parse_reply
+from .transcript import read_transcript
+
+MAGIC = b"VSNAP1\n\0"
+_OFFSETS = struct.Struct("<QQ")
+_DATA_START = len(MAGIC) + _OFFSETS.size
+
+
+def prompt_fingerprint(prompt, meta_prompt):
+    """Return the hash a snapshot records for the prompts it was built under."""
+    return hashlib.sha256(json.dumps([prompt, meta_prompt]).encode("utf-8")).hexdigest()
+
+
+def route_key(method, path):
+    """Return the route table key; query parameters are sorted."""
+    parts = urlsplit(path)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return f"{method.upper()} {parts.path or '/'}" + (f"?{query}" if query else "")
+
+
+def routes_from_logs(logs):
+    """Return ``{route_key: CachedReply}`` for the exchanges in ``logs``.
+
+    Only ``GET`` and ``HEAD`` requests are included, and only replies below
+    500; later exchanges for a route replace earlier ones.
+    """
+    routes = {}
+    for entry in logs:
+        if entry.get("type") != "llm_exchange" or not entry.get("request"):
+            continue
+        request_line = entry["request"][-1].get("content", "").split("\n", 1)[0].split()
+        if len(request_line) < 2 or request_line[0] not in CACHEABLE_METHODS:
+            continue
+        reply = parse_reply(entry.get("response") or "")
+        status = reply.status or 200
+        if status >= 500:
+            continue
+        routes[route_key(request_line[0], request_line[1])] = CachedReply(status, reply.headers, bytes(reply.body))
+    return routes
+
+
+def write_snapshot(path, routes, fingerprint):
+    """Write ``routes`` to ``path`` atomically and return the file size."""
+    index = {}
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(MAGIC + _OFFSETS.pack(0, 0))
+        offset = _DATA_START
+        for key, reply in sorted(routes.items()):
+            fh.write(reply.body)
+            index[key] = [reply.status, [list(h) for h in reply.headers], offset, len(reply.body)]
+            offset += len(reply.body)
+        data = json.dumps({"fingerprint": fingerprint, "routes": index}).encode("utf-8")
+        fh.write(data)
+        fh.seek(len(MAGIC))
+        fh.write(_OFFSETS.pack(offset, len(data)))
+    os.replace(tmp, path)
+    return offset + len(data)
+
+
+class Snapshot:
+    """Read-only, memory-mapped route table loaded from :func:`write_snapshot`."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fh:
+            self._map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a VibeStudio snapshot")
+        start, length = _OFFSETS.unpack_from(self._map, len(MAGIC))
+        index = json.loads(self._map[start : start + length])
+        self.fingerprint = index["fingerprint"]
+        self._view = memoryview(self._map)
+        self._routes = {
+            key: CachedReply(status, [tuple(h) for h in headers], self._view[offset : offset + size])
+            for key, (status, headers, offset, size) in index["routes"].items()
+        }
+        self.size = len(self._map)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._routes)
+
+    def get(self, method, path):
+        """Return the frozen reply for a request, ``None`` on a miss.
+
+        ``HEAD`` requests fall back to the ``GET`` route.
+        """
+        reply = self._routes.get(route_key(method, path))
+        if reply is None and method == "HEAD":
+            reply = self._routes.get(route_key("GET", path))
+        with self._lock:
+            if reply is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return reply
+
+    def stats(self):
+        with self._lock:
+            return {"path": self.path, "routes": len(self._routes), "bytes": self.size,
+                    "hits": self.hits, "misses": self.misses}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile a Studio transcript into a frozen snapshot.")
+    parser.add_argument("transcript", help="JSON saved from GET /api/transcript, or an export")
+    parser.add_argument("output", help="snapshot file to write")
+    args = parser.parse_args(argv)
+    transcript = read_transcript(args.transcript)
+    routes = routes_from_logs(transcript.get("logs", []))
+    fingerprint = prompt_fingerprint(transcript.get("prompt", ""), transcript.get("meta_prompt", ""))
+    size = write_snapshot(args.output, routes, fingerprint)
+    print(f"Wrote {len(routes)} routes ({size} bytes) to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
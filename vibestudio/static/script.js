@@ -89,43 +89,70 @@ async function restartServer() {
     body: JSON.stringify({ prompt, meta_prompt }),
   });
   document.getElementById('traffic').textContent = '';
-  logIndex = 0;
   const iframe = document.getElementById('browser');
   const url = 'http://localhost:8000/';
   iframe.src = url;
   document.getElementById('browser-url').value = url;
   browserHistory = [];
-  loadLogs();
 }
 
-let logIndex = 0;
 let browserHistory = [];
 
-async function loadLogs() {
-  const logs = await fetchJson('/api/logs');
-  if (!logs) return;
+function appendTraffic(l) {
   const pre = document.getElementById('traffic');
-  for (let i = logIndex; i < logs.length; i++) {
-    const l = logs[i];
-    if (l.type === 'http') {
-      pre.textContent += `${l.status} ${l.request} -> ${l.response}\n`;
-    } else if (l.type === 'meta_out') {
-      pre.textContent += `>> ${l.text}\n`;
-    } else if (l.type === 'meta_in') {
-      pre.textContent += `<< ${l.text}\n`;
-    } else if (l.type === 'llm_exchange') {
-      pre.textContent += `[LLM REQUEST] ${JSON.stringify(l.request)}\n`;
-      pre.textContent += `[LLM RESPONSE] ${l.response}\n`;
+  if (l.type === 'http') {
+    // Estimated counts are marked with ~, reported ones are exact
+    const t = l.tokens;
+    const tokens = t ? ` [${t.reported ? '' : '~'}${t.input} in, ${t.output} out]` : '';
+    pre.textContent += `${l.status} ${l.request}${tokens} -> ${l.response}\n`;
+    if (t) {
+      const session = t.session !== undefined ? `, ${t.session} this client` : '';
+      document.getElementById('token-total').textContent = `${t.total} tokens${session}`;
     }
+  } else if (l.type === 'meta_out') {
+    pre.textContent += `>> ${l.text}\n`;
+  } else if (l.type === 'meta_in') {
+    pre.textContent += `<< ${l.text}\n`;
+  } else if (l.type === 'llm_exchange') {
+    pre.textContent += `[LLM REQUEST] ${JSON.stringify(l.request)}\n`;
+    pre.textContent += `[LLM RESPONSE] ${l.response}\n`;
+  } else if (l.type === 'trace') {
+    pre.textContent += renderWaterfall(l);
   }
-  logIndex = logs.length;
 }
 
-async function loadMetaChat() {
-  const logs = await fetchJson('/api/meta_logs');
-  if (!logs) return;
+const WATERFALL_WIDTH = 40;
+
+// Draw a request's spans as text bars on a shared time axis
+function renderWaterfall(t) {
+  const total = Math.max(t.duration_ms, 0.001);
+  const scale = WATERFALL_WIDTH / total;
+  let text = `[TRACE] ${t.method} ${t.request} ${t.status} (${t.source}) ${t.duration_ms.toFixed(1)} ms\n`;
+  for (const s of t.spans) {
+    const start = Math.min(Math.floor(s.start_ms * scale), WATERFALL_WIDTH - 1);
+    const width = Math.max(1, Math.min(Math.round(s.duration_ms * scale), WATERFALL_WIDTH - start));
+    const bar = ' '.repeat(start) + '#'.repeat(width) + ' '.repeat(WATERFALL_WIDTH - start - width);
+    text += `  ${s.name.padEnd(16)}|${bar}| ${s.duration_ms.toFixed(1)} ms\n`;
+  }
+  return text;
+}
+
+function appendMetaChat(l) {
   const pre = document.getElementById('meta-chat');
-  pre.textContent = logs.map(l => (l.direction === 'out' ? '>> ' : '<< ') + l.text).join('\n');
+  pre.textContent += (l.direction === 'out' ? '>> ' : '<< ') + l.text + '\n';
+}
+
+function subscribe(url, panelId, append) {
+  const pre = document.getElementById(panelId);
+  pre.textContent = '';
+  const source = new EventSource(url);
+  source.onmessage = (e) => append(JSON.parse(e.data));
+  source.addEventListener('cleared', () => { pre.textContent = ''; });
+  source.addEventListener('missed', (e) => {
+    pre.textContent += `[${JSON.parse(e.data).missed} older entries no longer retained]\n`;
+  });
+  source.onerror = () => console.error('Event stream interrupted', url);
+  return source;
 }
 
 async function sendMeta() {
@@ -138,14 +165,55 @@ async function sendMeta() {
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify({ text }),
   });
-  loadMetaChat();
 }
 
+let testJob = null;
+
+function renderTestJob(tests, status) {
+  let text = `Job ${testJob}: ${status}\n`;
+  for (const t of tests) {
+    const detail = t.duration !== undefined ? ` ${t.duration.toFixed(1)} s${t.cached ? ', cached' : ''}` : '';
+    text += `${t.module}: ${t.status}${detail}\n`;
+  }
+  for (const t of tests) {
+    if (t.output && t.status !== 'passed') {
+      text += `\n== ${t.module}\n${t.output}`;
+    }
+  }
+  document.getElementById('test-output').textContent = text;
+}
+
+// Submit a job, then follow its progress until the final event
 async function runTests() {
-  document.getElementById('test-output').textContent = 'Running...';
-  const data = await fetchJson('/api/run_tests', { method: 'POST' });
-  if (data) {
-    document.getElementById('test-output').textContent = data.output;
+  const force = document.getElementById('force-tests').checked;
+  const job = await fetchJson('/api/test_jobs', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ force }),
+  });
+  if (!job) return;
+  testJob = job.id;
+  const tests = new Map(job.tests.map((t) => [t.module, t]));
+  renderTestJob([...tests.values()], job.status);
+  document.getElementById('cancel-tests').disabled = false;
+  const source = new EventSource(`/api/test_jobs/${job.id}/events`);
+  source.onmessage = (e) => {
+    const event = JSON.parse(e.data);
+    if (event.type === 'test') {
+      tests.set(event.module, event);
+      renderTestJob([...tests.values()], 'running');
+    } else if (event.final) {
+      source.close();
+      renderTestJob([...tests.values()], event.status);
+      document.getElementById('cancel-tests').disabled = true;
+    }
+  };
+  source.onerror = () => source.close();
+}
+
+async function cancelTests() {
+  if (testJob !== null) {
+    await fetchJson(`/api/test_jobs/${testJob}/cancel`, { method: 'POST' });
   }
 }
 
@@ -159,6 +227,25 @@ async function copyTranscript() {
   }
 }
 
+// Route hits first, then the counters of every enabled component
+async function showStats() {
+  const data = await fetchJson('/api/stats');
+  if (!data) return;
+  let text = '';
+  if (data.routes) {
+    text += `Routes: ${data.routes.hits} answered without the model, ${data.routes.misses} passed on\n`;
+    for (const r of data.routes.table) {
+      text += `  ${String(r.hits).padStart(6)}  ${r.method.padEnd(9)} ${r.path} (${r.kind})\n`;
+    }
+  }
+  for (const [name, stats] of Object.entries(data)) {
+    if (stats && name !== 'routes') {
+      text += `${name}: ${JSON.stringify(stats)}\n`;
+    }
+  }
+  document.getElementById('stats').textContent = text;
+}
+
 function navigateBrowser() {
   const input = document.getElementById('browser-url');
   const url = input.value.trim();
@@ -183,16 +270,18 @@ window.addEventListener('load', () => {
   loadPrompt();
   loadMetaPrompt();
   loadSettings();
-  loadLogs();
-  loadMetaChat();
+  subscribe('/api/logs/events', 'traffic', appendTraffic);
+  subscribe('/api/meta_logs/events', 'meta-chat', appendMetaChat);
   document.getElementById('save-prompt').addEventListener('click', savePrompt);
   document.getElementById('save-meta').addEventListener('click', saveMetaPrompt);
   document.getElementById('restart-server').addEventListener('click', restartServer);
   document.getElementById('run-tests').addEventListener('click', runTests);
+  document.getElementById('cancel-tests').addEventListener('click', cancelTests);
   document.getElementById('send-meta').addEventListener('click', sendMeta);
   document.getElementById('save-settings').addEventListener('click', saveSettings);
   const ct = document.getElementById('copy-transcript');
   if (ct) ct.addEventListener('click', copyTranscript);
+  document.getElementById('show-stats').addEventListener('click', showStats);
   document.getElementById('prompt-chooser').addEventListener('change', (e) => {
     if (e.target.value) {
       document.getElementById('prompt').value = e.target.value;
@@ -205,6 +294,4 @@ window.addEventListener('load', () => {
       navigateBrowser();
     }
   });
-  setInterval(loadLogs, 2000);
-  setInterval(loadMetaChat, 2000);
 });
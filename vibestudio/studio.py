@@ -1,15 +1,44 @@
+import contextlib
+import contextvars
+import functools
 import json
 import os
+import queue
+import socket
+import tempfile
 import threading
-import subprocess
+import sys
+import time
 import logging
+from collections import namedtuple
 from http.server import (
     BaseHTTPRequestHandler,
     SimpleHTTPRequestHandler,
     ThreadingHTTPServer,
     HTTPServer,
 )
-from urllib.parse import urlparse
+from urllib.parse import parse_qs, urlparse
+
+from .backends import create_backend
+from .budget import TokenLedger
+from .cache import CACHEABLE_METHODS, CachedReply, ResponseCache, request_key
+from .chain import ResponseChain
+from .context import ContextWindow
+from . import metrics, transcript
+from .logbuffer import CLEARED, LogBuffer
+from .metrics import CallbackGauge, Counter, ProxyMetrics, Registry
+from .prefetch import Prefetcher, extract_links
+from .replyparser import ReplyParser, get_header, parse_reply
+from .resilience import CallPolicy, LLMError, lingering_attempts
+from .routes import load_routes as _load_route_table
+from .scheduler import CallScheduler, Overloaded
+from .sessions import SessionManager, session_cookie
+from .sharedstate import LogTailer, SharedConversation, SharedLog, SharedState
+from .testjobs import TestRunner, config_fingerprint
+from .singleflight import SingleFlight
+from .snapshot import Snapshot, prompt_fingerprint, routes_from_logs, write_snapshot
+from .tokens import estimate_text_tokens, estimate_tokens
+from .tracestore import TraceReplayer, TraceStore
 
 try:
     import openai
@@ -30,6 +59,27 @@ META_PROMPT_FILE = os.path.join(HERE, "meta_prompt.txt")
 
 DEFAULT_PROMPT = "Echo the following HTTP path and query exactly:\n{path}"
 
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    """Return ``True`` when environment variable ``name`` is set to a truthy value."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_number(name, default, cast=int):
+    """Return environment variable ``name`` converted with ``cast``."""
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return cast(value)
+    except ValueError:
+        LOGGER.warning("Ignoring invalid %s=%r", name, value)
+        return default
+
+
 def _load_file(path: str, default: str) -> str:
     if not os.path.exists(path):
         with open(path, "w", encoding="utf-8") as fh:
@@ -52,35 +102,630 @@ MODEL_FILE = os.path.join(HERE, "model.txt")
 MODEL = _load_file(MODEL_FILE, os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")).strip()
 TEMPERATURE = ""
 THINKING_TIME = ""
-LOGS = []
-META_LOGS = []
+# Bumped whenever the prompts or settings change; see _config()
+CONFIG_VERSION = 1
+# Relay reply bodies to the client as the model generates them
+STREAMING = _env_flag("VIBESTUDIO_STREAMING")
+# "openai", "compatible" (OpenAI-compatible server at OPENAI_BASE_URL) or "mock"
+BACKEND = os.getenv("VIBESTUDIO_BACKEND", "openai")
+_BACKEND_INSTANCE = None
+_BACKEND_KEY = None
+_BACKEND_LOCK = threading.Lock()
+# "threading" (ThreadingHTTPServer) or "asyncio" (vibestudio.aioproxy)
+PROXY_ENGINE = os.getenv("VIBESTUDIO_PROXY_ENGINE", "threading")
+# Opt-in cache of GET/HEAD replies, invalidated whenever the prompts change
+RESPONSE_CACHE = (
+    ResponseCache(
+        max_entries=_env_number("VIBESTUDIO_CACHE_ENTRIES", 256),
+        ttl=_env_number("VIBESTUDIO_CACHE_TTL", 300.0, float),
+        max_bytes=_env_number("VIBESTUDIO_CACHE_MAX_BYTES", 16 * 1024 * 1024),
+    )
+    if _env_flag("VIBESTUDIO_RESPONSE_CACHE")
+    else None
+)
+# Opt-in sharing of one LLM call between identical concurrent GET/HEAD requests
+COALESCER = SingleFlight() if _env_flag("VIBESTUDIO_COALESCE") else None
+# Seconds a coalesced request waits before making its own call
+COALESCE_WAIT = _env_number("VIBESTUDIO_COALESCE_WAIT", 30.0, float)
+# Opt-in speculative generation of the pages linked from served HTML
+PREFETCHER = (
+    Prefetcher(
+        workers=_env_number("VIBESTUDIO_PREFETCH_WORKERS", 2),
+        fanout=_env_number("VIBESTUDIO_PREFETCH_FANOUT", 3),
+        token_budget=_env_number("VIBESTUDIO_PREFETCH_TOKENS_PER_MIN", 50000),
+        ttl=_env_number("VIBESTUDIO_PREFETCH_TTL", 60.0, float),
+    )
+    if _env_flag("VIBESTUDIO_PREFETCH")
+    else None
+)
+# Seconds a request waits for a prefetch of the same page already under way
+PREFETCH_WAIT = _env_number("VIBESTUDIO_PREFETCH_WAIT", 30.0, float)
+# Deadlines, retries and hedging of LLM calls; by default one unbounded attempt
+LLM_POLICY = CallPolicy(
+    timeout=_env_number("VIBESTUDIO_LLM_TIMEOUT", 0.0, float),
+    retries=_env_number("VIBESTUDIO_LLM_RETRIES", 0),
+    backoff=_env_number("VIBESTUDIO_LLM_BACKOFF", 0.5, float),
+    hedge=_env_flag("VIBESTUDIO_LLM_HEDGE"),
+    hedge_after=_env_number("VIBESTUDIO_LLM_HEDGE_AFTER", 2.0, float),
+)
+# Opt-in cap on concurrent LLM calls; the excess queues by priority or gets a 503
+SCHEDULER = (
+    CallScheduler(
+        max_concurrent=_env_number("VIBESTUDIO_MAX_CONCURRENT_LLM", 0),
+        max_queue=_env_number("VIBESTUDIO_LLM_QUEUE", 64),
+        timeout=_env_number("VIBESTUDIO_LLM_QUEUE_TIMEOUT", 30.0, float),
+    )
+    if _env_number("VIBESTUDIO_MAX_CONCURRENT_LLM", 0) > 0
+    else None
+)
+# Freeze mode: serve routes from this snapshot file and the LLM only on misses
+FREEZE_PATH = os.getenv("VIBESTUDIO_FREEZE")
+FROZEN = None
+# Opt-in table answering favicon, robots.txt, preflights and HEAD without the LLM
+ROUTES_PATH = os.getenv("VIBESTUDIO_ROUTES")
+ROUTES = None
+# Opt-in persistent trace of every exchange, written by a background thread
+TRACE_STORE = TraceStore(os.environ["VIBESTUDIO_TRACE"]) if os.getenv("VIBESTUDIO_TRACE") else None
+# Replay mode: answer requests with the replies recorded in this trace
+TRACE_REPLAY = TraceReplayer(os.environ["VIBESTUDIO_REPLAY"]) if os.getenv("VIBESTUDIO_REPLAY") else None
+# Prometheus metrics, served at /api/metrics and optionally on the proxy
+METRICS = Registry()
+PROXY_METRICS = ProxyMetrics(METRICS)
+STUDIO_REQUESTS = METRICS.register(
+    Counter("vibestudio_studio_requests_total", "Studio dashboard and API requests.", ("method", "status"))
+)
+PROXY_METRICS_PATH = os.getenv("VIBESTUDIO_PROXY_METRICS_PATH")
+# Opt-in per-request span timelines, logged as ``trace`` entries
+TRACE_SPANS = _env_flag("VIBESTUDIO_TRACE_SPANS")
+# Opt-in proxy worker processes; conversations and logs then live in a file
+# shared with the Studio (see attach_shared_state)
+PROXY_WORKERS = _env_number("VIBESTUDIO_PROXY_WORKERS", 0)
+SHARED_STATE_PATH = os.getenv("VIBESTUDIO_SHARED_STATE")
+SHARED_STATE = None
+WORKER_PROCESS = False
+_SHARED_GENERATION = 0
+_LOG_TAILER = None
+# Traffic and meta chat history, bounded ring buffers read with ?since= cursors
+LOG_CAPACITY = _env_number("VIBESTUDIO_LOG_CAPACITY", 10000)
+_LOG_SPILL = os.getenv("VIBESTUDIO_LOG_SPILL")
+LOGS = LogBuffer(LOG_CAPACITY, _LOG_SPILL)
+META_LOGS = LogBuffer(LOG_CAPACITY, _LOG_SPILL + ".meta" if _LOG_SPILL else None)
+# Server-Sent Events: seconds between keep-alive comments and per-client backlog
+SSE_HEARTBEAT = 15.0
+SSE_QUEUE_SIZE = 1000
+
+TEST_RUNNER = TestRunner(
+    REPO_ROOT,
+    workers=_env_number("VIBESTUDIO_TEST_WORKERS", 4),
+    timeout=_env_number("VIBESTUDIO_TEST_TIMEOUT", 300.0, float),
+)
 _SERVER_THREAD = None
 CONVERSATION = []
-PREVIOUS_RESPONSE_ID = None
+# What the provider holds for the shared conversation's previous_response_id
+RESPONSE_CHAIN = ResponseChain()
 STATE_LOCK = threading.Lock()
 
+def _new_session_conversation():
+    """Start a session from the shared prompts and meta chat history."""
+    with STATE_LOCK:
+        return list(CONVERSATION)
+
+
+# Opt-in per-client conversations; CONVERSATION then only holds the prompts
+# and meta chat that every new session starts from
+SESSIONS = (
+    SessionManager(
+        _new_session_conversation,
+        idle_timeout=_env_number("VIBESTUDIO_SESSION_IDLE", 1800.0, float),
+        max_sessions=_env_number("VIBESTUDIO_MAX_SESSIONS", 100),
+    )
+    if _env_flag("VIBESTUDIO_SESSIONS")
+    else None
+)
+
+
+# Opt-in context budget; older exchanges are compacted once it is exceeded
+CONTEXT_WINDOW = (
+    ContextWindow(
+        max_messages=_env_number("VIBESTUDIO_CONTEXT_MAX_MESSAGES", 0),
+        max_tokens=_env_number("VIBESTUDIO_CONTEXT_MAX_TOKENS", 0),
+        policy=os.getenv("VIBESTUDIO_CONTEXT_POLICY", "summarize"),
+    )
+    if _env_number("VIBESTUDIO_CONTEXT_MAX_MESSAGES", 0) or _env_number("VIBESTUDIO_CONTEXT_MAX_TOKENS", 0)
+    else None
+)
+# Token accounting is always on; the budgets are opt-in
+TOKEN_LEDGER = TokenLedger(
+    context_budget=_env_number("VIBESTUDIO_TOKEN_BUDGET_CONTEXT", 0),
+    session_budget=_env_number("VIBESTUDIO_TOKEN_BUDGET_SESSION", 0),
+    global_budget=_env_number("VIBESTUDIO_TOKEN_BUDGET_GLOBAL", 0),
+    window=_env_number("VIBESTUDIO_TOKEN_BUDGET_WINDOW", 3600.0, float),
+    action=os.getenv("VIBESTUDIO_TOKEN_BUDGET_ACTION", "warn"),
+)
+# Compact on a worker thread so requests never wait for it
+CONTEXT_BACKGROUND = _env_flag("VIBESTUDIO_CONTEXT_BACKGROUND", True)
+_COMPACTION_QUEUE = queue.Queue()
+_COMPACTION_PENDING = set()
+_COMPACTION_THREAD = None
+# Serialises compactions; a second one must not write back a stale snapshot
+_COMPACTION_LOCK = threading.Lock()
+
+
+def _compact_conversation(conversation, window=None):
+    """Compact ``conversation`` in place if it exceeds the context budget, or ``window``'s."""
+    window = window or CONTEXT_WINDOW
+
+    def compact(messages):
+        return window.compact(messages) if window.over_budget(messages) else None
+
+    if isinstance(conversation, SharedConversation):
+        # Other processes write too; a snapshot could be stale once written back
+        snapshot, compacted = conversation.rewrite(compact)
+    else:
+        with _COMPACTION_LOCK:
+            with STATE_LOCK:
+                snapshot = list(conversation)
+            compacted = compact(snapshot)
+            if compacted is not None:
+                with STATE_LOCK:
+                    # Messages appended meanwhile stay after the compacted prefix
+                    conversation[:len(snapshot)] = compacted
+    if compacted is None:
+        return
+    LOGGER.info("Compacted conversation from %d to %d messages", len(snapshot), len(compacted))
+
+
+def _compaction_worker():
+    while True:
+        conversation = _COMPACTION_QUEUE.get()
+        with STATE_LOCK:
+            _COMPACTION_PENDING.discard(id(conversation))
+        try:
+            _compact_conversation(conversation)
+        except Exception:
+            LOGGER.exception("Conversation compaction failed")
+
+
+def _schedule_compaction(conversation):
+    """Queue ``conversation`` for compaction when a context budget is set."""
+    global _COMPACTION_THREAD
+    if CONTEXT_WINDOW is None:
+        return
+    if not CONTEXT_BACKGROUND:
+        _compact_conversation(conversation)
+        return
+    with STATE_LOCK:
+        if id(conversation) in _COMPACTION_PENDING:
+            return
+        _COMPACTION_PENDING.add(id(conversation))
+        if _COMPACTION_THREAD is None:
+            _COMPACTION_THREAD = threading.Thread(target=_compaction_worker, daemon=True)
+            _COMPACTION_THREAD.start()
+    _COMPACTION_QUEUE.put(conversation)
+
+
 def _reset_conversation():
     """Initialise the conversation with the active prompts."""
-    global CONVERSATION, PREVIOUS_RESPONSE_ID
-    CONVERSATION = [
+    global CONVERSATION
+    initial = [
         {"role": "system", "content": f"{{{{{META_PROMPT}}}}}"},
         {"role": "user", "content": f"{{{{{PROMPT}}}}}"},
     ]
-    PREVIOUS_RESPONSE_ID = None
+    if SHARED_STATE is not None:
+        CONVERSATION.reset(initial)
+        SHARED_STATE.drop_sessions()
+    else:
+        CONVERSATION = initial
+    RESPONSE_CHAIN.reset()
+    if SESSIONS is not None:
+        SESSIONS.reset()
     META_LOGS.append({"direction": "out", "text": META_PROMPT})
     LOGS.append({"type": "meta_out", "text": META_PROMPT})
     META_LOGS.append({"direction": "out", "text": PROMPT})
     LOGS.append({"type": "meta_out", "text": PROMPT})
 
 
+# Where ``_swap_config(persist=True)`` saves each change
+_CONFIG_FILES = {"prompt": PROMPT_FILE, "meta_prompt": META_PROMPT_FILE, "model": MODEL_FILE}
+# Orders swaps, so the files and the proxy workers end up on the latest one
+_SWAP_LOCK = threading.Lock()
+
+
+def _swap_config(reset=False, persist=False, **changes):
+    """Apply new prompts or settings as one versioned change and return its version.
+
+    With ``reset`` the logs and conversation start over too, in the same
+    step, so a request sees either the old or the new configuration whole.
+    With ``persist`` the prompts and model are saved to their files first.
+    Swaps are ordered by their own lock, so concurrent ones cannot leave the
+    files or the proxy workers on an older version.  ``STATE_LOCK`` is only
+    held to swap the values and invalidate the caches; requests do not wait
+    for the files or the shared state to be written.
+    """
+    global PROMPT, META_PROMPT, MODEL, TEMPERATURE, THINKING_TIME, CONFIG_VERSION
+    with _SWAP_LOCK:
+        if persist:
+            for name, value in changes.items():
+                if name in _CONFIG_FILES:
+                    with open(_CONFIG_FILES[name], "w", encoding="utf-8") as fh:
+                        fh.write(value)
+        with STATE_LOCK:
+            PROMPT = changes.get("prompt", PROMPT)
+            META_PROMPT = changes.get("meta_prompt", META_PROMPT)
+            MODEL = changes.get("model", MODEL)
+            TEMPERATURE = changes.get("temperature", TEMPERATURE)
+            THINKING_TIME = changes.get("thinking_time", THINKING_TIME)
+            if reset:
+                LOGS.clear()
+                META_LOGS.clear()
+                _reset_conversation()
+            CONFIG_VERSION += 1
+            version = CONFIG_VERSION
+            _invalidate_caches()
+        _publish_config()
+        return version
+
+
+def get_backend():
+    """Return the shared LLM backend, creating it on first use.
+
+    The backend is rebuilt only when its configuration changes, so its
+    client and connection pool are reused across requests and threads.
+    """
+    global _BACKEND_INSTANCE, _BACKEND_KEY
+    key = (BACKEND, id(openai), os.getenv("OPENAI_API_KEY"), os.getenv("OPENAI_BASE_URL"))
+    with _BACKEND_LOCK:
+        if _BACKEND_INSTANCE is None or _BACKEND_KEY != key:
+            _BACKEND_INSTANCE = create_backend(
+                BACKEND,
+                module=openai,
+                api_key=os.getenv("OPENAI_API_KEY"),
+                base_url=os.getenv("OPENAI_BASE_URL"),
+                script_path=os.getenv("VIBESTUDIO_MOCK_SCRIPT"),
+                latency=_env_number("VIBESTUDIO_MOCK_LATENCY", 0.0, float),
+                tokens_per_second=_env_number("VIBESTUDIO_MOCK_TOKENS_PER_SEC", 0.0, float),
+            )
+            _BACKEND_KEY = key
+        return _BACKEND_INSTANCE
+
+
+def _invalidate_caches():
+    """Forget replies generated under the previous prompts or model."""
+    global FROZEN
+    if RESPONSE_CACHE is not None:
+        RESPONSE_CACHE.invalidate()
+    if PREFETCHER is not None:
+        PREFETCHER.invalidate()
+    frozen = FROZEN
+    if frozen is not None and frozen.fingerprint != prompt_fingerprint(PROMPT, META_PROMPT):
+        LOGGER.info("Prompts changed, no longer serving snapshot %s", frozen.path)
+        FROZEN = None
+
+
+def attach_shared_state(path, worker=False):
+    """Keep the conversations in the shared state file at ``path``.
+
+    The Studio process moves the log entries written by workers into its
+    own logs.  A ``worker`` process writes its logs to the file instead and
+    follows the configuration the Studio publishes.
+    """
+    global SHARED_STATE, WORKER_PROCESS, CONVERSATION, LOGS, META_LOGS, _LOG_TAILER
+    SHARED_STATE = SharedState(path)
+    WORKER_PROCESS = worker
+    CONVERSATION = SHARED_STATE.conversation()
+    if SESSIONS is not None:
+        SESSIONS.bind = SHARED_STATE.conversation
+        SESSIONS.resume = _resume_session
+        SESSIONS.drop = SHARED_STATE.drop_session
+    if worker:
+        LOGS = SharedLog(SHARED_STATE, "traffic")
+        META_LOGS = SharedLog(SHARED_STATE, "meta")
+        _sync_shared_config()
+    elif _LOG_TAILER is None:
+        _LOG_TAILER = LogTailer(SHARED_STATE, _tail_log)
+        _LOG_TAILER.start()
+    LOGGER.info("Sharing state through %s", path)
+
+
+def _resume_session(session_id):
+    if SHARED_STATE.has_conversation(session_id, SESSIONS.idle_timeout):
+        return SHARED_STATE.conversation(session_id)
+    return None
+
+
+def _tail_log(log, entry):
+    with STATE_LOCK:
+        (META_LOGS if log == "meta" else LOGS).append(entry)
+
+
+def _publish_config():
+    """Hand the current prompts and model to the proxy workers."""
+    if SHARED_STATE is None or WORKER_PROCESS:
+        return
+    SHARED_STATE.publish(
+        prompt=PROMPT, meta_prompt=META_PROMPT, model=MODEL, temperature=TEMPERATURE, thinking_time=THINKING_TIME
+    )
+
+
+def _sync_shared_config():
+    """In a worker, adopt the configuration last published by the Studio."""
+    global PROMPT, META_PROMPT, MODEL, TEMPERATURE, THINKING_TIME, CONFIG_VERSION, _SHARED_GENERATION
+    if not WORKER_PROCESS or SHARED_STATE.generation() == _SHARED_GENERATION:
+        return
+    generation, config = SHARED_STATE.config()
+    with STATE_LOCK:
+        if generation == _SHARED_GENERATION:
+            return
+        _SHARED_GENERATION = generation
+        CONFIG_VERSION += 1
+        PROMPT = config.get("prompt", PROMPT)
+        META_PROMPT = config.get("meta_prompt", META_PROMPT)
+        MODEL = config.get("model", MODEL)
+        TEMPERATURE = config.get("temperature", TEMPERATURE)
+        THINKING_TIME = config.get("thinking_time", THINKING_TIME)
+    # The Studio may have reset the conversations, start over from the store
+    RESPONSE_CHAIN.reset()
+    if SESSIONS is not None:
+        SESSIONS.reset()
+    _invalidate_caches()
+    LOGGER.info("Using configuration %d published by the Studio", generation)
+
+
+def load_snapshot(path=None):
+    """Serve frozen routes from ``path`` (default ``VIBESTUDIO_FREEZE``).
+
+    A snapshot built under other prompts is not loaded.  Returns the loaded
+    :class:`Snapshot` or ``None``.
+    """
+    global FROZEN
+    path = path or FREEZE_PATH
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        snapshot = Snapshot(path)
+    except (OSError, ValueError) as exc:
+        LOGGER.error("Could not load snapshot %s: %s", path, exc)
+        return None
+    if snapshot.fingerprint != prompt_fingerprint(PROMPT, META_PROMPT):
+        LOGGER.warning("Snapshot %s was built under other prompts, ignoring it", path)
+        return None
+    LOGGER.info("Serving %d frozen routes from %s", len(snapshot), path)
+    FROZEN = snapshot
+    return snapshot
+
+
+def _head_reply(method, path, headers):
+    """Answer ``HEAD`` with the headers of a stored ``GET`` reply; ``None`` asks the model."""
+    frozen = FROZEN
+    reply = frozen.get("GET", path) if frozen is not None else None
+    if reply is None:
+        _, reply = _cache_lookup("GET", path, headers, count=False)
+    return reply
+
+
+def load_routes(path=None):
+    """Answer trivial requests from the route table at ``path`` (default ``VIBESTUDIO_ROUTES``).
+
+    Returns the loaded :class:`~vibestudio.routes.RouteTable` or ``None``.
+    """
+    global ROUTES
+    path = path or ROUTES_PATH
+    if not path:
+        return None
+    try:
+        table = _load_route_table(path, {"head": _head_reply})
+    except (OSError, ValueError, ImportError, AttributeError) as exc:
+        LOGGER.error("Could not load routes %s: %s", path, exc)
+        return None
+    LOGGER.info("Answering %d routes without the model", len(table))
+    ROUTES = table
+    return table
+
+
+def freeze(path):
+    """Write the GET/HEAD replies in the Traffic log to a snapshot at ``path``."""
+    with STATE_LOCK:
+        logs = list(LOGS)
+        fingerprint = prompt_fingerprint(PROMPT, META_PROMPT)
+    routes = routes_from_logs(logs)
+    size = write_snapshot(path, routes, fingerprint)
+    LOGGER.info("Froze %d routes (%d bytes) to %s", len(routes), size, path)
+    return {"path": path, "routes": len(routes), "bytes": size}
+
+
+def _component_stats():
+    """Return the numeric ``_stats()`` counters as metric samples."""
+    samples = []
+    for component, stats in _stats().items():
+        for name, value in (stats or {}).items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                samples.append(((component, name), value))
+    return samples
+
+
+METRICS.register(CallbackGauge(
+    "vibestudio_log_entries", "Entries retained in the Studio logs.",
+    lambda: [(("traffic",), len(LOGS)), (("meta",), len(META_LOGS))], ("log",),
+))
+METRICS.register(CallbackGauge(
+    "vibestudio_conversation_messages", "Messages in the shared conversation.", lambda: len(CONVERSATION),
+))
+METRICS.register(CallbackGauge(
+    "vibestudio_component_stat", "Counters of the optional proxy components, as in /api/stats.",
+    _component_stats, ("component", "stat"),
+))
+
+
+ProxyConfig = namedtuple(
+    "ProxyConfig", "version prompt meta_prompt model temperature thinking_time conversation"
+)
+_REQUEST_CONFIG = contextvars.ContextVar("vibestudio_request_config", default=None)
+# The client a proxy request is accounted to and the usage its LLM call
+# reported; a dict, so worker threads started for the request can fill it in
+_REQUEST_USAGE = contextvars.ContextVar("vibestudio_request_usage", default=None)
+
+
+def _current_config():
+    return ProxyConfig(CONFIG_VERSION, PROMPT, META_PROMPT, MODEL, TEMPERATURE, THINKING_TIME, CONVERSATION)
+
+
+def _config():
+    """Return the configuration of the request being served, else the current one.
+
+    A proxy request keeps the prompts, model and shared conversation it
+    started with, so it finishes on that version even when the Studio swaps
+    in a new one meanwhile.
+    """
+    return _REQUEST_CONFIG.get() or _current_config()
+
+
+def _config_current():
+    """Whether the request being served runs on the latest configuration."""
+    config = _REQUEST_CONFIG.get()
+    if config is None:
+        return True
+    if WORKER_PROCESS:
+        _sync_shared_config()
+    return config.version == CONFIG_VERSION
+
+
+def _pin_config():
+    """Return the configuration a new request runs on; may wait on the shared state."""
+    if WORKER_PROCESS:
+        _sync_shared_config()
+    with STATE_LOCK:
+        return _current_config()
+
+
+def _begin_request(method, path, config=None):
+    """Start timing a proxy request and pin its configuration; pair with :func:`_end_request`.
+
+    ``config`` defaults to :func:`_pin_config`.
+    """
+    if config is None:
+        config = _pin_config()
+    timer, token = PROXY_METRICS.start(method, path, TRACE_SPANS)
+    return timer, (token, _REQUEST_CONFIG.set(config), _REQUEST_USAGE.set({}))
+
+
+def _end_request(timer, tokens, log=True):
+    """Finish a request; its trace entry is logged, or returned when ``log`` is off."""
+    token, config_token, usage_token = tokens
+    _REQUEST_CONFIG.reset(config_token)
+    _REQUEST_USAGE.reset(usage_token)
+    end = PROXY_METRICS.finish(timer, token)
+    if timer.spans is None:
+        return None
+    entry = metrics.trace_entry(timer, end)
+    if not log:
+        return entry
+    _log_entry(entry)
+    return None
+
+
+def _log_entry(entry):
+    with STATE_LOCK:
+        LOGS.append(entry)
+
+
+def _metrics_reply():
+    body = METRICS.render().encode("utf-8")
+    return CachedReply(200, [("Content-Type", "text/plain; version=0.0.4; charset=utf-8")], body)
+
+
+def _fixed_reply(method, path, headers):
+    """Return ``(reply, source)`` from the route table, the frozen snapshot or the replayed trace."""
+    routes = ROUTES
+    if routes is not None:
+        reply = routes.get(method, path, headers)
+        if reply is not None:
+            return reply, "routed"
+    frozen = FROZEN
+    if frozen is not None:
+        reply = frozen.get(method, path)
+        if reply is not None:
+            return reply, "frozen"
+    if TRACE_REPLAY is not None:
+        reply = TRACE_REPLAY.get(method, path)
+        if reply is not None:
+            return reply, "replayed"
+    return None, None
+
+
+def _append_request(conversation, request_text):
+    """Add the request to the conversation and return the messages to send."""
+    waited = time.monotonic()
+    with STATE_LOCK:
+        locked = time.monotonic()
+        message = {"role": "user", "content": request_text}
+        if isinstance(conversation, SharedConversation):
+            # Other processes append too; read back in the same transaction
+            llm_request = conversation.append_and_read(message)
+        else:
+            conversation.append(message)
+            llm_request = list(conversation)
+    metrics.add_span("lock", waited, locked)
+    metrics.add_span("assemble", locked, time.monotonic())
+    return llm_request
+
+
+def _stream_spans(started, first_chunk):
+    """Record the model's time to first token and its generation time."""
+    if first_chunk is not None:
+        metrics.add_span("llm.first_token", started, first_chunk)
+        metrics.add_span("llm.stream", first_chunk, time.monotonic())
+
+
+def _timings(started, first_chunk=None):
+    """Return the LLM call timings recorded with an exchange, in milliseconds."""
+    timings = {"llm_ms": round((time.monotonic() - started) * 1000, 3)}
+    if first_chunk is not None:
+        timings["first_chunk_ms"] = round((first_chunk - started) * 1000, 3)
+    return timings
+
+
+def _stats():
+    """Return counters for the optional proxy components."""
+    return {
+        "cache": RESPONSE_CACHE.stats() if RESPONSE_CACHE is not None else None,
+        "sessions": SESSIONS.stats() if SESSIONS is not None else None,
+        "context": CONTEXT_WINDOW.stats() if CONTEXT_WINDOW is not None else None,
+        "chain": RESPONSE_CHAIN.stats(),
+        "llm": LLM_POLICY.stats(),
+        "coalesce": COALESCER.stats() if COALESCER is not None else None,
+        "prefetch": PREFETCHER.stats() if PREFETCHER is not None else None,
+        "routes": ROUTES.stats() if ROUTES is not None else None,
+        "frozen": FROZEN.stats() if FROZEN is not None else None,
+        "trace": TRACE_STORE.stats() if TRACE_STORE is not None else None,
+        "replay": TRACE_REPLAY.stats() if TRACE_REPLAY is not None else None,
+        "workers": _SERVER_THREAD.stats() if PROXY_WORKERS and _SERVER_THREAD is not None else None,
+        "scheduler": SCHEDULER.stats() if SCHEDULER is not None else None,
+        "tests": TEST_RUNNER.stats(),
+        "config": {"version": CONFIG_VERSION},
+        "tokens": TOKEN_LEDGER.stats(),
+    }
+
+
 def _start_proxy_server():
     """(Re)start the background proxy server."""
     global _SERVER_THREAD
     if _SERVER_THREAD is not None:
         _SERVER_THREAD.stop()
         _SERVER_THREAD.join()
-    LOGGER.info("Starting proxy server thread")
-    _SERVER_THREAD = _ProxyServerThread()
+    if PROXY_WORKERS:
+        from .workers import WorkerPool
+
+        _SERVER_THREAD = WorkerPool(PROXY_WORKERS, SHARED_STATE.path, engine=PROXY_ENGINE)
+        _SERVER_THREAD.start()
+        return
+    LOGGER.info("Starting %s proxy server thread", PROXY_ENGINE)
+    if PROXY_ENGINE == "asyncio":
+        from .aioproxy import AsyncProxyServerThread
+
+        # Pass this module explicitly: under ``python -m`` it is ``__main__``
+        _SERVER_THREAD = AsyncProxyServerThread(sys.modules[__name__])
+    else:
+        _SERVER_THREAD = _ProxyServerThread()
     _SERVER_THREAD.start()
 
 
@@ -95,157 +740,655 @@ def gather_examples():
             test_file = os.path.join(examples_dir, f"test_{filename}")
             prompt_file = os.path.join(examples_dir, f"{name}_prompt.txt")
             test_cmd = None
+            test_module = None
             prompt = None
             if os.path.exists(test_file):
                 test_mod = os.path.splitext(os.path.basename(test_file))[0]
-                test_cmd = f"python -m unittest examples.{test_mod}"
+                test_module = f"examples.{test_mod}"
+                test_cmd = f"python -m unittest {test_module}"
             if os.path.exists(prompt_file):
                 with open(prompt_file, "r", encoding="utf-8") as fh:
                     prompt = fh.read()
-            items.append({"name": name, "run": run_cmd, "test": test_cmd, "prompt": prompt})
+            items.append({"name": name, "run": run_cmd, "test": test_cmd, "test_module": test_module, "prompt": prompt})
     return items
 
 
+def _test_modules():
+    """Return ``{module: source_path}`` for the example tests."""
+    return {
+        ex["test_module"]: os.path.join(REPO_ROOT, *ex["test_module"].split(".")) + ".py"
+        for ex in gather_examples()
+        if ex["test_module"]
+    }
+
+
+def submit_tests(modules=None, force=False):
+    """Start a test job for ``modules`` (default: every example test).
+
+    Raises ``KeyError`` for a module that is not an example test.
+    """
+    available = _test_modules()
+    names = sorted(available) if modules is None else list(modules)
+    selected = [(name, available[name]) for name in names]
+    with STATE_LOCK:
+        fingerprint = config_fingerprint(PROMPT, META_PROMPT, MODEL)
+    return TEST_RUNNER.submit(selected, fingerprint, force)
+
+
+def build_request_text(command, path, headers, body=b""):
+    """Return the raw HTTP request text forwarded to the LLM."""
+    request_lines = [f"{command} {path} HTTP/1.1"]
+    for k, v in headers.items():
+        request_lines.append(f"{k}: {v}")
+    request_lines.append("")
+    if body:
+        request_lines.append(body.decode("utf-8", "replace"))
+    return "\n".join(request_lines)
+
+
+# Framing headers are recomputed by the proxy when streaming
+_HOP_BY_HOP_HEADERS = {"content-length", "transfer-encoding", "connection"}
+
+
+def _resolve_session(headers):
+    """Return ``(session, conversation, set_cookie)`` for a request."""
+    if SESSIONS is None:
+        return None, _config().conversation, None
+    session, created = SESSIONS.lookup(headers)
+    return session, session.conversation, session_cookie(session) if created else None
+
+
+def _cache_lookup(method, path, headers, count=True):
+    """Return ``(cache_key, cached_reply)``; the key is ``None`` when not cacheable.
+
+    ``count=False`` leaves the hit and miss counters alone, for lookups made
+    on behalf of another method.
+    """
+    if RESPONSE_CACHE is None or method not in CACHEABLE_METHODS:
+        return None, None
+    config = _config()
+    cache_key = request_key(config.prompt, config.meta_prompt, config.model, method, path, headers)
+    return cache_key, RESPONSE_CACHE.get(cache_key) if count else RESPONSE_CACHE.peek(cache_key)
+
+
+def _cache_store(cache_key, status, headers, body):
+    if cache_key is None or status >= 400:
+        return
+    if "no-store" in get_header(headers, "Cache-Control", ""):
+        return
+    RESPONSE_CACHE.put(cache_key, status, list(headers), bytes(body))
+
+
+def _session_key(method, path, headers, session):
+    """Return the request key, scoped to the session's own conversation."""
+    config = _config()
+    key = request_key(config.prompt, config.meta_prompt, config.model, method, path, headers)
+    return f"{session.id}:{key}" if session is not None else key
+
+
+def _coalesce_join(method, path, headers, session):
+    """Return ``(flight, leader)``; the flight is ``None`` when not coalescing."""
+    if COALESCER is None or method not in CACHEABLE_METHODS:
+        return None, True
+    return COALESCER.join(_session_key(method, path, headers, session))
+
+
+# Where a freshly generated reply goes besides the client: the response cache
+# key, the coalescing flight and the request it may prefetch links for
+ReplyTargets = namedtuple("ReplyTargets", "cache_key flight prefetch")
+# The request that produced a page: (path, headers, session, conversation)
+PrefetchSource = namedtuple("PrefetchSource", "path headers session conversation")
+Prefetched = namedtuple("Prefetched", "request_text llm_request response_text reply chain")
+
+
+def _reply_targets(method, path, headers, session, conversation, cache_key, flight):
+    source = PrefetchSource(path, headers, session, conversation) if method == "GET" else None
+    return ReplyTargets(cache_key, flight, source)
+
+
+def _publish(targets, status, headers, body):
+    """Cache a finished reply, hand it to coalesced requests and prefetch its links."""
+    if targets is None:
+        return
+    current = _config_current()
+    if current:
+        _cache_store(targets.cache_key, status, headers, body)
+    if targets.flight is not None:
+        COALESCER.finish(targets.flight, CachedReply(status, list(headers), bytes(body)))
+    if targets.prefetch is not None and current:
+        _plan_prefetch(targets.prefetch, status, headers, body)
+
+
+def _plan_prefetch(source, status, headers, body):
+    """Have the prefetcher look for the links of a served page in the background."""
+    if PREFETCHER is None or status != 200:
+        return
+    if not get_header(headers, "Content-Type", "").startswith("text/html"):
+        return
+    # Generate with the model of the config the page was served with
+    model = _config().model or "gpt-3.5-turbo"
+    PREFETCHER.plan(_prefetch_links, source, bytes(body), model)
+
+
+def _prefetch_links(source, body, model):
+    """Start generating the pages most likely to be requested after this one."""
+    links = extract_links(str(body, "utf-8", "replace"), source.path, source.headers.get("Host"))
+    if not links:
+        return
+    with STATE_LOCK:
+        snapshot = list(source.conversation)
+    base_cost = estimate_tokens(snapshot)
+    client = _client_key(source.session)
+    candidates = []
+    for link in links[: PREFETCHER.fanout * 2]:
+        request_text = build_request_text("GET", link, source.headers)
+        llm_request = snapshot + [{"role": "user", "content": request_text}]
+        cost = base_cost + estimate_tokens(llm_request[-1:])
+        if TOKEN_LEDGER.enforcing and TOKEN_LEDGER.check(client, cost, count=False) is not None:
+            # Speculation must not use up what the client's own requests may spend
+            LOGGER.debug("Not prefetching %s: over the token budget", link)
+            continue
+        job = functools.partial(_prefetch_job, request_text, llm_request, source.session, model)
+        key = _session_key("GET", link, source.headers, source.session)
+        candidates.append((key, cost, job))
+    PREFETCHER.schedule(candidates)
+
+
+def _prefetch_job(request_text, llm_request, session, model):
+    """Generate one speculative page; runs on a prefetch worker thread."""
+    # Build on the conversation's response chain without moving it
+    chain = (session.chain if session is not None else RESPONSE_CHAIN).fork()
+    backend = get_backend()
+    with _llm_slot("background", _client_key(session)):
+        completion = LLM_POLICY.call(lambda c: backend.complete(llm_request, model, c), chain)
+    tokens = _account_tokens(llm_request, completion.text, completion.usage, _client_key(session))
+    entry = Prefetched(request_text, llm_request, completion.text, parse_reply(completion.text), chain)
+    return entry, tokens["input"] + tokens["output"]
+
+
+def _prefetch_key(method, path, headers, session):
+    """Return the prefetch key for a request, ``None`` when it cannot be prefetched."""
+    if PREFETCHER is None or method != "GET":
+        return None
+    return _session_key(method, path, headers, session)
+
+
+def _take_prefetched(method, path, headers, session):
+    """Return the prefetched page for a request, waiting for one under way."""
+    key = _prefetch_key(method, path, headers, session)
+    if key is None:
+        return None
+    future = PREFETCHER.pending(key)
+    if future is not None:
+        with metrics.span("prefetch.wait"):
+            try:
+                future.result(PREFETCH_WAIT)
+            except Exception:
+                pass
+    return PREFETCHER.take(key)
+
+
+def _use_prefetched(conversation, path, entry, session):
+    """Add a prefetched exchange to the conversation and return its reply.
+
+    Returns ``None`` when the conversation moved on since the page was
+    generated; the entry is dropped and the request needs a real call.
+    """
+    with STATE_LOCK:
+        # The page is only valid for exactly the history it was generated from
+        current = conversation == entry.llm_request[:-1]
+        if current:
+            conversation.append({"role": "user", "content": entry.request_text})
+    if not current:
+        LOGGER.info("Dropping prefetched %s, the conversation moved on", path)
+        PREFETCHER.discard()
+        return None
+    chain = session.chain if session is not None else RESPONSE_CHAIN
+    if entry.chain.response_id not in (None, chain.response_id):
+        # Continue from the speculative response instead of resending history
+        chain.commit(entry.llm_request, entry.response_text, entry.chain.response_id)
+    reply = entry.reply
+    status = reply.status or 200
+    _record_exchange(
+        conversation, path, entry.llm_request, entry.response_text, reply, status, reply.body, prefetched=True
+    )
+    return CachedReply(status, reply.headers, bytes(reply.body))
+
+
+def _client_key(session, address=None):
+    """Return who a call is queued for: the session, else the client address."""
+    return session.id if session is not None else address
+
+
+@contextlib.contextmanager
+def _llm_slot(priority, client):
+    """Hold one of the scheduler's LLM call slots; raises ``Overloaded`` when shed."""
+    if SCHEDULER is None:
+        yield
+        return
+    with metrics.span("admission"):
+        admitted = SCHEDULER.acquire(priority, client)
+    with lingering_attempts() as lingering:
+        try:
+            yield
+        finally:
+            SCHEDULER.release_after(admitted, lingering)
+
+
+def _error_status(exc):
+    """Return the status for a failed LLM call.
+
+    Provider failures are 502, or 504 on a timeout; anything else is our own 500.
+    """
+    return exc.status if isinstance(exc, LLMError) else 500
+
+
+def _check_tokens(conversation, request_text, client):
+    """Apply the token budgets to a request about to be sent to the LLM.
+
+    Returns the ``429`` reply when the request is rejected.  With the
+    ``compact`` action the conversation is compacted before it is sent.
+    """
+    account = _REQUEST_USAGE.get()
+    if account is not None:
+        account["client"] = client
+    if not TOKEN_LEDGER.enforcing:
+        return None
+    with STATE_LOCK:
+        snapshot = list(conversation)
+    history = estimate_tokens(snapshot)
+    request = estimate_tokens([{"role": "user", "content": request_text}])
+    decision = TOKEN_LEDGER.check(client, history + request)
+    if decision is None:
+        return None
+    LOGGER.warning(
+        "Token budget %s exceeded by %s (%d prompt tokens): %s",
+        decision.reason, client or "a client", history + request, decision.action,
+    )
+    if decision.action == "reject":
+        headers = [("Content-Type", "text/plain")]
+        if decision.retry_after is not None:
+            headers.insert(0, ("Retry-After", str(decision.retry_after)))
+        body = f"Token budget exceeded ({decision.reason})\n".encode("utf-8")
+        return CachedReply(429, headers, body)
+    if decision.action == "compact":
+        # Fit the context budget, or halve the history without one
+        target = TOKEN_LEDGER.context_budget - request if TOKEN_LEDGER.context_budget else history // 2
+        policy = CONTEXT_WINDOW.policy if CONTEXT_WINDOW is not None else "summarize"
+        _compact_conversation(conversation, ContextWindow(max_tokens=max(target, 1), policy=policy))
+    return None
+
+
+def _account_tokens(llm_request, response_text, usage=None, client=None):
+    """Count the tokens of an LLM call and return them for the Traffic log.
+
+    Usage reported by the provider is preferred over the offline estimate.
+    Within a proxy request the client and usage come from the request, and
+    ``None`` is returned when its call failed before spending anything.
+    """
+    account = _REQUEST_USAGE.get()
+    if account is not None and usage is None:
+        if "usage" not in account:
+            return None
+        usage = account.pop("usage")
+        client = account.get("client", client)
+    estimate = estimate_tokens(llm_request)
+    if usage:
+        input_tokens, output_tokens = usage["input_tokens"], usage["output_tokens"]
+    else:
+        input_tokens, output_tokens = estimate, estimate_text_tokens(response_text)
+    total, client_total = TOKEN_LEDGER.record(
+        client, input_tokens, output_tokens, reported=bool(usage), estimated_input=estimate
+    )
+    tokens = {"input": input_tokens, "output": output_tokens, "reported": bool(usage), "total": total}
+    if client_total is not None:
+        tokens["session"] = client_total
+    return tokens
+
+
+def _shed_reply(exc):
+    body = f"Service overloaded, retry in {exc.retry_after} seconds\n".encode("utf-8")
+    return CachedReply(503, [("Retry-After", str(exc.retry_after)), ("Content-Type", "text/plain")], body)
+
+
+def _log_cached(path, cached, source="cached"):
+    """Log a reply served without an LLM call of its own."""
+    with STATE_LOCK:
+        LOGS.append({
+            "type": "http",
+            "request": path,
+            "status": cached.status,
+            "response": str(cached.body, "utf-8", "replace"),
+            "error": cached.status >= 400,
+            source: True,
+        })
+
+
+def _record_exchange(conversation, path, llm_request, response_text, parser, status, body, timings=None, **flags):
+    """Append the exchange to the conversation, the Studio logs and the trace.
+
+    ``flags`` are added to the ``http`` log entry, e.g. ``prefetched=True``.
+    """
+    if TRACE_STORE is not None:
+        request_text = llm_request[-1]["content"]
+        TRACE_STORE.record(
+            request_text.split(" ", 1)[0], path, request_text, llm_request, response_text, status,
+            parser.headers, body, parser.meta + parser.suffix_meta, timings, flags,
+        )
+    body_text = str(body, "utf-8", "replace")
+    # Prefetches were counted when they were generated
+    tokens = None if flags.get("prefetched") else _account_tokens(llm_request, response_text)
+    if tokens is not None:
+        flags["tokens"] = tokens
+    # After a config swap the shared conversation belongs to the new version
+    current = _config_current() or not isinstance(conversation, SharedConversation)
+    with STATE_LOCK:
+        if current:
+            conversation.append({"role": "assistant", "content": response_text})
+        LOGS.append({"type": "llm_exchange", "request": llm_request, "response": response_text})
+
+    for m in parser.meta:
+        with STATE_LOCK:
+            META_LOGS.append({"direction": "in", "text": m})
+            LOGS.append({"type": "meta_in", "text": m})
+
+    with STATE_LOCK:
+        LOGS.append(
+            {"type": "http", "request": path, "status": status, "response": body_text, "error": status >= 400, **flags}
+        )
+
+    for m in parser.suffix_meta:
+        with STATE_LOCK:
+            META_LOGS.append({"direction": "in", "text": m})
+            LOGS.append({"type": "meta_in", "text": m})
+    _schedule_compaction(conversation)
+
+
 class ProxyHandler(BaseHTTPRequestHandler):
     """HTTP handler that proxies requests to the LLM."""
 
-    def call_llm(self, messages):
-        """Send ``messages`` to the LLM and return the reply text."""
-        if openai is None:
-            raise RuntimeError("openai package is required for LLM calls")
+    # Session of the request being handled, ``None`` for the shared conversation
+    session = None
+    _session_cookie = None
 
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise RuntimeError("OPENAI_API_KEY environment variable not set")
+    def call_llm(self, messages):
+        """Send ``messages`` to the LLM and return the reply text.
 
-        openai.api_key = api_key
-        model = MODEL or "gpt-3.5-turbo"
-        LOGGER.info("Calling OpenAI model %s", model)
+        Raises :class:`~vibestudio.resilience.LLMError` when the call fails.
+        """
+        backend = get_backend()
+        model = _config().model or "gpt-3.5-turbo"
+        LOGGER.info("Calling %s model %s", backend.name, model)
         LOGGER.debug("Messages: %s", messages)
-        try:  # pragma: no cover - network dependent
-            global PREVIOUS_RESPONSE_ID
-            if hasattr(openai, "responses"):
-                response = openai.responses.create(
-                    model=model,
-                    messages=messages,
-                    previous_response_id=PREVIOUS_RESPONSE_ID,
-                )
-                PREVIOUS_RESPONSE_ID = response.id
-                text = response.choices[0].message.content.strip()
-            elif hasattr(openai, "chat") and hasattr(openai.chat, "completions"):
-                response = openai.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                )
-                text = response.choices[0].message.content.strip()
-            else:
-                response = openai.ChatCompletion.create(
-                    model=model,
-                    messages=messages,
-                )
-                text = response.choices[0].message["content"].strip()
-            LOGGER.info("OpenAI response received (%d chars)", len(text))
-            return text
+        chain = self.session.chain if self.session else RESPONSE_CHAIN
+        try:
+            completion = LLM_POLICY.call(lambda c: backend.complete(messages, model, c), chain)
+        except LLMError as exc:
+            LOGGER.error("%s", exc)
+            raise
+        account = _REQUEST_USAGE.get()
+        if account is not None:
+            account["usage"] = completion.usage
+        LOGGER.info("LLM response received (%d chars)", len(completion.text))
+        return completion.text
+
+    def stream_llm(self, messages):
+        """Yield the reply to ``messages`` in chunks as the LLM generates it."""
+        backend = get_backend()
+        if not backend.streaming:
+            # Fall back to a single chunk for backends without streaming
+            yield self.call_llm(messages)
+            return
+        model = _config().model or "gpt-3.5-turbo"
+        LOGGER.info("Streaming from %s model %s", backend.name, model)
+        account = _REQUEST_USAGE.get()
+        try:
+            for chunk in LLM_POLICY.stream(lambda: backend.stream(messages, model)):
+                if account is not None:
+                    # Streams report no usage; the reply is estimated
+                    account.setdefault("usage", None)
+                yield chunk
+        except LLMError:
+            raise
         except Exception as exc:
-            LOGGER.exception("OpenAI call failed")
-            return f"LLM call failed: {exc}"
+            raise LLMError(f"LLM stream failed: {exc}") from exc
+
+    def _read_request_text(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        return build_request_text(self.command, self.path, self.headers, body)
+
+    def end_headers(self):
+        if self._session_cookie:
+            self.send_header("Set-Cookie", self._session_cookie)
+            self._session_cookie = None
+        super().end_headers()
+        metrics.note(first_byte=True)
+
+    def _send_cached(self, cached, send_body, source="cached", log=True):
+        """Replay a stored reply without calling the LLM; ``source`` marks its log entry."""
+        metrics.lap("queue")
+        metrics.note(source=source, size=len(cached.body))
+        if log:
+            _log_cached(self.path, cached, source)
+        self.send_response(cached.status)
+        LOGGER.info("Responding with %s status %s", source, cached.status)
+        for k, v in cached.headers:
+            if k.lower() not in _HOP_BY_HOP_HEADERS:
+                self.send_header(k, v)
+        if not any(k == "Content-Type" for k, _ in cached.headers):
+            self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(cached.body)))
+        self.end_headers()
+        if send_body:
+            with metrics.span("write"):
+                self.wfile.write(cached.body)
+        metrics.lap("write")
+
+    def log_request(self, code="-", size="-"):
+        metrics.note(status=int(getattr(code, "value", code)))
+        super().log_request(code, size)
 
     def _handle_request(self, send_body: bool = True) -> None:
         """Forward the HTTP request to the LLM and relay the reply."""
+        timer, token = _begin_request(self.command, self.path)
+        try:
+            self._serve_request(send_body)
+        finally:
+            _end_request(timer, token)
 
-        global PROMPT, META_PROMPT, LOGS, META_LOGS, MODEL, TEMPERATURE, THINKING_TIME
-
-        length = int(self.headers.get("Content-Length", 0))
-        body = self.rfile.read(length) if length else b""
+    def _serve_request(self, send_body):
         LOGGER.info("Handling %s %s", self.command, self.path)
-        LOGGER.info("Current log size: %d entries", len(LOGS))
-        request_lines = [f"{self.command} {self.path} HTTP/1.1"]
-        for k, v in self.headers.items():
-            request_lines.append(f"{k}: {v}")
-        request_lines.append("")
-        if body:
-            request_lines.append(body.decode("utf-8", "replace"))
-        request_text = "\n".join(request_lines)
-
-        global CONVERSATION
-        with STATE_LOCK:
-            CONVERSATION.append({"role": "user", "content": request_text})
-            llm_request = list(CONVERSATION)
+        LOGGER.debug("Current log size: %d entries", len(LOGS))
+        with metrics.span("read"):
+            request_text = self._read_request_text()
+        if PROXY_METRICS_PATH and self.command == "GET" and self.path == PROXY_METRICS_PATH:
+            self._send_cached(_metrics_reply(), send_body, "metrics", log=False)
+            return
+        fixed, source = _fixed_reply(self.command, self.path, self.headers)
+        if fixed is not None:
+            self._send_cached(fixed, send_body, source)
+            return
+        with metrics.span("lookup"):
+            self.session, conversation, self._session_cookie = _resolve_session(self.headers)
+            cache_key, cached = _cache_lookup(self.command, self.path, self.headers)
+        if cached is not None:
+            self._send_cached(cached, send_body)
+            return
+        prefetched = _take_prefetched(self.command, self.path, self.headers, self.session)
+        reply = _use_prefetched(conversation, self.path, prefetched, self.session) if prefetched is not None else None
+        if reply is not None:
+            self._send_cached(reply, send_body, "prefetched", log=False)
+            _plan_prefetch(
+                PrefetchSource(self.path, self.headers, self.session, conversation),
+                reply.status, reply.headers, reply.body,
+            )
+            return
+        flight, leader = _coalesce_join(self.command, self.path, self.headers, self.session)
+        if not leader:
+            with metrics.span("coalesce.wait"):
+                shared = COALESCER.wait(flight, COALESCE_WAIT)
+            if shared is not None:
+                self._send_cached(shared, send_body, "coalesced")
+                return
+            # The leader failed or is too slow, make our own call
+            flight = None
+        try:
+            client = _client_key(self.session, self.client_address[0])
+            refused = _check_tokens(conversation, request_text, client)
+            if refused is not None:
+                self._send_cached(refused, send_body, "budget")
+                return
+            with _llm_slot("interactive", client):
+                targets = _reply_targets(
+                    self.command, self.path, self.headers, self.session, conversation, cache_key, flight
+                )
+                self._forward(conversation, request_text, send_body, targets)
+        except Overloaded as exc:
+            LOGGER.warning("Shedding %s %s: %s", self.command, self.path, exc)
+            self._send_cached(_shed_reply(exc), send_body, "shed")
+        finally:
+            if flight is not None:
+                # Release the followers if no reply was published
+                COALESCER.finish(flight, None)
+
+    def _forward(self, conversation, request_text, send_body, targets):
+        """Append the request to the conversation and relay the LLM's reply."""
+        llm_request = _append_request(conversation, request_text)
+        if STREAMING:
+            self._relay_stream(conversation, llm_request, send_body, targets)
+            return
         status = 200
+        metrics.lap("queue")
+        started = time.monotonic()
         try:
-            response_text = self.call_llm(CONVERSATION)
-        except Exception as exc:  # pragma: no cover - dependent on environment
+            with metrics.span("llm"):
+                response_text = self.call_llm(llm_request)
+        except Exception as exc:
             LOGGER.error("LLM invocation failed: %s", exc)
-            status = 500
+            status = _error_status(exc)
             response_text = f"LLM error: {exc}"
-        with STATE_LOCK:
-            CONVERSATION.append({"role": "assistant", "content": response_text})
-            LOGS.append({"type": "llm_exchange", "request": llm_request, "response": response_text})
-        lines = response_text.splitlines()
-        # Trim leading blank lines so slightly malformed responses still parse
-        while lines and not lines[0].strip():
-            lines.pop(0)
-
-        meta_lines = []
-        suffix_meta_lines = []
-        while (
-            lines
-            and lines[0].lstrip().startswith("{{{")
-            and lines[0].rstrip().endswith("}}}")
-        ):
-            meta_lines.append(lines.pop(0).strip()[3:-3].strip())
-        while lines and not lines[0].strip():
-            lines.pop(0)
-
-        headers = {}
-        if lines and lines[0].lstrip().startswith("HTTP/"):
-            status_line = lines.pop(0).strip()
-            parts = status_line.split()
-            if len(parts) >= 2 and parts[1].isdigit():
-                status = int(parts[1])
-            while lines:
-                line = lines.pop(0)
-                if not line.strip():
-                    break
-                if ":" in line:
-                    k, v = line.split(":", 1)
-                    headers[k.strip()] = v.strip()
-
-        # Extract trailing meta lines if present
-        while (
-            lines
-            and lines[-1].lstrip().startswith("{{{")
-            and lines[-1].rstrip().endswith("}}}")
-        ):
-            suffix_meta_lines.insert(0, lines.pop().strip()[3:-3].strip())
-            while lines and not lines[-1].strip():
-                lines.pop()
-
-        body_text = "\n".join(lines)
-
-        for m in meta_lines:
-            with STATE_LOCK:
-                META_LOGS.append({"direction": "in", "text": m})
-                LOGS.append({"type": "meta_in", "text": m})
-
-        with STATE_LOCK:
-            LOGS.append({"type": "http", "request": self.path, "status": status, "response": body_text, "error": status >= 400})
-
-        for m in suffix_meta_lines:
-            with STATE_LOCK:
-                META_LOGS.append({"direction": "in", "text": m})
-                LOGS.append({"type": "meta_in", "text": m})
+        metrics.lap("llm")
+        with metrics.span("parse"):
+            reply = parse_reply(response_text)
+        metrics.lap("parse")
+        if reply.status is not None:
+            status = reply.status
+        headers = reply.headers
+        with metrics.span("record"):
+            _record_exchange(
+                conversation, self.path, llm_request, response_text, reply, status, reply.body, _timings(started)
+            )
+            _publish(targets, status, headers, reply.body)
 
+        write_started = time.monotonic()
         self.send_response(status)
         LOGGER.info("Responding with status %s", status)
-        for k, v in headers.items():
+        for k, v in headers:
             self.send_header(k, v)
-        if "Content-Type" not in headers:
+        if get_header(headers, "Content-Type") is None:
             self.send_header("Content-Type", "text/plain")
         self.end_headers()
         if send_body:
-            self.wfile.write(body_text.encode("utf-8"))
-        LOGGER.info("Body snippet: %s", body_text[:60].replace("\n", " "))
+            self.wfile.write(reply.body)
+        metrics.add_span("write", write_started, time.monotonic())
+        metrics.note(size=len(reply.body))
+        metrics.lap("write")
+        LOGGER.info("Body snippet: %r", bytes(reply.body[:60]))
+
+    def _relay_stream(self, conversation, llm_request, send_body, targets=None):
+        """Relay the reply to the client while the LLM is still generating it."""
+        parser = ReplyParser()
+        status = 200
+        chunks = []
+        body_parts = []
+        chunked = False
+        head_sent = False
+        metrics.lap("queue")
+        started = time.monotonic()
+        first_chunk = None
+        try:
+            for chunk in self.stream_llm(llm_request):
+                metrics.lap("llm")
+                if first_chunk is None:
+                    first_chunk = time.monotonic()
+                chunks.append(chunk)
+                ready = parser.feed(chunk)
+                body_parts.append(ready)
+                metrics.lap("parse")
+                if not head_sent and parser.head_complete:
+                    chunked = self._send_stream_head(parser, send_body)
+                    head_sent = True
+                if head_sent and ready and send_body:
+                    self._write_body_chunk(ready, chunked)
+                metrics.lap("write")
+        except Exception as exc:
+            if head_sent:
+                # Too late to change the status, drop the connection instead
+                LOGGER.error("LLM stream failed after headers were sent: %s", exc)
+                self.close_connection = True
+                status = 502
+                response_text = "".join(chunks)
+                body = b"".join(body_parts) + parser.close()
+                timings = _timings(started, first_chunk)
+                _record_exchange(conversation, self.path, llm_request, response_text, parser, status, body, timings)
+                return
+            LOGGER.error("LLM invocation failed: %s", exc)
+            status = _error_status(exc)
+            chunks = [f"LLM error: {exc}"]
+            parser = ReplyParser()
+            body_parts = [parser.feed(chunks[0])]
+        metrics.lap("llm")
+        _stream_spans(started, first_chunk)
+        rest = parser.close()
+        body_parts.append(rest)
+        if parser.status is not None:
+            status = parser.status
+        body = b"".join(body_parts)
+        metrics.lap("parse")
+        timings = _timings(started, first_chunk)
+        with metrics.span("record"):
+            _record_exchange(conversation, self.path, llm_request, "".join(chunks), parser, status, body, timings)
+            _publish(targets, status, parser.headers, body)
+        write_started = time.monotonic()
+        if not head_sent:
+            chunked = self._send_stream_head(parser, send_body, status)
+        if send_body:
+            if rest:
+                self._write_body_chunk(rest, chunked)
+            if chunked:
+                self.wfile.write(b"0\r\n\r\n")
+        metrics.add_span("write", write_started, time.monotonic())
+        metrics.note(size=len(body))
+        metrics.lap("write")
+        LOGGER.info("Body snippet: %r", body[:60])
+
+    def _send_stream_head(self, parser, send_body, status=None):
+        """Send the status line and headers, returning whether chunking is used."""
+        if status is None:
+            status = parser.status or 200
+        chunked = send_body and self.request_version == "HTTP/1.1"
+        if chunked:
+            self.protocol_version = "HTTP/1.1"
+        self.send_response(status)
+        LOGGER.info("Streaming response with status %s", status)
+        for k, v in parser.headers:
+            if k.lower() not in _HOP_BY_HOP_HEADERS:
+                self.send_header(k, v)
+        if parser.header("Content-Type") is None:
+            self.send_header("Content-Type", "text/plain")
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.flush()
+        return chunked
+
+    def _write_body_chunk(self, data, chunked):
+        if chunked:
+            data = f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n"
+        self.wfile.write(data)
+        self.wfile.flush()
 
     # Basic HTTP verbs
     def do_GET(self):  # noqa: D401 - method docs inherited
@@ -270,11 +1413,20 @@ class ProxyHandler(BaseHTTPRequestHandler):
         self._handle_request(send_body=False)
 
 
+class _ReusePortHTTPServer(ThreadingHTTPServer):
+    """Lets every proxy worker process accept connections on the same port."""
+
+    def server_bind(self):
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
 class _ProxyServerThread(threading.Thread):
-    def __init__(self, host="localhost", port=8000):
+    def __init__(self, host="localhost", port=8000, reuse_port=False):
         super().__init__(daemon=True)
         # Use ThreadingHTTPServer so long LLM calls do not block other requests
-        self.server = ThreadingHTTPServer((host, port), ProxyHandler)
+        server_class = _ReusePortHTTPServer if reuse_port else ThreadingHTTPServer
+        self.server = server_class((host, port), ProxyHandler)
 
     def run(self):
         LOGGER.info("Proxy server started on http://%s:%s", *self.server.server_address)
@@ -293,18 +1445,160 @@ class StudioHandler(SimpleHTTPRequestHandler):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, directory=os.path.join(HERE, "static"), **kwargs)
 
-    def _send_json(self, data):
+    def log_request(self, code="-", size="-"):
+        STUDIO_REQUESTS.inc(self.command, str(getattr(code, "value", code)))
+        super().log_request(code, size)
+
+    def _send_json(self, data, status=200, headers=()):
         payload = json.dumps(data).encode("utf-8")
-        self.send_response(200)
+        self.send_response(status)
+        for k, v in headers:
+            self.send_header(k, v)
         self.send_header("Content-Type", "application/json")
         self.send_header("Content-Length", str(len(payload)))
         self.end_headers()
         self.wfile.write(payload)
 
+    def _send_log_page(self, buffer, query):
+        """Send entries after the ``since`` cursor, or all retained entries."""
+        params = parse_qs(query)
+        if "since" not in params:
+            self._send_json(list(buffer))
+            return
+        try:
+            since = int(params["since"][0])
+            limit = int(params["limit"][0]) if "limit" in params else None
+        except ValueError:
+            self.send_error(400, "since and limit must be integers")
+            return
+        self._send_json(buffer.since(since, limit))
+
+    def _send_transcript_export(self, query):
+        """Stream the prompts and logs as NDJSON, gzip-compressed with ``gzip=1``."""
+        try:
+            options = transcript.parse_options(query)
+        except ValueError as exc:
+            self.send_error(400, str(exc))
+            return
+        # Capture both logs together; entries are serialised while writing
+        with STATE_LOCK:
+            header = {
+                "prompt": PROMPT,
+                "meta_prompt": META_PROMPT,
+                "model": MODEL,
+                "temperature": TEMPERATURE,
+                "thinking_time": THINKING_TIME,
+            }
+            logs = {"logs": list(LOGS), "meta_logs": list(META_LOGS)}
+        filename = "vibestudio-transcript.ndjson"
+        self.send_response(200)
+        if options.compress:
+            self.send_header("Content-Type", "application/gzip")
+            filename += ".gz"
+        else:
+            self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Disposition", f'attachment; filename="{filename}"')
+        self.end_headers()
+        self.close_connection = True
+        try:
+            size = transcript.write_lines(self.wfile, transcript.export_lines(header, logs, options), options.compress)
+        except (BrokenPipeError, ConnectionResetError):
+            LOGGER.info("Transcript export client disconnected")
+            return
+        LOGGER.info("Exported transcript (%d bytes uncompressed)", size)
+
+    def _write_event(self, data, event=None, event_id=None):
+        lines = []
+        if event:
+            lines.append(f"event: {event}")
+        if event_id is not None:
+            lines.append(f"id: {event_id}")
+        lines.append(f"data: {json.dumps(data)}")
+        self.wfile.write(("\n".join(lines) + "\n\n").encode("utf-8"))
+
+    def _write_page(self, page, cleared):
+        """Send a buffer page as events and return the new ``(seq, cleared)``."""
+        if page["cleared"] > cleared:
+            self._write_event({"cleared": page["cleared"]}, event="cleared")
+        elif page["missed"]:
+            self._write_event({"missed": page["missed"]}, event="missed")
+        for entry in page["entries"]:
+            self._write_event(entry, event_id=entry["seq"])
+        self.wfile.flush()
+        return page["next"], page["cleared"]
+
+    def _stream_events(self, buffer, query, final=None):
+        """Push new ``buffer`` entries to the client as Server-Sent Events.
+
+        The stream ends after an entry for which ``final(entry)`` is true.
+        """
+        params = parse_qs(query)
+        resume = self.headers.get("Last-Event-ID") or params.get("since", ["0"])[0]
+        try:
+            seq = int(resume)
+        except ValueError:
+            seq = 0
+        subscription = buffer.subscribe(SSE_QUEUE_SIZE)
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            # Resume after the browser's Last-Event-ID, telling it if the log
+            # was cleared while it was away
+            cleared = seq
+            page = buffer.since(seq)
+            seq, cleared = self._write_page(page, cleared)
+            ended = final is not None and any(final(e) for e in page["entries"])
+            while not ended:
+                item = subscription.get(timeout=SSE_HEARTBEAT)
+                if subscription.overflowed:
+                    page = subscription.resync(seq)
+                    seq, cleared = self._write_page(page, cleared)
+                    ended = final is not None and any(final(e) for e in page["entries"])
+                elif item is None:
+                    self.wfile.write(b": ping\n\n")
+                    self.wfile.flush()
+                elif item is CLEARED:
+                    cleared = seq
+                    self._write_event({"cleared": seq}, event="cleared")
+                    self.wfile.flush()
+                elif item["seq"] > seq:
+                    seq = item["seq"]
+                    self._write_event(item, event_id=seq)
+                    self.wfile.flush()
+                    ended = final is not None and final(item)
+        except (BrokenPipeError, ConnectionResetError):
+            LOGGER.info("Event stream client disconnected")
+        finally:
+            subscription.close()
+            self.close_connection = True
+
+    def _test_job(self, path):
+        """Return ``(job, action)`` for ``/api/test_jobs/<id>[/<action>]``, sending 404 if unknown."""
+        parts = path.split("/")[3:]
+        job = TEST_RUNNER.get(parts[0]) if len(parts) in (1, 2) else None
+        if job is None:
+            self._send_json({"error": "no such test job"}, 404)
+            return None, None
+        return job, parts[1] if len(parts) == 2 else None
+
     def do_GET(self):
         parsed = urlparse(self.path)
         LOGGER.info("Studio GET %s", parsed.path)
-        if parsed.path == "/api/examples":
+        if parsed.path == "/api/test_jobs":
+            self._send_json([job.to_dict() for job in TEST_RUNNER.jobs()])
+        elif parsed.path.startswith("/api/test_jobs/"):
+            job, action = self._test_job(parsed.path)
+            if job is None:
+                return
+            if action == "events":
+                self._stream_events(job.events, parsed.query, final=lambda e: e.get("final", False))
+            elif action is None:
+                self._send_json(job.to_dict())
+            else:
+                self._send_json({"error": "unknown action"}, 404)
+        elif parsed.path == "/api/examples":
             self._send_json(gather_examples())
         elif parsed.path == "/api/prompt":
             self._send_json({"prompt": PROMPT})
@@ -312,10 +1606,30 @@ class StudioHandler(SimpleHTTPRequestHandler):
             self._send_json({"meta_prompt": META_PROMPT})
         elif parsed.path == "/api/settings":
             self._send_json({"model": MODEL, "temperature": TEMPERATURE, "thinking_time": THINKING_TIME})
+        elif parsed.path == "/api/stats":
+            self._send_json(_stats())
+        elif parsed.path == "/api/trace_events":
+            with STATE_LOCK:
+                entries = list(LOGS)
+            self._send_json(metrics.chrome_trace(entries))
+        elif parsed.path == "/api/metrics":
+            reply = _metrics_reply()
+            self.send_response(200)
+            for k, v in reply.headers:
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(reply.body)))
+            self.end_headers()
+            self.wfile.write(reply.body)
         elif parsed.path == "/api/logs":
-            self._send_json(LOGS)
+            self._send_log_page(LOGS, parsed.query)
         elif parsed.path == "/api/meta_logs":
-            self._send_json(META_LOGS)
+            self._send_log_page(META_LOGS, parsed.query)
+        elif parsed.path == "/api/logs/events":
+            self._stream_events(LOGS, parsed.query)
+        elif parsed.path == "/api/meta_logs/events":
+            self._stream_events(META_LOGS, parsed.query)
+        elif parsed.path == "/api/transcript/export":
+            self._send_transcript_export(parsed.query)
         elif parsed.path == "/api/transcript":
             self._send_json({
                 "prompt": PROMPT,
@@ -323,89 +1637,151 @@ class StudioHandler(SimpleHTTPRequestHandler):
                 "model": MODEL,
                 "temperature": TEMPERATURE,
                 "thinking_time": THINKING_TIME,
-                "logs": LOGS,
-                "meta_logs": META_LOGS,
+                "logs": list(LOGS),
+                "meta_logs": list(META_LOGS),
             })
         else:
             super().do_GET()
 
     def do_POST(self):
-        global PROMPT, META_PROMPT, LOGS, META_LOGS
         parsed = urlparse(self.path)
         LOGGER.info("Studio POST %s", parsed.path)
         if parsed.path == "/api/prompt":
             length = int(self.headers.get("Content-Length", 0))
             body = self.rfile.read(length)
             data = json.loads(body or b"{}")
-            PROMPT = data.get("prompt", PROMPT)
-            with open(PROMPT_FILE, "w", encoding="utf-8") as fh:
-                fh.write(PROMPT)
+            _swap_config(persist=True, prompt=data.get("prompt", PROMPT))
             self._send_json({"status": "ok"})
         elif parsed.path == "/api/meta_prompt":
             length = int(self.headers.get("Content-Length", 0))
             body = self.rfile.read(length)
             data = json.loads(body or b"{}")
-            META_PROMPT = data.get("meta_prompt", META_PROMPT)
-            with open(META_PROMPT_FILE, "w", encoding="utf-8") as fh:
-                fh.write(META_PROMPT)
+            _swap_config(persist=True, meta_prompt=data.get("meta_prompt", META_PROMPT))
             self._send_json({"status": "ok"})
         elif parsed.path == "/api/settings":
             length = int(self.headers.get("Content-Length", 0))
             body = self.rfile.read(length)
             data = json.loads(body or b"{}")
-            global MODEL, TEMPERATURE, THINKING_TIME
-            MODEL = data.get("model", MODEL)
-            TEMPERATURE = data.get("temperature", TEMPERATURE)
-            THINKING_TIME = data.get("thinking_time", THINKING_TIME)
-            with open(MODEL_FILE, "w", encoding="utf-8") as fh:
-                fh.write(MODEL)
+            _swap_config(persist=True, **{k: data[k] for k in ("model", "temperature", "thinking_time") if k in data})
             self._send_json({"status": "ok"})
         elif parsed.path == "/api/restart":
             length = int(self.headers.get("Content-Length", 0))
             body = self.rfile.read(length)
             data = json.loads(body or b"{}")
-            with STATE_LOCK:
-                PROMPT = data.get("prompt", PROMPT)
-                META_PROMPT = data.get("meta_prompt", META_PROMPT)
-                LOGS = []
-                META_LOGS = []
-                _reset_conversation()
-            _start_proxy_server()
-            self._send_json({"status": "restarted"})
+            # The proxy keeps listening; requests already running finish on
+            # the old prompts and conversation
+            version = _swap_config(
+                reset=True, prompt=data.get("prompt", PROMPT), meta_prompt=data.get("meta_prompt", META_PROMPT)
+            )
+            if _SERVER_THREAD is None:
+                _start_proxy_server()
+            self._send_json({"status": "restarted", "version": version})
         elif parsed.path == "/api/meta_chat":
             length = int(self.headers.get("Content-Length", 0))
             body = self.rfile.read(length)
             data = json.loads(body or b"{}")
             text = data.get("text", "")
-            with STATE_LOCK:
-                META_LOGS.append({"direction": "out", "text": text})
-                LOGS.append({"type": "meta_out", "text": text})
-                CONVERSATION.append({"role": "user", "content": f"{{{{{text}}}}}"})
-                llm_messages = list(CONVERSATION)
-            response = ProxyHandler.call_llm(ProxyHandler, llm_messages)
+            status = 200
+            # Only the context and global budgets apply to the meta chat
+            refused = _check_tokens(CONVERSATION, f"{{{{{text}}}}}", None)
+            if refused is not None:
+                retry = [(k, v) for k, v in refused.headers if k == "Retry-After"]
+                self._send_json({"error": str(refused.body, "utf-8").strip()}, refused.status, retry)
+                return
+            try:
+                with _llm_slot("meta", "studio"):
+                    with STATE_LOCK:
+                        META_LOGS.append({"direction": "out", "text": text})
+                        LOGS.append({"type": "meta_out", "text": text})
+                    llm_messages = _append_request(CONVERSATION, f"{{{{{text}}}}}")
+                    usage_token = _REQUEST_USAGE.set({"client": None})
+                    try:
+                        response = ProxyHandler.call_llm(ProxyHandler, llm_messages)
+                        _account_tokens(llm_messages, response)
+                    except Exception as exc:
+                        # Shown in the meta chat like a reply
+                        status = _error_status(exc)
+                        response = str(exc)
+                    finally:
+                        _REQUEST_USAGE.reset(usage_token)
+            except Overloaded as exc:
+                retry = [("Retry-After", str(exc.retry_after))]
+                self._send_json({"error": str(exc), "retry_after": exc.retry_after}, 503, retry)
+                return
             with STATE_LOCK:
                 CONVERSATION.append({"role": "assistant", "content": response})
                 META_LOGS.append({"direction": "in", "text": response})
                 LOGS.append({"type": "meta_in", "text": response})
-            self._send_json({"response": response})
+            _schedule_compaction(CONVERSATION)
+            self._send_json({"response": response}, status)
+        elif parsed.path == "/api/freeze":
+            # A JSON body needs a CORS preflight, so other sites cannot post
+            # a plain form here; the file written is always VIBESTUDIO_FREEZE
+            if self.headers.get("Content-Type", "").split(";")[0].strip() != "application/json":
+                self._send_json({"error": "expected application/json"}, 415)
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+            data = json.loads(body or b"{}")
+            if not FREEZE_PATH:
+                self._send_json({"error": "no snapshot path; set VIBESTUDIO_FREEZE"}, 400)
+                return
+            result = freeze(FREEZE_PATH)
+            if data.get("serve", True):
+                result["serving"] = load_snapshot(FREEZE_PATH) is not None
+            self._send_json(result)
+        elif parsed.path == "/api/test_jobs":
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                data = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                data = None
+            modules = data.get("modules") if isinstance(data, dict) else None
+            if not isinstance(data, dict) or not (
+                modules is None or isinstance(modules, list) and all(isinstance(m, str) for m in modules)
+            ):
+                self._send_json({"error": "expected a JSON object whose modules is a list of names"}, 400)
+                return
+            try:
+                job = submit_tests(modules, bool(data.get("force")))
+            except KeyError as exc:
+                self._send_json({"error": f"unknown test module {exc.args[0]}"}, 400)
+                return
+            self._send_json(job.to_dict(), 202)
+        elif parsed.path.startswith("/api/test_jobs/"):
+            job, action = self._test_job(parsed.path)
+            if job is None:
+                return
+            if action == "cancel":
+                TEST_RUNNER.cancel(job.id)
+                self._send_json(job.to_dict())
+            else:
+                self._send_json({"error": "unknown action"}, 404)
         elif parsed.path == "/api/run_tests":
-            result = subprocess.run([
-                "python",
-                "-m",
-                "unittest",
-                "examples.test_simple_server",
-            ], capture_output=True, text=True)
-            self._send_json({"output": result.stdout + result.stderr, "returncode": result.returncode})
+            # Waits for the job; the Tester panel uses /api/test_jobs instead
+            job = submit_tests()
+            job.wait()
+            output = "".join(f"== {t['module']} ({t['status']})\n{t.get('output', '')}" for t in job.to_dict()["tests"])
+            self._send_json({"output": output, "returncode": 0 if job.status == "passed" else 1, "job": job.id})
         else:
             self.send_response(404)
             self.end_headers()
 
 
-def run(host="localhost", port=8500):
+def run(host="localhost", port=8500, engine=None):
+    global PROXY_ENGINE
+    if engine is not None:
+        PROXY_ENGINE = engine
+    if PROXY_WORKERS:
+        path = SHARED_STATE_PATH or os.path.join(tempfile.gettempdir(), f"vibestudio-{os.getpid()}.db")
+        attach_shared_state(path)
     with STATE_LOCK:
         LOGS.clear()
         META_LOGS.clear()
         _reset_conversation()
+    _publish_config()
+    load_routes()
+    load_snapshot()
     _start_proxy_server()
     # ThreadingHTTPServer allows the dashboard to remain responsive while
     # the proxy server handles slower LLM requests.
@@ -0,0 +1,246 @@
+"""Background test jobs for the Tester panel.
+
+A :class:`TestRunner` runs test modules as ``python -m unittest <module>``
+subprocesses, several at a time, each with a timeout.  A job can be polled,
+followed through its ``events`` log, or cancelled, which kills the
+subprocesses it still has running.
+
+A passing or failing result is remembered under a key combining the
+configuration fingerprint (prompts and model) with the module's source, so
+submitting the same tests again for an unchanged configuration returns the
+earlier results without running anything.  The least recently used results
+are forgotten beyond ``max_results``.
+"""
+
+import hashlib
+import itertools
+import json
+import logging
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .logbuffer import LogBuffer
+
+LOGGER = logging.getLogger(__name__)
+
+# Outcomes worth reusing; timeouts and errors are retried on the next job
+CACHEABLE = ("passed", "failed")
+
+
+def config_fingerprint(prompt, meta_prompt, model):
+    """Return the hash of the configuration test results are cached under."""
+    return hashlib.sha256(json.dumps([prompt, meta_prompt, model]).encode("utf-8")).hexdigest()
+
+
+def result_key(fingerprint, module, path):
+    """Return the cache key for ``module`` under ``fingerprint``; ``path`` is its source."""
+    digest = hashlib.sha256(f"{fingerprint}\0{module}\0".encode("utf-8"))
+    try:
+        with open(path, "rb") as fh:
+            digest.update(fh.read())
+    except OSError:
+        # Unreadable modules are never reused
+        digest.update(str(time.time()).encode("ascii"))
+    return digest.hexdigest()
+
+
+class TestJob:
+    """One submitted run of a set of test modules."""
+
+    __test__ = False  # keeps pytest from collecting it where tests import it
+
+    def __init__(self, job_id, modules, fingerprint):
+        self.id = job_id
+        self.modules = list(modules)
+        self.fingerprint = fingerprint
+        self.status = "running" if self.modules else "passed"
+        self.created = time.time()
+        self.finished = None if self.modules else self.created
+        self.results = OrderedDict((m, {"module": m, "status": "queued"}) for m in self.modules)
+        self.events = LogBuffer(2 * len(self.modules) + 2)
+        self._remaining = len(self.modules)
+        self._processes = {}
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+        if not self.modules:
+            self._done.set()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the job has finished; return whether it has."""
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "created": self.created,
+            "finished": self.finished,
+            "fingerprint": self.fingerprint,
+            "tests": [dict(result) for result in self.results.values()],
+        }
+
+
+class TestRunner:
+    """Run test modules in parallel subprocesses and keep recent jobs."""
+
+    __test__ = False  # keeps pytest from collecting it where tests import it
+
+    def __init__(self, cwd, workers=4, timeout=300.0, max_jobs=20, max_results=500):
+        self.cwd = cwd
+        self.timeout = timeout
+        self.max_jobs = max_jobs
+        self.max_results = max_results
+        self._pool = ThreadPoolExecutor(max(1, workers), thread_name_prefix="vibestudio-tests")
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        # Every prompt edit yields new keys, so the results are an LRU
+        self._results = OrderedDict()
+        self._ids = itertools.count(1)
+        self.runs = 0
+        self.cache_hits = 0
+        self.timeouts = 0
+        self.cancelled = 0
+
+    def submit(self, modules, fingerprint, force=False):
+        """Start a job for ``modules``, a list of ``(module, source_path)``.
+
+        Cached results are used unless ``force`` is set.
+        """
+        with self._lock:
+            job = TestJob(str(next(self._ids)), [m for m, _ in modules], fingerprint)
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.max_jobs:
+                oldest = next(iter(self._jobs.values()))
+                if not oldest.done:
+                    break
+                del self._jobs[oldest.id]
+        job.events.append({"type": "job", "id": job.id, "status": job.status, "tests": job.modules})
+        if job.done:
+            job.events.append({"type": "job", "id": job.id, "status": job.status, "final": True})
+        for module, path in modules:
+            key = result_key(fingerprint, module, path)
+            with self._lock:
+                cached = None if force else self._results.get(key)
+                if cached is not None:
+                    self._results.move_to_end(key)
+                    self.cache_hits += 1
+            if cached is not None:
+                self._finish(job, module, dict(cached, cached=True))
+            else:
+                self._pool.submit(self._run, job, module, key)
+        LOGGER.info("Test job %s: %d modules", job.id, len(modules))
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id):
+        """Cancel a job, killing its running tests; return the job or ``None``."""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        with self._lock:
+            job._cancelled.set()
+            processes = list(job._processes.values())
+        for process in processes:
+            process.kill()
+        return job
+
+    def _run(self, job, module, key):
+        if job._cancelled.is_set():
+            self._finish(job, module, {"status": "cancelled"})
+            return
+        self._update(job, module, status="running")
+        started = time.monotonic()
+        try:
+            process = subprocess.Popen(
+                [sys.executable, "-m", "unittest", module], cwd=self.cwd,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+            )
+        except OSError as exc:
+            self._finish(job, module, {"status": "error", "output": str(exc)})
+            return
+        with self._lock:
+            job._processes[module] = process
+            self.runs += 1
+        if job._cancelled.is_set():
+            process.kill()
+        try:
+            output, _ = process.communicate(timeout=self.timeout)
+            status = "passed" if process.returncode == 0 else "failed"
+        except subprocess.TimeoutExpired:
+            process.kill()
+            output, _ = process.communicate()
+            output += f"\nTimed out after {self.timeout} seconds\n"
+            status = "timeout"
+        with self._lock:
+            del job._processes[module]
+        if job._cancelled.is_set() and status != "passed":
+            status = "cancelled"
+        result = {
+            "status": status,
+            "returncode": process.returncode,
+            "output": output,
+            "duration": round(time.monotonic() - started, 3),
+        }
+        if status in CACHEABLE:
+            with self._lock:
+                self._results[key] = result
+                self._results.move_to_end(key)
+                while len(self._results) > self.max_results:
+                    self._results.popitem(last=False)
+        self._finish(job, module, dict(result, cached=False))
+
+    def _update(self, job, module, **changes):
+        with self._lock:
+            job.results[module].update(changes)
+            entry = dict(job.results[module], type="test")
+        job.events.append(entry)
+
+    def _finish(self, job, module, result):
+        with self._lock:
+            job.results[module].update(result)
+            entry = dict(job.results[module], type="test")
+            job._remaining -= 1
+            last = job._remaining == 0
+            if result["status"] == "timeout":
+                self.timeouts += 1
+            elif result["status"] == "cancelled":
+                self.cancelled += 1
+            if last:
+                statuses = {r["status"] for r in job.results.values()}
+                if job._cancelled.is_set():
+                    job.status = "cancelled"
+                else:
+                    job.status = "passed" if statuses == {"passed"} else "failed"
+                job.finished = time.time()
+        job.events.append(entry)
+        if last:
+            job.events.append({"type": "job", "id": job.id, "status": job.status, "final": True})
+            job._done.set()
+            LOGGER.info("Test job %s %s", job.id, job.status)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "jobs": len(self._jobs),
+                "running": sum(1 for job in self._jobs.values() if not job.done),
+                "runs": self.runs,
+                "cache_hits": self.cache_hits,
+                "cached_results": len(self._results),
+                "timeouts": self.timeouts,
+                "cancelled": self.cancelled,
+            }
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import unittest
+from http.client import HTTPConnection
+from unittest import mock
+
+from vibestudio import studio
+from vibestudio.aioproxy import AsyncProxyServerThread
+
+REPLY = "{{{ meta }}}\nHTTP/1.1 200 OK\nContent-Type: text/html\n\n<html>ASYNC</html>\n{{{ tail }}}"
+
+
+class AsyncProxyTest(unittest.TestCase):
+    def setUp(self):
+        self.captured = []
+        outer = self
+
+        def fake_call(self, messages):
+            outer.captured.append(list(messages))
+            return REPLY
+
+        self.patcher = mock.patch.object(studio.ProxyHandler, "call_llm", fake_call)
+        self.patcher.start()
+        studio.LOGS = []
+        studio.META_LOGS = []
+        studio.CONVERSATION = []
+        self.thread = AsyncProxyServerThread(studio, port=8007)
+        self.thread.start()
+
+    def tearDown(self):
+        self.thread.stop()
+        self.thread.join()
+        self.patcher.stop()
+
+    def test_keep_alive_connection_serves_several_requests(self):
+        conn = HTTPConnection("localhost", 8007)
+        for path in ("/one", "/two"):
+            conn.request("GET", path)
+            resp = conn.getresponse()
+            self.assertEqual(resp.read(), b"<html>ASYNC</html>")
+            self.assertEqual(resp.status, 200)
+            self.assertEqual(resp.getheader("Content-Type"), "text/html")
+            self.assertFalse(resp.will_close)
+        conn.close()
+        self.assertEqual(len(self.captured), 2)
+        self.assertEqual(studio.LOGS[-2]["request"], "/two")
+        self.assertEqual(studio.META_LOGS[-1]["text"], "tail")
+
+    def test_post_body_and_request_text_match_threaded_handler(self):
+        conn = HTTPConnection("localhost", 8007)
+        conn.request("POST", "/submit", body="name=Bob", headers={"Content-Type": "text/plain"})
+        conn.getresponse().read()
+        conn.close()
+        sent = self.captured[-1][-1]["content"]
+        self.assertTrue(sent.startswith("POST /submit HTTP/1.1\nHost: localhost:8007\n"))
+        self.assertTrue(sent.endswith("Content-Type: text/plain\n\nname=Bob"))
+
+    def test_streaming_uses_chunked_encoding(self):
+        with mock.patch.object(studio, "STREAMING", True):
+            conn = HTTPConnection("localhost", 8007)
+            conn.request("GET", "/stream")
+            resp = conn.getresponse()
+            self.assertEqual(resp.getheader("Transfer-Encoding"), "chunked")
+            self.assertEqual(resp.read(), b"<html>ASYNC</html>")
+            conn.request("HEAD", "/stream")
+            resp = conn.getresponse()
+            self.assertEqual(resp.read(), b"")
+            conn.close()
+
+    def test_connection_close_is_honoured(self):
+        conn = HTTPConnection("localhost", 8007)
+        conn.request("GET", "/", headers={"Connection": "close"})
+        resp = conn.getresponse()
+        resp.read()
+        self.assertTrue(resp.will_close)
+        conn.close()
+
+    def test_unknown_methods_are_not_implemented(self):
+        before = studio.METRICS.render()
+        conn = HTTPConnection("localhost", 8007)
+        conn.request("BREW", "/pot")
+        resp = conn.getresponse()
+        resp.read()
+        conn.close()
+        self.assertEqual(resp.status, 501)
+        self.assertEqual(self.captured, [])
+        self.assertNotIn('method="BREW"', studio.METRICS.render())
+        self.assertNotIn('method="BREW"', before)
+
+    def test_event_loop_keeps_running_while_the_state_lock_is_held(self):
+        result = {}
+
+        def request():
+            conn = HTTPConnection("localhost", 8007, timeout=10)
+            conn.request("GET", "/blocked")
+            result["status"] = conn.getresponse().status
+            conn.close()
+
+        with studio.STATE_LOCK:
+            client = threading.Thread(target=request)
+            client.start()
+            # The request waits for the lock on a state thread, not on the loop
+            ping = asyncio.run_coroutine_threadsafe(asyncio.sleep(0.2, "pong"), self.thread.loop)
+            self.assertEqual(ping.result(2), "pong")
+            self.assertNotIn("status", result)
+        client.join(10)
+        self.assertEqual(result["status"], 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
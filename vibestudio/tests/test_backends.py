@@ -0,0 +1,183 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import types
+import unittest
+from http.client import HTTPConnection
+from unittest import mock
+
+from vibestudio import studio
+from vibestudio.aioproxy import AsyncProxyServerThread
+from vibestudio.backends import OpenAIBackend, ScriptedBackend, create_backend
+from vibestudio.chain import ResponseChain
+
+MESSAGES = [{"role": "user", "content": "GET /hello HTTP/1.1\nHost: x\n\n"}]
+
+
+class _ServerThread(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.server = studio.HTTPServer(("localhost", 8008), studio.ProxyHandler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def fake_openai_module(reply="ok"):
+    response = types.SimpleNamespace(
+        id="resp-1",
+        output_text=reply,
+        choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=reply))],
+        usage=types.SimpleNamespace(input_tokens=7, output_tokens=2),
+    )
+    clients = []
+
+    class FakeClient:
+        def __init__(self, api_key, base_url=None):
+            self.api_key = api_key
+            self.base_url = base_url
+            self.responses = types.SimpleNamespace(create=mock.Mock(return_value=response))
+            self.chat = types.SimpleNamespace(
+                completions=types.SimpleNamespace(create=mock.Mock(return_value=response))
+            )
+            clients.append(self)
+
+    return types.SimpleNamespace(OpenAI=FakeClient), clients
+
+
+class ScriptedBackendTest(unittest.TestCase):
+    def test_script_cycles_deterministically(self):
+        backend = ScriptedBackend(["one", "two"])
+        replies = [backend.complete(MESSAGES, "m").text for _ in range(3)]
+        self.assertEqual(replies, ["one", "two", "one"])
+        self.assertEqual(backend.calls, 3)
+
+    def test_default_reply_echoes_request_line(self):
+        completion = ScriptedBackend().complete(MESSAGES, "m")
+        self.assertTrue(completion.text.startswith("HTTP/1.1 200 OK\n"))
+        self.assertIn("GET /hello HTTP/1.1", completion.text)
+        self.assertGreater(completion.usage["input_tokens"], 0)
+
+    def test_stream_chunks_rebuild_reply(self):
+        backend = ScriptedBackend(["HTTP/1.1 200 OK\n\nhello  big world"])
+        chunks = list(backend.stream(MESSAGES, "m"))
+        self.assertGreater(len(chunks), 3)
+        self.assertEqual("".join(chunks), "HTTP/1.1 200 OK\n\nhello  big world")
+
+    def test_latency_is_applied(self):
+        backend = ScriptedBackend(["x"], latency=0.05)
+        start = time.monotonic()
+        backend.complete(MESSAGES, "m")
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+    def test_async_stream(self):
+        backend = ScriptedBackend(["a b c"], tokens_per_second=1000)
+
+        async def collect():
+            return [chunk async for chunk in backend.astream(MESSAGES, "m")]
+
+        self.assertEqual("".join(asyncio.run(collect())), "a b c")
+
+    def test_script_file(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as fh:
+            fh.write(json.dumps("first") + "\n" + json.dumps("second") + "\n")
+        try:
+            backend = create_backend("mock", script_path=fh.name)
+        finally:
+            os.unlink(fh.name)
+        self.assertEqual(backend.script, ["first", "second"])
+
+
+class CreateBackendTest(unittest.TestCase):
+    def test_configuration_errors(self):
+        with self.assertRaises(RuntimeError):
+            create_backend("openai", module=None, api_key="x")
+        with self.assertRaises(RuntimeError):
+            create_backend("openai", module=types.SimpleNamespace(), api_key=None)
+        with self.assertRaises(RuntimeError):
+            create_backend("compatible", module=types.SimpleNamespace())
+        with self.assertRaises(ValueError):
+            create_backend("nope")
+
+    def test_openai_backend_reuses_one_client(self):
+        module, clients = fake_openai_module()
+        backend = OpenAIBackend(module, "key")
+        chain = ResponseChain()
+        for _ in range(3):
+            completion = backend.complete(MESSAGES, "m", chain)
+        self.assertEqual(len(clients), 1)
+        self.assertEqual(clients[0].responses.create.call_count, 3)
+        self.assertEqual(completion.usage, {"input_tokens": 7, "output_tokens": 2})
+
+    def test_compatible_backend_uses_chat_completions(self):
+        module, clients = fake_openai_module()
+        backend = create_backend("compatible", module=module, base_url="http://localhost:11434/v1")
+        backend.complete(MESSAGES, "m", ResponseChain())
+        self.assertEqual(clients[0].base_url, "http://localhost:11434/v1")
+        clients[0].chat.completions.create.assert_called_once()
+        clients[0].responses.create.assert_not_called()
+
+    def test_studio_caches_backend(self):
+        module, clients = fake_openai_module()
+        with mock.patch.dict(studio.__dict__, {"openai": module}):
+            with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "x"}):
+                first = studio.get_backend()
+                self.assertIs(studio.get_backend(), first)
+        self.assertEqual(len(clients), 1)
+
+
+class MockBackendProxyTest(unittest.TestCase):
+    def setUp(self):
+        self.patcher = mock.patch.object(studio, "BACKEND", "mock")
+        self.patcher.start()
+        studio.LOGS = []
+        studio.META_LOGS = []
+        studio.CONVERSATION = []
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def request(self, port, path):
+        conn = HTTPConnection("localhost", port)
+        conn.request("GET", path)
+        resp = conn.getresponse()
+        body = resp.read()
+        conn.close()
+        return resp, body
+
+    def test_threaded_proxy_serves_mock_replies(self):
+        thread = _ServerThread()
+        thread.start()
+        try:
+            resp, body = self.request(8008, "/offline")
+            with mock.patch.object(studio, "STREAMING", True):
+                _, streamed = self.request(8008, "/streamed")
+        finally:
+            thread.stop()
+            thread.join()
+        self.assertEqual(resp.status, 200)
+        self.assertIn(b"GET /offline HTTP/1.1", body)
+        self.assertIn(b"GET /streamed HTTP/1.1", streamed)
+
+    def test_async_proxy_awaits_mock_backend(self):
+        thread = AsyncProxyServerThread(studio, port=8009)
+        thread.start()
+        try:
+            with mock.patch.object(studio.ProxyHandler, "call_llm", side_effect=AssertionError):
+                resp, body = self.request(8009, "/async")
+        finally:
+            thread.stop()
+            thread.join()
+        self.assertEqual(resp.status, 200)
+        self.assertIn(b"GET /async HTTP/1.1", body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
+
+from vibestudio import bench, studio
+
+
+class _ServerThread(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.server = studio.ThreadingHTTPServer(("localhost", 8010), studio.ProxyHandler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class BenchHelpersTest(unittest.TestCase):
+    def test_percentile_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(bench.percentile(values, 50), 50)
+        self.assertEqual(bench.percentile(values, 99), 99)
+        self.assertEqual(bench.percentile(values, 100), 100)
+        self.assertIsNone(bench.percentile([], 50))
+
+    def test_load_corpus_accepts_requests_and_traffic_logs(self):
+        items = [
+            {"method": "POST", "path": "/form", "body": "a=1"},
+            {"type": "http", "request": "/logged", "status": 200},
+            {"type": "llm_exchange", "request": "ignored"},
+        ]
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as fh:
+            fh.write("\n".join(json.dumps(item) for item in items))
+        try:
+            corpus = bench.load_corpus(fh.name)
+        finally:
+            os.unlink(fh.name)
+        self.assertEqual([(r["method"], r["path"]) for r in corpus], [("POST", "/form"), ("GET", "/logged")])
+        self.assertEqual(corpus[0]["body"], "a=1")
+
+    def test_compare_reports_relative_change(self):
+        baseline = {"results": {"throughput_rps": 100.0, "latency_ms": {"p50": 10.0}, "errors": {}}}
+        current = {"results": {"throughput_rps": 150.0, "latency_ms": {"p50": 5.0}, "errors": {"HTTP 500": 1}}}
+        rows = {row[0]: row for row in bench.compare(baseline, current)}
+        self.assertEqual(rows["throughput_rps"][3], 50.0)
+        self.assertEqual(rows["latency_ms.p50"][3], -50.0)
+        self.assertNotIn("errors", rows)
+
+
+class ParserBenchmarkTest(unittest.TestCase):
+    def test_parsers_agree_on_sample_pages(self):
+        for kind in ("css", "table", "minified"):
+            text = bench.sample_reply(kind, 4096)
+            status, headers, body, meta, suffix_meta = bench.legacy_parse(text)
+            reply = bench.parse_reply(text)
+            self.assertEqual(bytes(reply.body), body, kind)
+            self.assertEqual((reply.status, reply.meta, reply.suffix_meta), (status, meta, suffix_meta))
+            self.assertEqual(b"".join(bench._stream_parse(text.encode("utf-8"), 7)), body, kind)
+
+    def test_parser_run(self):
+        with redirect_stdout(StringIO()) as out:
+            bench.main(["parser", "--sizes", "2048", "--number", "1", "--repeat", "1"])
+        self.assertIn("parse_reply", out.getvalue())
+
+
+class RunLoadTest(unittest.TestCase):
+    def setUp(self):
+        def fake_call(self, messages):
+            if "/fail" in messages[-1]["content"]:
+                return "HTTP/1.1 503 Service Unavailable\n\nbusy"
+            return "HTTP/1.1 200 OK\nContent-Type: text/plain\n\nok"
+
+        self.patcher = mock.patch.object(studio.ProxyHandler, "call_llm", fake_call)
+        self.patcher.start()
+        studio.LOGS = []
+        studio.META_LOGS = []
+        studio.CONVERSATION = []
+        self.thread = _ServerThread()
+        self.thread.start()
+
+    def tearDown(self):
+        self.thread.stop()
+        self.thread.join()
+        self.patcher.stop()
+
+    def test_counts_latencies_and_errors(self):
+        corpus = bench.synthetic_corpus(3) + [{"method": "GET", "path": "/fail", "headers": {}, "body": ""}]
+        results = bench.run_load("localhost", 8010, corpus, 20, concurrency=4, rate=500)
+        self.assertEqual(results["requests"], 20)
+        self.assertEqual(results["ok"], 15)
+        self.assertEqual(results["errors"], {"HTTP 503": 5})
+        self.assertLessEqual(results["ttfb_ms"]["p50"], results["latency_ms"]["p50"])
+        self.assertGreater(results["throughput_rps"], 0)
+
+
+class ProxyBenchmarkTest(unittest.TestCase):
+    def test_child_proxy_run_writes_results(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "run.json")
+            argv = ["proxy", "--requests", "10", "--concurrency", "2", "--latency", "0", "--port", "8011"]
+            with redirect_stdout(StringIO()) as out:
+                bench.main(argv + ["--output", output])
+                bench.main(argv + ["--compare", output])
+            with open(output, "r", encoding="utf-8") as fh:
+                report = json.load(fh)
+        self.assertEqual(report["results"]["ok"], 10)
+        self.assertGreaterEqual(report["results"]["proxy_cpu_s"], 0)
+        self.assertIn("change %", out.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
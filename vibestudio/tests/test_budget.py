@@ -0,0 +1,286 @@
+import json
+import threading
+import time
+import unittest
+from http.client import HTTPConnection
+from unittest import mock
+
+from vibestudio import studio, tokens
+from vibestudio.aioproxy import AsyncProxyServerThread
+from vibestudio.backends import Completion
+from vibestudio.budget import TokenLedger
+from vibestudio.prefetch import Prefetcher
+
+INDEX = 'HTTP/1.1 200 OK\nContent-Type: text/html\n\n<a href="/a">A</a> <a href="/b">B</a>'
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class _UsageBackend:
+    """Reply to every request and report a fixed usage."""
+
+    name = "usage"
+    streaming = False
+    native_async = False
+
+    def __init__(self, usage, reply="HTTP/1.1 200 OK\nContent-Type: text/plain\n\nok"):
+        self.usage = usage
+        self.reply = reply
+        self.calls = []
+
+    def complete(self, messages, model, chain=None):
+        self.calls.append(messages)
+        return Completion(self.reply, None, self.usage)
+
+
+class _ServerThread(threading.Thread):
+    def __init__(self, port):
+        super().__init__(daemon=True)
+        self.server = studio.ThreadingHTTPServer(("localhost", port), studio.ProxyHandler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def get(port, path, session=None):
+    conn = HTTPConnection("localhost", port, timeout=10)
+    conn.request("GET", path, headers={"X-Vibe-Session": session} if session else {})
+    resp = conn.getresponse()
+    body = resp.read()
+    conn.close()
+    return resp, body
+
+
+class TokenLedgerTest(unittest.TestCase):
+    def test_accounting_and_estimate_ratio(self):
+        ledger = TokenLedger()
+        self.assertFalse(ledger.enforcing)
+        self.assertEqual(ledger.record("a", 120, 30, reported=True, estimated_input=100), (150, 150))
+        self.assertEqual(ledger.record("b", 50, 10), (210, 60))
+        self.assertEqual(ledger.record(None, 10, 0), (220, None))
+        self.assertIsNone(ledger.check("a", 10**6))
+        stats = ledger.stats()
+        self.assertEqual((stats["calls"], stats["input_tokens"], stats["output_tokens"]), (3, 180, 40))
+        self.assertEqual((stats["reported"], stats["estimated"], stats["clients"]), (1, 2, 2))
+        self.assertEqual(stats["estimate_ratio"], 1.2)
+        self.assertEqual(stats["largest_prompt"], 120)
+        self.assertEqual([c["client"] for c in stats["top_clients"]], ["a", "b"])
+
+    def test_context_budget(self):
+        ledger = TokenLedger(context_budget=100, action="compact")
+        self.assertIsNone(ledger.check("a", 100))
+        self.assertEqual(ledger.check("a", 101), ("compact", "context", None))
+        self.assertEqual(ledger.stats()["compactions"], 1)
+
+    def test_spend_budgets_over_a_window(self):
+        clock = _Clock()
+        ledger = TokenLedger(session_budget=100, global_budget=150, window=60, action="reject", clock=clock)
+        ledger.record("a", 50, 30)
+        clock.now += 30
+        ledger.record("b", 40, 0)
+        self.assertIsNone(ledger.check("a", 20))
+        # 80 spent by "a" 30 seconds ago has to age out first
+        self.assertEqual(ledger.check("a", 21), ("reject", "session", 30))
+        self.assertEqual(ledger.check("c", 31), ("reject", "global", 30))
+        clock.now += 31
+        self.assertIsNone(ledger.check("a", 100))
+        self.assertEqual(ledger.stats()["window_tokens"], 40)
+        self.assertEqual(ledger.stats()["over_budget"], {"session": 1, "global": 1})
+        self.assertEqual(ledger.stats()["rejections"], 2)
+
+    def test_session_budget_applies_before_any_spend(self):
+        ledger = TokenLedger(session_budget=100, action="reject")
+        self.assertEqual(ledger.check("new", 101), ("reject", "session", None))
+        self.assertIsNone(ledger.check(None, 101))
+
+    def test_without_a_window_spend_never_expires(self):
+        ledger = TokenLedger(global_budget=100, window=0, action="warn")
+        ledger.record("a", 90, 10)
+        self.assertEqual(ledger.check("a", 1), ("warn", "global", None))
+
+    def test_uncounted_checks(self):
+        ledger = TokenLedger(global_budget=10, action="reject")
+        self.assertEqual(ledger.check(None, 11, count=False), ("reject", "global", None))
+        self.assertEqual((ledger.stats()["rejections"], ledger.stats()["over_budget"]), (0, {}))
+
+    def test_unknown_action(self):
+        with self.assertRaises(ValueError):
+            TokenLedger(action="ignore")
+
+
+class EstimateCacheTest(unittest.TestCase):
+    def test_each_message_is_estimated_once(self):
+        history = [{"role": "user", "content": f"GET /estimated-once/{i} HTTP/1.1"} for i in range(3)]
+        reply = {"role": "assistant", "content": "HTTP/1.1 200 OK\n\nestimated once"}
+        with mock.patch.object(tokens, "estimate_text_tokens", wraps=tokens.estimate_text_tokens) as estimate:
+            first = tokens.estimate_tokens(history)
+            second = tokens.estimate_tokens(list(history) + [reply])
+        # The second call only counts the new message
+        self.assertEqual(estimate.call_count, 4)
+        self.assertEqual(second, first + tokens.estimate_text_tokens(reply["content"]) + tokens.MESSAGE_OVERHEAD)
+
+
+class TokenBudgetProxyTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = _UsageBackend({"input_tokens": 100, "output_tokens": 20})
+        self.ledger = TokenLedger(session_budget=150, window=60, action="reject")
+        self.patchers = [
+            mock.patch.object(studio, "get_backend", return_value=self.backend),
+            mock.patch.object(studio, "TOKEN_LEDGER", self.ledger),
+            mock.patch.object(studio, "SESSIONS", studio.SessionManager(studio._new_session_conversation)),
+        ]
+        for p in self.patchers:
+            p.start()
+        studio.LOGS = []
+        studio.META_LOGS = []
+        studio.CONVERSATION = [{"role": "user", "content": "{{meta}}"}, {"role": "user", "content": "{{prompt}}"}]
+
+    def tearDown(self):
+        for p in self.patchers:
+            p.stop()
+
+    def assert_rejects_over_budget(self, port):
+        resp, _ = get(port, "/one")
+        self.assertEqual(resp.status, 200)
+        session = resp.getheader("Set-Cookie").split(";")[0].split("=", 1)[1]
+        http = [e for e in studio.LOGS if e["type"] == "http"]
+        tokens = {"input": 100, "output": 20, "reported": True, "total": 120, "session": 120}
+        self.assertEqual(http[0]["tokens"], tokens)
+        resp, body = get(port, "/two", session)
+        self.assertEqual(resp.status, 429)
+        self.assertEqual(resp.getheader("Retry-After"), "60")
+        self.assertIn(b"session", body)
+        self.assertEqual(len(self.backend.calls), 1)
+        self.assertTrue(studio.LOGS[-1]["budget"])
+        # Another client has its own budget
+        self.assertEqual(get(port, "/two")[0].status, 200)
+        self.assertEqual(studio._stats()["tokens"]["total_tokens"], 240)
+
+    def test_threaded_proxy_rejects_over_budget(self):
+        thread = _ServerThread(8033)
+        thread.start()
+        try:
+            self.assert_rejects_over_budget(8033)
+        finally:
+            thread.stop()
+            thread.join()
+
+    def test_async_proxy_rejects_over_budget(self):
+        thread = AsyncProxyServerThread(studio, port=8034)
+        thread.start()
+        try:
+            self.assert_rejects_over_budget(8034)
+        finally:
+            thread.stop()
+            thread.join()
+
+    def test_compact_action_shrinks_the_prompt_first(self):
+        self.ledger.context_budget = 300
+        self.ledger.session_budget = 0
+        self.ledger.action = "compact"
+        filler = "word " * 100
+        for i in range(5):
+            studio.CONVERSATION += [
+                {"role": "user", "content": f"GET /{i} HTTP/1.1\n\n{filler}"},
+                {"role": "assistant", "content": "HTTP/1.1 200 OK\n\nok"},
+            ]
+        thread = _ServerThread(8033)
+        thread.start()
+        try:
+            self.assertEqual(get(8033, "/next")[0].status, 200)
+        finally:
+            thread.stop()
+            thread.join()
+        sent = self.backend.calls[0]
+        self.assertLessEqual(studio.estimate_tokens(sent), 300)
+        self.assertIn("Summary of earlier traffic", sent[2]["content"])
+        self.assertIn("/next", sent[-1]["content"])
+        self.assertEqual(self.ledger.stats()["compactions"], 1)
+
+
+    def test_meta_chat_is_held_to_the_global_budget(self):
+        self.ledger.session_budget = 0
+        self.ledger.global_budget = 150
+        self.ledger.record("someone", 140, 0)
+        server = studio.ThreadingHTTPServer(("localhost", 8513), studio.StudioHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            conn = HTTPConnection("localhost", 8513, timeout=10)
+            conn.request("POST", "/api/meta_chat", body=json.dumps({"text": "be terse"}))
+            resp = conn.getresponse()
+            data = json.loads(resp.read())
+            conn.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(resp.status, 429)
+        self.assertIn("global", data["error"])
+        self.assertEqual((self.backend.calls, studio.META_LOGS), ([], []))
+
+
+class PrefetchBudgetTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = _UsageBackend({"input_tokens": 100, "output_tokens": 20}, INDEX)
+        self.prefetcher = Prefetcher(workers=2, fanout=2)
+        self.ledger = TokenLedger()
+        self.patchers = [
+            mock.patch.object(studio, "get_backend", return_value=self.backend),
+            mock.patch.object(studio, "TOKEN_LEDGER", self.ledger),
+            mock.patch.object(studio, "PREFETCHER", self.prefetcher),
+            mock.patch.object(studio, "SESSIONS", studio.SessionManager(studio._new_session_conversation)),
+        ]
+        for p in self.patchers:
+            p.start()
+        studio.LOGS = []
+        studio.META_LOGS = []
+        studio.CONVERSATION = []
+
+    def tearDown(self):
+        for p in self.patchers:
+            p.stop()
+
+    def serve_index(self):
+        thread = _ServerThread(8035)
+        thread.start()
+        try:
+            self.assertEqual(get(8035, "/")[0].status, 200)
+        finally:
+            thread.stop()
+            thread.join()
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            stats = self.prefetcher.stats()
+            if not (stats["planning"] or stats["pending"]):
+                break
+            time.sleep(0.005)
+
+    def test_prefetches_are_accounted_to_the_session(self):
+        self.serve_index()
+        self.assertEqual(self.prefetcher.stats()["generated"], 2)
+        # The reported usage, as recorded by the ledger
+        self.assertEqual(self.prefetcher.stats()["tokens_spent"], 240)
+        self.assertEqual(self.ledger.stats()["top_clients"][0]["input_tokens"], 300)
+
+    def test_no_prefetch_over_budget(self):
+        self.ledger.session_budget = 125
+        self.ledger.action = "reject"
+        self.serve_index()
+        self.assertEqual(self.prefetcher.stats()["scheduled"], 0)
+        self.assertEqual(len(self.backend.calls), 1)
+        # Skipped speculation is not a rejected request
+        self.assertEqual(self.ledger.stats()["rejections"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
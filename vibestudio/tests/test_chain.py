@@ -0,0 +1,127 @@
+import asyncio
+import os
+import types
+import unittest
+from unittest import mock
+
+from vibestudio import studio
+from vibestudio.backends import OpenAIBackend
+from vibestudio.chain import ResponseChain
+
+class NotFoundError(Exception):
+    pass
+
+
+PINNED = [
+    {"role": "system", "content": "{{{meta}}}"},
+    {"role": "user", "content": "{{{service}}}"},
+]
+
+
+class ResponseChainTest(unittest.TestCase):
+    def test_delta_after_commit(self):
+        chain = ResponseChain()
+        first = PINNED + [{"role": "user", "content": "GET /"}]
+        self.assertEqual(chain.prepare(first), (None, first))
+        chain.commit(first, "reply", "r1")
+        second = first + [
+            {"role": "assistant", "content": "reply"},
+            {"role": "user", "content": "GET /a"},
+        ]
+        self.assertEqual(chain.prepare(second), ("r1", [{"role": "user", "content": "GET /a"}]))
+        self.assertEqual(chain.stats()["messages_skipped"], 4)
+
+    def test_changed_prefix_resends_everything(self):
+        chain = ResponseChain()
+        first = PINNED + [{"role": "user", "content": "GET /"}]
+        chain.commit(first, "reply", "r1")
+        compacted = PINNED + [{"role": "user", "content": "GET /b"}]
+        self.assertEqual(chain.prepare(compacted), (None, compacted))
+
+    def test_extra_keys_are_dropped(self):
+        chain = ResponseChain()
+        _, sent = chain.prepare([{"content": "x", "role": "user", "ts": 1}])
+        self.assertEqual(list(sent[0].items()), [("role", "user"), ("content", "x")])
+
+
+class ChainedCallTest(unittest.TestCase):
+    def setUp(self):
+        self.ids = iter(["r1", "r2", "r3"])
+        self.create = mock.Mock(side_effect=self.respond)
+        fake_openai = types.SimpleNamespace(
+            responses=types.SimpleNamespace(create=self.create), NotFoundError=NotFoundError
+        )
+        self.patchers = [
+            mock.patch.dict(studio.__dict__, {"openai": fake_openai, "RESPONSE_CHAIN": ResponseChain()}),
+            mock.patch.dict(os.environ, {"OPENAI_API_KEY": "x"}),
+        ]
+        for p in self.patchers:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patchers:
+            p.stop()
+
+    def respond(self, model, input, previous_response_id):
+        return types.SimpleNamespace(id=next(self.ids), output_text="HTTP/1.1 200 OK\n\nok")
+
+    def call(self, messages):
+        return studio.ProxyHandler.call_llm(studio.ProxyHandler, messages)
+
+    def test_only_new_messages_uploaded(self):
+        conversation = PINNED + [{"role": "user", "content": "GET /"}]
+        reply = self.call(conversation)
+        conversation += [{"role": "assistant", "content": reply}, {"role": "user", "content": "GET /a"}]
+        self.call(conversation)
+        kwargs = self.create.call_args.kwargs
+        self.assertEqual(kwargs["previous_response_id"], "r1")
+        self.assertEqual(kwargs["input"], [{"role": "user", "content": "GET /a"}])
+
+    def test_lost_chain_falls_back_to_full_history(self):
+        conversation = PINNED + [{"role": "user", "content": "GET /"}]
+        reply = self.call(conversation)
+        conversation += [{"role": "assistant", "content": reply}, {"role": "user", "content": "GET /a"}]
+        self.create.side_effect = [NotFoundError("previous response not found"), self.respond(None, None, None)]
+        self.assertEqual(self.call(conversation), "HTTP/1.1 200 OK\n\nok")
+        kwargs = self.create.call_args.kwargs
+        self.assertIsNone(kwargs["previous_response_id"])
+        self.assertEqual(kwargs["input"], conversation)
+
+    def test_other_errors_do_not_resend_the_history(self):
+        conversation = PINNED + [{"role": "user", "content": "GET /"}]
+        reply = self.call(conversation)
+        conversation += [{"role": "assistant", "content": reply}, {"role": "user", "content": "GET /a"}]
+        self.create.side_effect = RuntimeError("rate limited")
+        with self.assertRaises(studio.LLMError):
+            self.call(conversation)
+        previous_ids = [c.kwargs["previous_response_id"] for c in self.create.call_args_list[1:]]
+        self.assertTrue(previous_ids)
+        self.assertEqual(set(previous_ids), {"r1"})
+
+
+class AsyncChainedCallTest(unittest.TestCase):
+    def test_native_async_calls_are_chained(self):
+        ids = iter(["r1", "r2"])
+        calls = []
+
+        async def create(model, input, previous_response_id):
+            calls.append((previous_response_id, input))
+            return types.SimpleNamespace(id=next(ids), output_text="HTTP/1.1 200 OK\n\nok")
+
+        responses = types.SimpleNamespace(create=create)
+        module = types.SimpleNamespace(
+            responses=responses,
+            AsyncOpenAI=lambda api_key, base_url: types.SimpleNamespace(responses=responses),
+        )
+        backend = OpenAIBackend(module, "x")
+        chain = ResponseChain()
+        conversation = PINNED + [{"role": "user", "content": "GET /"}]
+        reply = asyncio.run(backend.acomplete(conversation, "m", chain)).text
+        conversation += [{"role": "assistant", "content": reply}, {"role": "user", "content": "GET /a"}]
+        asyncio.run(backend.acomplete(conversation, "m", chain))
+        self.assertEqual(calls[1], ("r1", [{"role": "user", "content": "GET /a"}]))
+        self.assertEqual(chain.response_id, "r2")
+
+
+if __name__ == "__main__":
+    unittest.main()
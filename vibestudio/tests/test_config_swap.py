@@ -0,0 +1,189 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.client import HTTPConnection
+from unittest import mock
+
+from vibestudio import studio
+from vibestudio.aioproxy import AsyncProxyServerThread
+from vibestudio.cache import ResponseCache
+
+
+class _ServerThread(threading.Thread):
+    def __init__(self, port, handler):
+        super().__init__(daemon=True)
+        self.server = studio.ThreadingHTTPServer(("localhost", port), handler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def get(port, path, conn=None):
+    own = conn is None
+    conn = conn or HTTPConnection("localhost", port, timeout=10)
+    conn.request("GET", path)
+    resp = conn.getresponse()
+    body = resp.read()
+    if own:
+        conn.close()
+    return resp.status, body
+
+
+class ConfigSwapTest(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.entered = threading.Event()
+        self.seen = []
+
+        def call_llm(handler, messages):
+            config = studio._config()
+            self.seen.append((messages[-1]["content"].split()[1], config.version, config.model))
+            if "/slow" in messages[-1]["content"]:
+                self.entered.set()
+                self.release.wait(10)
+            return f"HTTP/1.1 200 OK\nContent-Type: text/plain\n\n{config.model}"
+
+        self.patchers = [
+            mock.patch.object(studio.ProxyHandler, "call_llm", call_llm),
+            mock.patch.object(studio, "RESPONSE_CACHE", ResponseCache()),
+            mock.patch.object(studio, "_SERVER_THREAD", object()),
+            mock.patch.object(studio, "_start_proxy_server"),
+            mock.patch.object(studio, "PROMPT", "old prompt"),
+            mock.patch.object(studio, "META_PROMPT", "meta"),
+            mock.patch.object(studio, "MODEL", "old-model"),
+            mock.patch.object(studio, "TEMPERATURE", ""),
+            mock.patch.object(studio, "THINKING_TIME", ""),
+        ]
+        for p in self.patchers:
+            p.start()
+        studio.LOGS = []
+        studio.META_LOGS = []
+        studio.CONVERSATION = [{"role": "user", "content": "{{old prompt}}"}]
+
+    def tearDown(self):
+        self.release.set()
+        for p in self.patchers:
+            p.stop()
+
+    def test_swap_is_versioned_and_atomic(self):
+        version = studio.CONFIG_VERSION
+        old = studio.CONVERSATION
+        self.assertEqual(studio._swap_config(model="new-model"), version + 1)
+        self.assertIs(studio.CONVERSATION, old)
+        self.assertEqual(studio._swap_config(reset=True, prompt="new prompt"), version + 2)
+        config = studio._config()
+        self.assertEqual((config.prompt, config.model, config.version), ("new prompt", "new-model", version + 2))
+        self.assertIsNot(config.conversation, old)
+        self.assertEqual(config.conversation[1]["content"], "{{new prompt}}")
+        self.assertEqual(studio._stats()["config"], {"version": version + 2})
+
+    def test_every_api_swap_saves_the_value_and_invalidates(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        files = {name: os.path.join(directory, name) for name in ("prompt", "meta_prompt", "model")}
+        studio_thread = _ServerThread(8511, studio.StudioHandler)
+        studio_thread.start()
+        try:
+            with mock.patch.dict(studio._CONFIG_FILES, files):
+                for path, body in (
+                    ("/api/prompt", {"prompt": "new prompt"}),
+                    ("/api/meta_prompt", {"meta_prompt": "new meta"}),
+                    ("/api/settings", {"model": "new-model", "temperature": "0.5"}),
+                ):
+                    conn = HTTPConnection("localhost", 8511, timeout=10)
+                    conn.request("POST", path, body=json.dumps(body))
+                    self.assertEqual(conn.getresponse().status, 200)
+                    conn.close()
+        finally:
+            studio_thread.stop()
+            studio_thread.join()
+        saved = {}
+        for name, path in files.items():
+            with open(path, encoding="utf-8") as fh:
+                saved[name] = fh.read()
+        self.assertEqual(saved, {"prompt": "new prompt", "meta_prompt": "new meta", "model": "new-model"})
+        self.assertEqual(studio.RESPONSE_CACHE.stats()["invalidations"], 3)
+
+    def test_requests_do_not_wait_for_the_workers_to_be_told(self):
+        publishing = threading.Event()
+
+        def publish():
+            publishing.set()
+            self.release.wait(10)
+
+        with mock.patch.object(studio, "_publish_config", publish):
+            swap = threading.Thread(target=studio._swap_config, kwargs={"model": "new-model"})
+            swap.start()
+            self.assertTrue(publishing.wait(5))
+            # The swap is already visible while the shared state is written
+            self.assertTrue(studio.STATE_LOCK.acquire(timeout=1))
+            studio.STATE_LOCK.release()
+            self.assertEqual(studio._config().model, "new-model")
+            self.release.set()
+            swap.join(5)
+
+    def test_in_flight_request_finishes_on_the_old_version(self):
+        proxy = _ServerThread(8031, studio.ProxyHandler)
+        proxy.start()
+        try:
+            old_conversation = studio.CONVERSATION
+            slow = {}
+            worker = threading.Thread(target=lambda: slow.update(reply=get(8031, "/slow")))
+            worker.start()
+            self.assertTrue(self.entered.wait(10))
+            studio._swap_config(reset=True, prompt="new prompt", model="new-model")
+
+            # The listener never went away: new requests use the new version at once
+            self.assertEqual(get(8031, "/fast"), (200, b"new-model"))
+            self.release.set()
+            worker.join(10)
+            self.assertEqual(slow["reply"], (200, b"old-model"))
+        finally:
+            proxy.stop()
+            proxy.join()
+
+        (_, old_version, _), (_, new_version, _) = self.seen
+        self.assertEqual(new_version, old_version + 1)
+        request_lines = [m["content"].split()[:2] for m in old_conversation[1:]]
+        self.assertEqual(request_lines, [["GET", "/slow"], ["HTTP/1.1", "200"]])
+        self.assertEqual(len(studio.CONVERSATION), 4)
+        self.assertIn("/fast", studio.CONVERSATION[2]["content"])
+        # Only the reply generated under the new version was cached
+        self.assertEqual(studio.RESPONSE_CACHE.stats()["entries"], 1)
+
+    def test_restart_keeps_keep_alive_connections(self):
+        proxy = AsyncProxyServerThread(studio, port=8032)
+        proxy.start()
+        dashboard = _ServerThread(8510, studio.StudioHandler)
+        dashboard.start()
+        try:
+            conn = HTTPConnection("localhost", 8032, timeout=10)
+            self.assertEqual(get(8032, "/a", conn), (200, b"old-model"))
+            restart = HTTPConnection("localhost", 8510, timeout=10)
+            restart.request("POST", "/api/restart", body=json.dumps({"prompt": "new prompt"}))
+            reply = json.loads(restart.getresponse().read())
+            restart.close()
+            self.assertEqual(reply["status"], "restarted")
+            self.assertEqual(reply["version"], studio.CONFIG_VERSION)
+            # Same connection, new prompts and conversation
+            self.assertEqual(get(8032, "/b", conn), (200, b"old-model"))
+            conn.close()
+            self.assertEqual(studio.CONVERSATION[1]["content"], "{{new prompt}}")
+            self.assertEqual(len(studio.CONVERSATION), 4)
+            studio._start_proxy_server.assert_not_called()
+        finally:
+            dashboard.stop()
+            dashboard.join()
+            proxy.stop()
+            proxy.join()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+import threading
+import time
+import unittest
+from http.client import HTTPConnection
+from unittest import mock
+
+from vibestudio import studio
+from vibestudio.context import ContextWindow, SUMMARY_PREFIX
+from vibestudio.tokens import estimate_tokens
+
+PINNED = [
+    {"role": "system", "content": "{{{meta}}}"},
+    {"role": "user", "content": "{{{service}}}"},
+]
+
+
+def exchange(method, path, status="200", body=""):
+    request = f"{method} {path} HTTP/1.1\nHost: x\n\n{body}"
+    return [
+        {"role": "user", "content": request},
+        {"role": "assistant", "content": f"HTTP/1.1 {status} OK\n\n<p>{path}</p>"},
+    ]
+
+
+class _ServerThread(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.server = studio.HTTPServer(("localhost", 8006), studio.ProxyHandler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ContextWindowTest(unittest.TestCase):
+    def conversation(self):
+        return (
+            PINNED
+            + exchange("GET", "/a")
+            + exchange("POST", "/b", body="name=Bob")
+            + exchange("GET", "/c")
+            + exchange("GET", "/d")
+        )
+
+    def test_drop_keeps_pinned_and_newest(self):
+        window = ContextWindow(max_messages=6, policy="drop")
+        result = window.compact(self.conversation())
+        self.assertEqual(result[:2], PINNED)
+        self.assertEqual(len(result), 6)
+        self.assertIn("GET /c", result[2]["content"])
+        self.assertIn("GET /d", result[4]["content"])
+
+    def test_keep_posts_prefers_state_changing(self):
+        window = ContextWindow(max_messages=6, policy="keep_posts")
+        result = window.compact(self.conversation())
+        self.assertIn("POST /b", result[2]["content"])
+        self.assertIn("GET /d", result[4]["content"])
+
+    def test_summarize_replaces_older_exchanges(self):
+        window = ContextWindow(max_messages=7, policy="summarize")
+        result = window.compact(self.conversation())
+        self.assertEqual(len(result), 7)
+        summary = result[2]["content"]
+        self.assertTrue(summary.startswith(SUMMARY_PREFIX))
+        self.assertIn("GET /a -> 200", summary)
+        self.assertIn("POST /b name=Bob -> 200", summary)
+        again = window.compact(result + exchange("GET", "/e"))
+        self.assertIn("GET /a -> 200", again[2]["content"])
+        self.assertIn("GET /c -> 200", again[2]["content"])
+
+    def test_token_budget(self):
+        conversation = self.conversation()
+        limit = estimate_tokens(conversation) - 1
+        window = ContextWindow(max_tokens=limit, policy="drop")
+        self.assertTrue(window.over_budget(conversation))
+        result = window.compact(conversation)
+        self.assertLessEqual(estimate_tokens(result), limit)
+        self.assertFalse(window.over_budget(result))
+
+
+class _GatedWindow(ContextWindow):
+    """A window whose compactions wait until the test releases them."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def compact(self, conversation):
+        self.entered.set()
+        self.release.wait(5)
+        return super().compact(conversation)
+
+
+class OverlappingCompactionTest(unittest.TestCase):
+    def test_second_compaction_keeps_messages_appended_meanwhile(self):
+        window = _GatedWindow(max_messages=7, policy="drop")
+        conversation = (
+            PINNED + exchange("GET", "/a") + exchange("GET", "/b") + exchange("GET", "/c") + exchange("GET", "/d")
+        )
+        threads = [threading.Thread(target=studio._compact_conversation, args=(conversation, window)) for _ in range(2)]
+        threads[0].start()
+        self.assertTrue(window.entered.wait(5))
+        threads[1].start()
+        time.sleep(0.1)
+        with studio.STATE_LOCK:
+            conversation.append({"role": "user", "content": "GET /e HTTP/1.1\nHost: x\n\n"})
+        window.release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(conversation[-1]["content"], "GET /e HTTP/1.1\nHost: x\n\n")
+        self.assertEqual(len(conversation), 7)
+        self.assertEqual(window.compactions, 1)
+
+
+class CompactingProxyTest(unittest.TestCase):
+    def setUp(self):
+        self.captured = []
+        outer = self
+
+        def fake_call(self, messages):
+            outer.captured.append(list(messages))
+            return "HTTP/1.1 200 OK\nContent-Type: text/plain\n\nok"
+
+        self.patchers = [
+            mock.patch.object(studio.ProxyHandler, "call_llm", fake_call),
+            mock.patch.object(studio, "CONTEXT_WINDOW", ContextWindow(max_messages=5)),
+            mock.patch.object(studio, "CONTEXT_BACKGROUND", False),
+        ]
+        for p in self.patchers:
+            p.start()
+        studio.LOGS = []
+        studio.META_LOGS = []
+        studio.CONVERSATION = list(PINNED)
+        self.thread = _ServerThread()
+        self.thread.start()
+
+    def tearDown(self):
+        self.thread.stop()
+        self.thread.join()
+        for p in self.patchers:
+            p.stop()
+
+    def test_conversation_stays_bounded(self):
+        for i in range(6):
+            conn = HTTPConnection("localhost", 8006)
+            conn.request("GET", f"/page{i}")
+            conn.getresponse().read()
+            conn.close()
+        self.assertLessEqual(len(studio.CONVERSATION), 5)
+        self.assertEqual(studio.CONVERSATION[:2], PINNED)
+        self.assertEqual(self.captured[-1][:2], PINNED)
+        self.assertLessEqual(max(len(m) for m in self.captured), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
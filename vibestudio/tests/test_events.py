@@ -0,0 +1,98 @@
+import json
+import threading
+import unittest
+from http.client import HTTPConnection
+from unittest import mock
+
+from vibestudio import studio
+from vibestudio.logbuffer import CLEARED, LogBuffer
+
+
+class _StudioThread(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.server = studio.ThreadingHTTPServer(("localhost", 8504), studio.StudioHandler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def read_event(resp):
+    """Return the next non-comment event as a dict of its fields."""
+    fields = {}
+    while True:
+        line = resp.fp.readline().decode().rstrip("\n")
+        if not line:
+            if fields:
+                return fields
+            continue
+        if line.startswith(":"):
+            continue
+        key, value = line.split(": ", 1)
+        fields[key] = value
+
+
+class SubscriptionTest(unittest.TestCase):
+    def test_bounded_queue_overflows_and_resyncs(self):
+        buf = LogBuffer(capacity=10)
+        sub = buf.subscribe(maxsize=2)
+        for i in range(4):
+            buf.append({"n": i})
+        self.assertTrue(sub.overflowed)
+        page = sub.resync(1)
+        self.assertFalse(sub.overflowed)
+        self.assertEqual([e["n"] for e in page["entries"]], [1, 2, 3])
+        self.assertIsNone(sub.get(timeout=0))
+        buf.clear()
+        self.assertIs(sub.get(timeout=0), CLEARED)
+        sub.close()
+        self.assertEqual(buf.subscriber_count, 0)
+
+
+class EventStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.heartbeat = mock.patch.object(studio, "SSE_HEARTBEAT", 0.05)
+        self.heartbeat.start()
+        studio.LOGS = LogBuffer(capacity=100)
+        studio.LOGS.append({"type": "meta_out", "text": "first"})
+        self.thread = _StudioThread()
+        self.thread.start()
+
+    def tearDown(self):
+        self.thread.stop()
+        self.thread.join()
+        self.heartbeat.stop()
+
+    def open(self, headers=None):
+        conn = HTTPConnection("localhost", 8504)
+        conn.request("GET", "/api/logs/events", headers=headers or {})
+        resp = conn.getresponse()
+        self.assertEqual(resp.getheader("Content-Type"), "text/event-stream")
+        return conn, resp
+
+    def test_backlog_then_live_entries(self):
+        conn, resp = self.open()
+        event = read_event(resp)
+        self.assertEqual(event["id"], "1")
+        self.assertEqual(json.loads(event["data"])["text"], "first")
+        studio.LOGS.append({"type": "meta_out", "text": "second"})
+        event = read_event(resp)
+        self.assertEqual(event["id"], "2")
+        studio.LOGS.clear()
+        self.assertEqual(read_event(resp)["event"], "cleared")
+        conn.close()
+
+    def test_resume_from_last_event_id(self):
+        studio.LOGS.append({"type": "meta_out", "text": "second"})
+        conn, resp = self.open({"Last-Event-ID": "1"})
+        event = read_event(resp)
+        self.assertEqual(json.loads(event["data"])["text"], "second")
+        conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.client import HTTPConnection
+
+from vibestudio import studio
+from vibestudio.logbuffer import LogBuffer
+
+
+class _StudioThread(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.server = studio.HTTPServer(("localhost", 8503), studio.StudioHandler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class LogBufferTest(unittest.TestCase):
+    def test_cursor_reads(self):
+        buf = LogBuffer(capacity=10)
+        for i in range(3):
+            buf.append({"n": i})
+        page = buf.since(0)
+        self.assertEqual([e["seq"] for e in page["entries"]], [1, 2, 3])
+        self.assertEqual(page["next"], 3)
+        buf.append({"n": 3})
+        page = buf.since(page["next"])
+        self.assertEqual([e["n"] for e in page["entries"]], [3])
+        self.assertEqual(buf.since(4)["entries"], [])
+        self.assertEqual(buf.since(4)["next"], 4)
+
+    def test_ring_eviction_reports_missed(self):
+        buf = LogBuffer(capacity=3)
+        for i in range(5):
+            buf.append({"n": i})
+        self.assertEqual(len(buf), 3)
+        self.assertEqual(buf[0]["n"], 2)
+        self.assertEqual(buf[-1]["n"], 4)
+        page = buf.since(0)
+        self.assertEqual(page["missed"], 2)
+        self.assertEqual([e["seq"] for e in page["entries"]], [3, 4, 5])
+
+    def test_limit_and_clear(self):
+        buf = LogBuffer(capacity=10)
+        for i in range(5):
+            buf.append({"n": i})
+        page = buf.since(0, limit=2)
+        self.assertEqual(page["next"], 2)
+        self.assertTrue(page["more"])
+        buf.clear()
+        buf.append({"n": 5})
+        page = buf.since(2)
+        self.assertEqual(page["cleared"], 5)
+        self.assertEqual([e["seq"] for e in page["entries"]], [6])
+
+    def test_spill_to_disk(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "spill.jsonl")
+            buf = LogBuffer(capacity=2, spill_path=path)
+            for i in range(4):
+                buf.append({"n": i})
+            buf._spill.close()
+            with open(path, encoding="utf-8") as fh:
+                spilled = [json.loads(line)["n"] for line in fh]
+            self.assertEqual(spilled, [0, 1])
+
+
+class LogsEndpointTest(unittest.TestCase):
+    def setUp(self):
+        studio.LOGS = LogBuffer(capacity=100)
+        for i in range(3):
+            studio.LOGS.append({"type": "meta_out", "text": str(i)})
+        self.thread = _StudioThread()
+        self.thread.start()
+
+    def tearDown(self):
+        self.thread.stop()
+        self.thread.join()
+
+    def get(self, path):
+        conn = HTTPConnection("localhost", 8503)
+        conn.request("GET", path)
+        resp = conn.getresponse()
+        data = resp.read()
+        conn.close()
+        return resp.status, data
+
+    def test_since_cursor(self):
+        status, data = self.get("/api/logs?since=2")
+        page = json.loads(data)
+        self.assertEqual(status, 200)
+        self.assertEqual([e["text"] for e in page["entries"]], ["2"])
+        self.assertEqual(page["next"], 3)
+
+    def test_full_listing_without_cursor(self):
+        _, data = self.get("/api/logs")
+        self.assertEqual(len(json.loads(data)), 3)
+
+    def test_bad_cursor(self):
+        status, _ = self.get("/api/logs?since=abc")
+        self.assertEqual(status, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
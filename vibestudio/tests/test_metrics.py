@@ -0,0 +1,265 @@
+import json
+import threading
+import time
+import unittest
+from http.client import HTTPConnection
+from unittest import mock
+
+from vibestudio import studio
+from vibestudio.aioproxy import AsyncProxyServerThread
+from vibestudio.metrics import CallbackGauge, Counter, Gauge, Histogram, ProxyMetrics, Registry, chrome_trace
+
+
+class _ServerThread(threading.Thread):
+    def __init__(self, port, handler):
+        super().__init__(daemon=True)
+        self.server = studio.ThreadingHTTPServer(("localhost", port), handler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricTypesTest(unittest.TestCase):
+    def test_counter_totals_across_threads(self):
+        counter = Counter("hits_total", "Hits.", ("kind",))
+
+        def work():
+            for _ in range(1000):
+                counter.inc("a")
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(counter.value("a"), 8000)
+        self.assertEqual(counter.render()[-1], 'hits_total{kind="a"} 8000')
+        # The threads are spread over the shards
+        self.assertGreater(sum(1 for _, values in counter._shards if values), 1)
+
+    def test_histogram_exposition(self):
+        histogram = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.5, 3):
+            histogram.observe(value)
+        self.assertEqual(histogram.render()[2:], [
+            'latency_seconds_bucket{le="0.1"} 1',
+            'latency_seconds_bucket{le="1"} 3',
+            'latency_seconds_bucket{le="+Inf"} 4',
+            "latency_seconds_sum 4.05",
+            "latency_seconds_count 4",
+        ])
+        self.assertEqual(histogram.snapshot(), (4, 4.05))
+
+    def test_registry_renders_help_type_and_escapes_labels(self):
+        registry = Registry()
+        gauge = registry.register(Gauge("in_flight", "In flight."))
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+        registry.register(CallbackGauge("sizes", "Sizes.", lambda: [(('a"b',), 2), (("c",), None)], ("name",)))
+        text = registry.render()
+        self.assertIn("# HELP in_flight In flight.\n# TYPE in_flight gauge\nin_flight 1\n", text)
+        self.assertIn('sizes{name="a\\"b"} 2\n', text)
+        self.assertNotIn('name="c"', text)
+
+
+class ProxyMetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+        self.proxy_metrics = ProxyMetrics(self.registry)
+
+        def fake_call(self, messages):
+            return "HTTP/1.1 201 Created\nContent-Type: text/plain\n\nhello"
+
+        self.patchers = [
+            mock.patch.object(studio.ProxyHandler, "call_llm", fake_call),
+            mock.patch.object(studio, "METRICS", self.registry),
+            mock.patch.object(studio, "PROXY_METRICS", self.proxy_metrics),
+            mock.patch.object(studio, "PROXY_METRICS_PATH", "/metrics"),
+        ]
+        for p in self.patchers:
+            p.start()
+        studio.LOGS = []
+        studio.META_LOGS = []
+        studio.CONVERSATION = []
+
+    def tearDown(self):
+        for p in self.patchers:
+            p.stop()
+
+    def get(self, port, path):
+        conn = HTTPConnection("localhost", port)
+        conn.request("GET", path)
+        resp = conn.getresponse()
+        body = resp.read()
+        conn.close()
+        return resp, body
+
+    def assert_recorded(self, port):
+        self.get(port, "/page")
+        resp, body = self.get(port, "/metrics")
+        self.assertTrue(resp.getheader("Content-Type").startswith("text/plain; version=0.0.4"))
+        text = body.decode()
+        self.assertIn('vibestudio_requests_total{method="GET",status="201",source="llm"} 1', text)
+        self.assertIn("vibestudio_requests_in_flight 1", text)
+        # The metrics request itself is counted once it finishes
+        deadline = time.monotonic() + 5
+        while self.proxy_metrics.in_flight.value() and time.monotonic() < deadline:
+            time.sleep(0.005)
+        self.assertEqual(self.proxy_metrics.requests.value("GET", "200", "metrics"), 1)
+        phases = ("queue", "llm", "parse", "write")
+        counts = {phase: self.proxy_metrics.phase.snapshot(phase)[0] for phase in phases}
+        self.assertEqual(counts, {"queue": 2, "llm": 1, "parse": 1, "write": 2})
+        self.assertEqual(self.proxy_metrics.ttfb.snapshot()[0], 2)
+        self.assertIn('vibestudio_reply_bytes_bucket{le="128"} 1', text)
+        # Scrapes are not logged as traffic
+        self.assertEqual(len(studio.LOGS), 2)
+
+    def test_threaded_proxy_records_requests(self):
+        thread = _ServerThread(8020, studio.ProxyHandler)
+        thread.start()
+        try:
+            self.assert_recorded(8020)
+        finally:
+            thread.stop()
+            thread.join()
+
+    def test_async_proxy_records_requests(self):
+        thread = AsyncProxyServerThread(studio, port=8021)
+        thread.start()
+        try:
+            self.assert_recorded(8021)
+        finally:
+            thread.stop()
+            thread.join()
+
+
+class StudioMetricsTest(unittest.TestCase):
+    def get(self, port, path):
+        conn = HTTPConnection("localhost", port)
+        conn.request("GET", path)
+        resp = conn.getresponse()
+        body = resp.read()
+        conn.close()
+        return resp, body
+
+    def test_studio_endpoint(self):
+        studio.LOGS = [{"type": "http"}]
+        studio.CONVERSATION = [{"role": "user", "content": "x"}] * 3
+        thread = _ServerThread(8506, studio.StudioHandler)
+        thread.start()
+        try:
+            self.get(8506, "/api/stats")
+            resp, body = self.get(8506, "/api/metrics")
+        finally:
+            thread.stop()
+            thread.join()
+        self.assertEqual(resp.status, 200)
+        self.assertIn('vibestudio_studio_requests_total{method="GET",status="200"}', body.decode())
+        text = body.decode()
+        self.assertIn('vibestudio_log_entries{log="traffic"} 1', text)
+        self.assertIn("vibestudio_conversation_messages 3", text)
+        self.assertIn('vibestudio_component_stat{component="chain",stat=', text)
+
+
+class SpanTracingTest(unittest.TestCase):
+    def setUp(self):
+        def fake_call(self, messages):
+            return "HTTP/1.1 200 OK\nContent-Type: text/plain\n\nhello world"
+
+        self.patchers = [
+            mock.patch.object(studio.ProxyHandler, "call_llm", fake_call),
+            mock.patch.object(studio, "TRACE_SPANS", True),
+        ]
+        for p in self.patchers:
+            p.start()
+        studio.LOGS = []
+        studio.META_LOGS = []
+        studio.CONVERSATION = []
+
+    def tearDown(self):
+        for p in self.patchers:
+            p.stop()
+
+    def traces(self, port, path, streaming=False):
+        with mock.patch.object(studio, "STREAMING", streaming):
+            conn = HTTPConnection("localhost", port)
+            conn.request("GET", path)
+            conn.getresponse().read()
+            conn.close()
+        deadline = time.monotonic() + 5
+        while not any(e["type"] == "trace" for e in studio.LOGS) and time.monotonic() < deadline:
+            time.sleep(0.005)
+        return [e for e in studio.LOGS if e["type"] == "trace"]
+
+    def assert_spans(self, trace, expected):
+        names = [s["name"] for s in trace["spans"]]
+        self.assertEqual(names, expected)
+        starts = [s["start_ms"] for s in trace["spans"]]
+        self.assertEqual(starts, sorted(starts))
+        end = max(s["start_ms"] + s["duration_ms"] for s in trace["spans"])
+        self.assertLessEqual(end, trace["duration_ms"] + 0.01)
+
+    def test_threaded_request_spans(self):
+        thread = _ServerThread(8022, studio.ProxyHandler)
+        thread.start()
+        try:
+            (trace,) = self.traces(8022, "/page")
+        finally:
+            thread.stop()
+            thread.join()
+        self.assertEqual((trace["method"], trace["request"], trace["status"], trace["source"]),
+                         ("GET", "/page", 200, "llm"))
+        self.assertEqual(set(trace["phases_ms"]), {"queue", "llm", "parse", "write"})
+        self.assert_spans(trace, ["read", "lookup", "lock", "assemble", "llm", "parse", "record", "write"])
+
+    def test_async_streaming_spans(self):
+        thread = AsyncProxyServerThread(studio, port=8023)
+        thread.start()
+        try:
+            (trace,) = self.traces(8023, "/page", streaming=True)
+        finally:
+            thread.stop()
+            thread.join()
+        self.assert_spans(
+            trace, ["read", "lookup", "lock", "assemble", "llm.first_token", "llm.stream", "record", "write"]
+        )
+
+    def test_chrome_trace_export(self):
+        entry = {
+            "type": "trace", "method": "GET", "request": "/a", "status": 200, "source": "llm", "seq": 7,
+            "ts": 100.0, "duration_ms": 20.0, "phases_ms": {},
+            "spans": [{"name": "llm", "start_ms": 5.0, "duration_ms": 10.0}],
+        }
+        events = chrome_trace([{"type": "http"}, entry])["traceEvents"]
+        request, meta, span = events
+        self.assertEqual(
+            (request["name"], request["ph"], request["ts"], request["dur"]), ("GET /a", "X", 99980000.0, 20000.0)
+        )
+        self.assertEqual(meta["args"], {"name": "GET /a"})
+        self.assertEqual(
+            (span["name"], span["ts"], span["dur"], span["tid"]), ("llm", 99985000.0, 10000.0, request["tid"])
+        )
+
+    def test_studio_exports_trace_events(self):
+        studio.LOGS = [{"type": "trace", "method": "GET", "request": "/a", "status": 200, "source": "llm",
+                        "ts": 1.0, "duration_ms": 1.0, "phases_ms": {}, "spans": []}]
+        thread = _ServerThread(8507, studio.StudioHandler)
+        thread.start()
+        try:
+            conn = HTTPConnection("localhost", 8507)
+            conn.request("GET", "/api/trace_events")
+            data = json.loads(conn.getresponse().read())
+            conn.close()
+        finally:
+            thread.stop()
+            thread.join()
+        self.assertEqual(data["traceEvents"][0]["name"], "GET /a")
+
+
+if __name__ == "__main__":
+    unittest.main()
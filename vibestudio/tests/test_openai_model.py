@@ -9,6 +9,7 @@ class OpenAIModelEnvTest(unittest.TestCase):
     def test_model_variable_used(self):
         fake_response = types.SimpleNamespace()
         fake_response.choices = [types.SimpleNamespace(message=types.SimpleNamespace(content="ok"))]
+        fake_response.output_text = "ok"
         fake_openai = types.SimpleNamespace()
         fake_openai.responses = types.SimpleNamespace(create=mock.Mock(return_value=fake_response))
         fake_openai.chat = types.SimpleNamespace()
@@ -21,7 +22,7 @@ class OpenAIModelEnvTest(unittest.TestCase):
                 studio.ProxyHandler.call_llm(studio.ProxyHandler, messages)
                 fake_openai.responses.create.assert_called_with(
                     model="test-model",
-                    messages=messages,
+                    input=messages,
                     previous_response_id=None,
                 )
 
@@ -0,0 +1,275 @@
+import threading
+import time
+import unittest
+from http.client import HTTPConnection
+from unittest import mock
+
+from vibestudio import studio
+from vibestudio.aioproxy import AsyncProxyServerThread
+from vibestudio.backends import Completion
+from vibestudio.prefetch import Prefetcher, extract_links
+
+INDEX = (
+    "HTTP/1.1 200 OK\nContent-Type: text/html\n\n"
+    '<a href="/a">A</a> <a href="b?x=1">B</a> <a href="http://elsewhere/c">C</a>'
+)
+
+
+class _ServerThread(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.server = studio.ThreadingHTTPServer(("localhost", 8014), studio.ProxyHandler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _PageBackend:
+    """Serve an index linking to two pages and record the requested paths."""
+
+    name = "pages"
+    streaming = False
+    native_async = False
+
+    def __init__(self):
+        self.paths = []
+        self.models = {}
+
+    def complete(self, messages, model, chain=None):
+        path = messages[-1]["content"].split()[1]
+        self.paths.append(path)
+        self.models[path] = model
+        if path == "/":
+            return Completion(INDEX, None, None)
+        return Completion(f"HTTP/1.1 200 OK\nContent-Type: text/plain\n\npage {path}", None, None)
+
+
+class ExtractLinksTest(unittest.TestCase):
+    def test_anchors_then_get_forms(self):
+        html = (
+            '<a href="/x">x</a><a href="#top">top</a><a href="mailto:a@b">m</a>'
+            '<a href="https://other/y">y</a><a href="//host/z">z</a>'
+            '<form action="/search"><input name="q" value="cats"><input type="submit" name="go"></form>'
+            '<form method="post" action="/buy"><input name="n" value="1"></form>'
+        )
+        links = extract_links(html, "/dir/page", host="host")
+        self.assertEqual(links, ["/x", "/z", "/search?q=cats"])
+
+    def test_relative_links_resolve_against_page(self):
+        self.assertEqual(extract_links('<a href="next">n</a>', "/dir/page"), ["/dir/next"])
+
+
+class PrefetcherTest(unittest.TestCase):
+    def job(self, entry, tokens=10):
+        return lambda: (entry, tokens)
+
+    def wait_idle(self, prefetcher):
+        deadline = time.monotonic() + 5
+        while prefetcher.stats()["pending"] and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def test_fanout_and_take(self):
+        prefetcher = Prefetcher(workers=1, fanout=2)
+        started = prefetcher.schedule([(k, 1, self.job(k)) for k in "abc"])
+        self.assertEqual(started, 2)
+        self.wait_idle(prefetcher)
+        self.assertEqual(prefetcher.take("a"), "a")
+        self.assertIsNone(prefetcher.take("a"))
+        self.assertIsNone(prefetcher.take("c"))
+        stats = prefetcher.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["tokens_spent"]), (1, 2, 20))
+
+    def test_token_budget_limits_speculation(self):
+        prefetcher = Prefetcher(fanout=5, token_budget=25)
+        prefetcher.schedule([(k, 10, self.job(k)) for k in "abc"])
+        self.wait_idle(prefetcher)
+        stats = prefetcher.stats()
+        self.assertEqual((stats["generated"], stats["skipped_budget"]), (2, 1))
+
+    def test_expired_and_invalidated_entries_are_wasted(self):
+        now = [0.0]
+        prefetcher = Prefetcher(ttl=10, clock=lambda: now[0])
+        prefetcher.schedule([("a", 1, self.job("a")), ("b", 1, self.job("b"))])
+        self.wait_idle(prefetcher)
+        now[0] = 11
+        self.assertIsNone(prefetcher.take("a"))
+        prefetcher.schedule([("c", 1, self.job("c"))])
+        self.wait_idle(prefetcher)
+        prefetcher.invalidate()
+        self.assertIsNone(prefetcher.take("c"))
+        self.assertEqual(prefetcher.stats()["wasted"], 3)
+
+    def test_failed_job_is_counted(self):
+        prefetcher = Prefetcher()
+
+        def fail():
+            raise RuntimeError("boom")
+
+        prefetcher.schedule([("a", 1, fail)])
+        self.wait_idle(prefetcher)
+        self.assertEqual(prefetcher.stats()["failed"], 1)
+        self.assertIsNone(prefetcher.take("a"))
+
+
+class PrefetchProxyTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = _PageBackend()
+        self.prefetcher = Prefetcher(workers=2, fanout=3)
+        self.patchers = [
+            mock.patch.object(studio, "get_backend", return_value=self.backend),
+            mock.patch.object(studio, "PREFETCHER", self.prefetcher),
+        ]
+        for p in self.patchers:
+            p.start()
+        studio.LOGS = []
+        studio.META_LOGS = []
+        studio.CONVERSATION = []
+
+    def tearDown(self):
+        for p in self.patchers:
+            p.stop()
+
+    def get(self, port, path):
+        conn = HTTPConnection("localhost", port)
+        conn.request("GET", path)
+        resp = conn.getresponse()
+        body = resp.read()
+        conn.close()
+        return resp.status, body
+
+    def wait_planned(self):
+        deadline = time.monotonic() + 5
+        while self.prefetcher.stats()["planning"] and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def wait_generated(self, count):
+        deadline = time.monotonic() + 5
+        while self.prefetcher.stats()["generated"] < count and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def assert_prefetched(self, port):
+        self.get(port, "/")
+        self.wait_generated(2)
+        self.assertEqual(sorted(self.backend.paths), ["/", "/a", "/b?x=1"])
+        self.assertEqual(self.get(port, "/a"), (200, b"page /a"))
+        # The page was served without another model call
+        self.assertEqual(len(self.backend.paths), 3)
+        self.assertEqual(self.prefetcher.stats()["hits"], 1)
+        http = [e for e in studio.LOGS if e["type"] == "http"]
+        self.assertEqual([e.get("prefetched", False) for e in http], [False, True])
+        self.assertEqual([m["role"] for m in studio.CONVERSATION], ["user", "assistant"] * 2)
+        self.assertIn("GET /a HTTP/1.1", studio.CONVERSATION[2]["content"])
+
+    def test_threaded_proxy_serves_prefetched_page(self):
+        thread = _ServerThread()
+        thread.start()
+        try:
+            self.assert_prefetched(8014)
+        finally:
+            thread.stop()
+            thread.join()
+
+    def test_async_proxy_serves_prefetched_page(self):
+        thread = AsyncProxyServerThread(studio, port=8015)
+        thread.start()
+        try:
+            self.assert_prefetched(8015)
+        finally:
+            thread.stop()
+            thread.join()
+
+    def test_reply_is_not_held_up_by_finding_links(self):
+        release = threading.Event()
+        find_links = studio._prefetch_links
+
+        def slow(*args):
+            release.wait(5)
+            return find_links(*args)
+
+        thread = _ServerThread()
+        thread.start()
+        try:
+            with mock.patch.object(studio, "_prefetch_links", slow):
+                started = time.monotonic()
+                self.assertEqual(self.get(8014, "/")[0], 200)
+                self.assertLess(time.monotonic() - started, 2)
+                self.assertEqual(self.prefetcher.stats()["planning"], 1)
+                release.set()
+                self.wait_generated(2)
+        finally:
+            release.set()
+            thread.stop()
+            thread.join()
+        self.assertEqual(self.prefetcher.stats()["generated"], 2)
+
+    def test_request_waits_for_prefetch_in_progress(self):
+        release = threading.Event()
+        complete = self.backend.complete
+
+        def slow(messages, model, chain=None):
+            if "GET /a " in messages[-1]["content"]:
+                release.wait(5)
+            return complete(messages, model, chain)
+
+        self.backend.complete = slow
+        thread = _ServerThread()
+        thread.start()
+        try:
+            self.get(8014, "/")
+            self.wait_planned()
+            threading.Timer(0.05, release.set).start()
+            self.assertEqual(self.get(8014, "/a"), (200, b"page /a"))
+        finally:
+            thread.stop()
+            thread.join()
+        self.assertEqual(self.backend.paths.count("/a"), 1)
+
+    def test_page_generated_from_older_history_is_not_served(self):
+        thread = _ServerThread()
+        thread.start()
+        try:
+            self.get(8014, "/")
+            self.wait_generated(2)
+            self.assertEqual(self.get(8014, "/b?x=1"), (200, b"page /b?x=1"))
+            # /a was generated before /b joined the conversation
+            self.assertEqual(self.get(8014, "/a"), (200, b"page /a"))
+        finally:
+            thread.stop()
+            thread.join()
+        self.assertEqual(self.backend.paths.count("/a"), 2)
+        stats = self.prefetcher.stats()
+        self.assertEqual((stats["hits"], stats["wasted"]), (1, 1))
+        http = [e for e in studio.LOGS if e["type"] == "http"]
+        self.assertEqual([e.get("prefetched", False) for e in http], [False, True, False])
+        self.assertEqual([m["role"] for m in studio.CONVERSATION], ["user", "assistant"] * 3)
+
+    def test_prefetch_uses_the_model_the_page_was_served_with(self):
+        release = threading.Event()
+        complete = self.backend.complete
+
+        def slow(messages, model, chain=None):
+            if "GET / " not in messages[-1]["content"]:
+                release.wait(5)
+            return complete(messages, model, chain)
+
+        self.backend.complete = slow
+        thread = _ServerThread()
+        thread.start()
+        try:
+            with mock.patch.object(studio, "MODEL", "old-model"):
+                self.get(8014, "/")
+            with mock.patch.object(studio, "MODEL", "new-model"):
+                release.set()
+                self.wait_generated(2)
+        finally:
+            thread.stop()
+            thread.join()
+        self.assertEqual(self.backend.models, {"/": "old-model", "/a": "old-model", "/b?x=1": "old-model"})
+
+
+if __name__ == "__main__":
+    unittest.main()
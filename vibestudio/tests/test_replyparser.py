@@ -0,0 +1,147 @@
+import random
+import unittest
+
+from vibestudio.replyparser import ReplyParser, parse_reply
+
+REPLY = (
+    "{{{ meta }}}\n"
+    "HTTP/1.1 201 Created\n"
+    "Content-Type: text/html\n"
+    "Set-Cookie: a=1\n"
+    "Set-Cookie: b=2\n"
+    "\n"
+    "<html>\n"
+    "STREAMED\n"
+    "</html>\n"
+    "\n"
+    "{{{ done }}}\n"
+)
+
+
+def parse_chunks(pieces):
+    parser = ReplyParser()
+    body = b"".join(parser.feed(p) for p in pieces) + parser.close()
+    return parser, body
+
+
+class ReplyParserTest(unittest.TestCase):
+    def test_whole_reply(self):
+        reply = parse_reply(REPLY)
+        self.assertEqual(reply.meta, ["meta"])
+        self.assertEqual(reply.suffix_meta, ["done"])
+        self.assertEqual(reply.status, 201)
+        self.assertEqual(reply.headers[0], ("Content-Type", "text/html"))
+        self.assertEqual([v for k, v in reply.headers if k == "Set-Cookie"], ["a=1", "b=2"])
+        self.assertIsInstance(reply.body, memoryview)
+        self.assertEqual(bytes(reply.body), b"<html>\nSTREAMED\n</html>")
+
+    def test_body_is_a_view_of_the_input(self):
+        data = REPLY.encode("utf-8")
+        reply = parse_reply(data)
+        self.assertIs(reply.body.obj, data)
+
+    def test_any_split_point_gives_same_result(self):
+        data = REPLY.encode("utf-8")
+        for i in range(len(data)):
+            parser, body = parse_chunks([data[:i], data[i:]])
+            self.assertEqual(body, b"<html>\nSTREAMED\n</html>", i)
+            self.assertEqual(parser.suffix_meta, ["done"], i)
+            self.assertEqual(parser.header("set-cookie"), "a=1", i)
+
+    def test_body_released_before_close(self):
+        parser = ReplyParser()
+        self.assertEqual(parser.feed("HTTP/1.1 200 OK\nContent-Type: text/plain\n"), b"")
+        self.assertFalse(parser.head_complete)
+        self.assertEqual(parser.feed("\nhello wor"), b"hello wor")
+        self.assertTrue(parser.head_complete)
+        self.assertEqual(parser.feed("ld\n{{{ done }}}"), b"ld")
+        self.assertEqual(parser.close(), b"")
+        self.assertEqual(parser.suffix_meta, ["done"])
+
+    def test_reply_without_status_line(self):
+        parser, body = parse_chunks(["{{{ m }}}\n", "just text"])
+        self.assertIsNone(parser.status)
+        self.assertEqual(parser.meta, ["m"])
+        self.assertEqual(body, b"just text")
+
+    def test_crlf_and_meta_inside_body(self):
+        reply = parse_reply("HTTP/1.1 200 OK\r\nA: 1\r\n\r\nx\r\n{{{ mid }}}\r\ny\r\n{{{ end }}}\r\n")
+        self.assertEqual(reply.headers, [("A", "1")])
+        self.assertEqual(bytes(reply.body), b"x\r\n{{{ mid }}}\r\ny")
+        self.assertEqual(reply.suffix_meta, ["end"])
+
+    def test_trailing_blank_lines_without_meta(self):
+        self.assertEqual(bytes(parse_reply("HTTP/1.1 200 OK\n\nx\n").body), b"x")
+        self.assertEqual(bytes(parse_reply("HTTP/1.1 200 OK\n\nx\n\n").body), b"x\n")
+
+    def test_large_body_is_compacted(self):
+        parser = ReplyParser()
+        parser.feed("HTTP/1.1 200 OK\n\n")
+        line = b"<tr><td>" + b"x" * 100 + b"</td></tr>\n"
+        total = 0
+        for _ in range(2000):
+            total += len(parser.feed(line))
+        total += len(parser.close())
+        self.assertEqual(total, len(line) * 2000 - 1)
+        self.assertLess(len(parser._buf), 4 * len(line))
+
+
+class ReplyParserFuzzTest(unittest.TestCase):
+    WORDS = ["<p>", "{x}", "{{{", "}}}", "HTTP/1.1", "a: b", " ", "\t", "ü", "€", "{", "text", ":"]
+
+    def random_reply(self, rng):
+        eol = rng.choice(["\n", "\r\n"])
+        prefix = [f"{{{{{{ p{i} }}}}}}" for i in range(rng.randint(0, 2))]
+        headers = [(rng.choice(["X-A", "Set-Cookie"]), f"v{i}") for i in range(rng.randint(0, 3))]
+        body = []
+        for _ in range(rng.randint(1, 6)):
+            kind = rng.random()
+            if kind < 0.2:
+                body.append("")
+            elif kind < 0.3:
+                body.append("{{{ inline }}}")
+            else:
+                body.append("".join(rng.choice(self.WORDS) for _ in range(rng.randint(1, 5))))
+        body.append("<end>" + rng.choice(self.WORDS))
+        suffix = [f"{{{{{{ s{i} }}}}}}" for i in range(rng.randint(0, 2))]
+        lines = prefix + [f"HTTP/1.1 {rng.choice([200, 404])} X"] + [f"{k}: {v}" for k, v in headers]
+        lines += [""] + body + [""] * rng.randint(0, 1) + suffix
+        text = eol.join(lines) + eol * rng.randint(0, 1)
+        expected = (eol.join(body)).encode("utf-8")
+        return text.encode("utf-8"), headers, expected, [s[3:-3].strip() for s in suffix]
+
+    def random_split(self, rng, data):
+        cuts = sorted(rng.sample(range(len(data) + 1), min(len(data), rng.randint(0, 8))))
+        return [data[a:b] for a, b in zip([0] + cuts, cuts + [len(data)])]
+
+    def test_generated_replies(self):
+        rng = random.Random(1234)
+        for _ in range(500):
+            data, headers, expected, suffix = self.random_reply(rng)
+            reply = parse_reply(data)
+            self.assertEqual(reply.headers, headers, data)
+            if suffix:
+                self.assertEqual(bytes(reply.body), expected, data)
+                self.assertEqual(reply.suffix_meta, suffix, data)
+            else:
+                self.assertTrue(bytes(reply.body).startswith(expected), data)
+            parser, body = parse_chunks(self.random_split(rng, data))
+            self.assertEqual(body, bytes(reply.body), data)
+            self.assertEqual(parser.suffix_meta, reply.suffix_meta, data)
+            parser, body = parse_chunks([data[i:i + 1] for i in range(len(data))])
+            self.assertEqual(body, bytes(reply.body), data)
+
+    def test_malformed_input_never_raises(self):
+        rng = random.Random(99)
+        alphabet = b"HTP/1. 20OK:\r\n{}ab\xff\xc3"
+        for _ in range(2000):
+            data = bytes(rng.choice(alphabet) for _ in range(rng.randint(0, 60)))
+            reply = parse_reply(data)
+            self.assertIn(bytes(reply.body), data)
+            parser, body = parse_chunks(self.random_split(rng, data))
+            self.assertEqual(body, bytes(reply.body), data)
+            self.assertEqual((parser.status, parser.headers, parser.meta), (reply.status, reply.headers, reply.meta))
+
+
+if __name__ == "__main__":
+    unittest.main()
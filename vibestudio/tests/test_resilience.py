@@ -0,0 +1,235 @@
+import asyncio
+import threading
+import time
+import unittest
+from http.client import HTTPConnection
+from unittest import mock
+
+from vibestudio import studio
+from vibestudio.aioproxy import AsyncProxyServerThread
+from vibestudio.backends import ScriptedBackend
+from vibestudio.chain import ResponseChain
+from vibestudio.resilience import CallPolicy, LLMError, LLMTimeout, is_retryable, lingering_attempts
+from vibestudio.scheduler import CallScheduler
+
+
+class _ServerThread(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.server = studio.ThreadingHTTPServer(("localhost", 8026), studio.ProxyHandler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class BadRequestError(Exception):
+    status_code = 400
+
+
+class CallPolicyTest(unittest.TestCase):
+    def test_retryable_errors(self):
+        self.assertTrue(is_retryable(RateLimitError()))
+        self.assertTrue(is_retryable(ConnectionResetError()))
+        self.assertTrue(is_retryable(type("APITimeoutError", (Exception,), {})()))
+        self.assertFalse(is_retryable(BadRequestError()))
+        self.assertFalse(is_retryable(ValueError()))
+
+    def test_retries_with_jittered_backoff(self):
+        sleeps = []
+        policy = CallPolicy(retries=3, backoff=0.5, max_backoff=1.5, sleep=sleeps.append, rng=lambda: 1.0)
+        outcomes = [RateLimitError("slow down")] * 3 + ["ok"]
+
+        def call(chain):
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        self.assertEqual(policy.call(call), "ok")
+        self.assertEqual(sleeps, [0.5, 1.0, 1.5])
+        self.assertEqual(policy.stats()["retries"], 3)
+
+    def test_permanent_errors_are_not_retried(self):
+        policy = CallPolicy(retries=3, sleep=mock.Mock())
+        fn = mock.Mock(side_effect=BadRequestError("bad model"))
+        with self.assertRaises(LLMError) as caught:
+            policy.call(fn)
+        self.assertEqual(caught.exception.status, 502)
+        self.assertIn("bad model", str(caught.exception))
+        fn.assert_called_once()
+        self.assertEqual(policy.stats()["failures"], 1)
+
+    def test_deadline_raises_gateway_timeout(self):
+        release = threading.Event()
+        policy = CallPolicy(timeout=0.05)
+        started = time.monotonic()
+        with self.assertRaises(LLMTimeout) as caught:
+            policy.call(lambda chain: release.wait(5))
+        release.set()
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(caught.exception.status, 504)
+        self.assertEqual(policy.stats()["timeouts"], 1)
+
+    def test_timed_out_attempt_is_reported_while_it_runs(self):
+        release = threading.Event()
+        policy = CallPolicy(timeout=0.05)
+        with lingering_attempts() as lingering:
+            with self.assertRaises(LLMTimeout):
+                policy.call(lambda chain: release.wait(5))
+        self.assertEqual(len(lingering), 1)
+        self.assertFalse(lingering[0].done())
+        release.set()
+        self.assertTrue(lingering[0].result(5))
+
+    def test_stream_first_chunk_deadline(self):
+        release = threading.Event()
+        policy = CallPolicy(timeout=0.05)
+
+        def slow():
+            release.wait(5)
+            yield "late"
+
+        self.assertEqual(list(policy.stream(lambda: iter(["a", "b"]))), ["a", "b"])
+        self.assertEqual(list(policy.stream(lambda: iter([]))), [])
+        with lingering_attempts() as lingering:
+            with self.assertRaises(LLMTimeout) as caught:
+                list(policy.stream(slow))
+        release.set()
+        self.assertEqual(caught.exception.status, 504)
+        self.assertEqual(len(lingering), 1)
+        self.assertEqual(policy.stats()["timeouts"], 1)
+
+    def test_async_stream_first_chunk_deadline(self):
+        policy = CallPolicy(timeout=0.05)
+        closed = []
+
+        async def slow():
+            try:
+                await asyncio.sleep(5)
+                yield "late"
+            finally:
+                closed.append(True)
+
+        async def main():
+            return [chunk async for chunk in policy.astream(slow)]
+
+        with self.assertRaises(LLMTimeout):
+            asyncio.run(main())
+        self.assertEqual(closed, [True])
+
+    def test_hedged_call_takes_the_first_reply_and_its_chain(self):
+        release = threading.Event()
+        policy = CallPolicy(hedge=True, hedge_after=0.02)
+        calls = []
+
+        def call(fork):
+            calls.append(fork)
+            name = f"r{len(calls)}"
+            if len(calls) == 1:
+                release.wait(5)
+            fork.commit([{"role": "user", "content": "GET /"}], name, name)
+            return name
+
+        chain = ResponseChain()
+        self.assertEqual(policy.call(call, chain), "r2")
+        release.set()
+        self.assertEqual(chain.response_id, "r2")
+        self.assertNotIn(chain, calls)
+        stats = policy.stats()
+        self.assertEqual((stats["hedged"], stats["hedge_wins"]), (1, 1))
+
+    def test_hedge_delay_follows_p95(self):
+        policy = CallPolicy(hedge=True, hedge_after=2.0, min_samples=20)
+        self.assertEqual(policy.hedge_delay(), 2.0)
+        for ms in range(1, 101):
+            policy.latency.record(ms / 1000)
+        self.assertAlmostEqual(policy.hedge_delay(), 0.096)
+
+    def test_async_hedge_cancels_the_loser(self):
+        policy = CallPolicy(hedge=True, hedge_after=0.02)
+        cancelled = []
+
+        async def call(fork):
+            if not cancelled:
+                cancelled.append(False)
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    cancelled[0] = True
+                    raise
+            return "fast"
+
+        async def main():
+            result = await policy.acall(call, ResponseChain())
+            await asyncio.sleep(0)
+            return result
+
+        self.assertEqual(asyncio.run(main()), "fast")
+        self.assertEqual(cancelled, [True])
+
+
+class GatewayStatusTest(unittest.TestCase):
+    def setUp(self):
+        backend = ScriptedBackend(latency=0.5)
+        self.scheduler = CallScheduler(max_concurrent=2)
+        self.patchers = [
+            mock.patch.object(studio, "get_backend", lambda: backend),
+            mock.patch.object(studio, "LLM_POLICY", CallPolicy(timeout=0.05)),
+            mock.patch.object(studio, "SCHEDULER", self.scheduler),
+        ]
+        for p in self.patchers:
+            p.start()
+        studio.LOGS = []
+        studio.META_LOGS = []
+        studio.CONVERSATION = []
+
+    def tearDown(self):
+        for p in self.patchers:
+            p.stop()
+
+    def assert_timeout(self, port):
+        conn = HTTPConnection("localhost", port)
+        conn.request("GET", "/slow")
+        resp = conn.getresponse()
+        body = resp.read()
+        conn.close()
+        self.assertEqual(resp.status, 504)
+        self.assertIn(b"timed out", body)
+        self.assertTrue(studio.LOGS[-1]["error"])
+
+    def test_threaded_proxy_answers_504(self):
+        thread = _ServerThread()
+        thread.start()
+        try:
+            self.assert_timeout(8026)
+            # The abandoned call still runs on its thread and keeps the slot
+            stats = self.scheduler.stats()
+            self.assertEqual((stats["active"], stats["lingering"]), (1, 1))
+            deadline = time.monotonic() + 5
+            while self.scheduler.stats()["active"] and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(self.scheduler.stats()["active"], 0)
+        finally:
+            thread.stop()
+            thread.join()
+
+    def test_async_proxy_answers_504(self):
+        thread = AsyncProxyServerThread(studio, port=8027)
+        thread.start()
+        try:
+            self.assert_timeout(8027)
+        finally:
+            thread.stop()
+            thread.join()
+
+
+if __name__ == "__main__":
+    unittest.main()
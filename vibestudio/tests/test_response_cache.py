@@ -0,0 +1,128 @@
+import threading
+import unittest
+from http.client import HTTPConnection
+from unittest import mock
+
+from vibestudio import studio
+from vibestudio.cache import ResponseCache, request_key
+
+
+class _ServerThread(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.server = studio.HTTPServer(("localhost", 8004), studio.ProxyHandler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class RequestKeyTest(unittest.TestCase):
+    def test_query_order_and_ignored_headers(self):
+        a = request_key("p", "m", "x", "GET", "/a?b=2&a=1", {"Accept": "text/html", "Cookie": "1"})
+        b = request_key("p", "m", "x", "GET", "/a?a=1&b=2", {"accept": "text/html", "Cookie": "2"})
+        self.assertEqual(a, b)
+
+    def test_prompt_and_model_change_key(self):
+        base = request_key("p", "m", "x", "GET", "/", {})
+        self.assertNotEqual(base, request_key("p2", "m", "x", "GET", "/", {}))
+        self.assertNotEqual(base, request_key("p", "m2", "x", "GET", "/", {}))
+        self.assertNotEqual(base, request_key("p", "m", "y", "GET", "/", {}))
+        self.assertNotEqual(base, request_key("p", "m", "x", "HEAD", "/", {}))
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.cache = ResponseCache(max_entries=2, ttl=10, max_bytes=100, clock=lambda: self.now)
+
+    def test_lru_eviction(self):
+        self.cache.put("a", 200, [], b"a")
+        self.cache.put("b", 200, [], b"b")
+        self.cache.get("a")
+        self.cache.put("c", 200, [], b"c")
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("a").body, b"a")
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_ttl_expiry(self):
+        self.cache.put("a", 200, [], b"a")
+        self.now = 11
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_memory_cap(self):
+        self.cache.put("a", 200, [], b"x" * 60)
+        self.cache.put("b", 200, [], b"y" * 60)
+        self.assertIsNone(self.cache.get("a"))
+        self.cache.put("huge", 200, [], b"z" * 200)
+        self.assertIsNone(self.cache.get("huge"))
+        self.assertLessEqual(self.cache.stats()["bytes"], 100)
+
+    def test_invalidate_and_counters(self):
+        self.cache.put("a", 200, [("Content-Type", "text/html")], b"a")
+        self.cache.get("a")
+        self.cache.invalidate()
+        self.assertIsNone(self.cache.get("a"))
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["invalidations"]), (1, 1, 1))
+
+
+class CachedProxyTest(unittest.TestCase):
+    def setUp(self):
+        self.calls = 0
+        outer = self
+
+        def fake_call(self, messages):
+            outer.calls += 1
+            return "HTTP/1.1 200 OK\nContent-Type: text/html\n\n<p>page</p>"
+
+        self.patchers = [
+            mock.patch.object(studio.ProxyHandler, "call_llm", fake_call),
+            mock.patch.object(studio, "RESPONSE_CACHE", ResponseCache()),
+        ]
+        for p in self.patchers:
+            p.start()
+        studio.LOGS = []
+        studio.META_LOGS = []
+        studio.CONVERSATION = []
+        self.thread = _ServerThread()
+        self.thread.start()
+
+    def tearDown(self):
+        self.thread.stop()
+        self.thread.join()
+        for p in self.patchers:
+            p.stop()
+
+    def fetch(self, method="GET", path="/page?b=1&a=2"):
+        conn = HTTPConnection("localhost", 8004)
+        conn.request(method, path)
+        resp = conn.getresponse()
+        body = resp.read()
+        conn.close()
+        return resp, body
+
+    def test_repeated_get_served_from_cache(self):
+        self.fetch()
+        resp, body = self.fetch(path="/page?a=2&b=1")
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(body, b"<p>page</p>")
+        self.assertEqual(resp.getheader("Content-Type"), "text/html")
+        self.assertTrue(studio.LOGS[-1]["cached"])
+        self.assertEqual(len(studio.CONVERSATION), 2)
+
+    def test_post_and_invalidation_call_llm(self):
+        self.fetch()
+        self.fetch(method="POST")
+        studio._invalidate_caches()
+        self.fetch()
+        self.assertEqual(self.calls, 3)
+        self.assertEqual(studio._stats()["cache"]["hits"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
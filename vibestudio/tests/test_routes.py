@@ -0,0 +1,188 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.client import HTTPConnection
+from unittest import mock
+
+from vibestudio import studio
+from vibestudio.aioproxy import AsyncProxyServerThread
+from vibestudio.cache import CachedReply
+from vibestudio.routes import RouteTable, load_routes
+
+
+def teapot(method, path, headers):
+    if "brew" not in path:
+        return None
+    return CachedReply(418, [("Content-Type", "text/plain")], b"short and stout")
+
+
+class _ServerThread(threading.Thread):
+    def __init__(self, port):
+        super().__init__(daemon=True)
+        self.server = studio.ThreadingHTTPServer(("localhost", port), studio.ProxyHandler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class RouteTableTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.dir, "assets"))
+        with open(os.path.join(self.dir, "assets", "site.css"), "w") as fh:
+            fh.write("body {}")
+        with open(os.path.join(self.dir, "secret.txt"), "w") as fh:
+            fh.write("secret")
+        self.path = os.path.join(self.dir, "routes.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def load(self, config):
+        with open(self.path, "w") as fh:
+            json.dump(config, fh)
+        return load_routes(self.path, {"head": lambda method, path, headers: None})
+
+    def test_default_routes(self):
+        table = load_routes("default", {"head": lambda method, path, headers: None})
+        self.assertEqual(table.get("GET", "/favicon.ico?v=2", {}).status, 204)
+        self.assertIn(b"Disallow: /", table.get("HEAD", "/robots.txt", {}).body)
+        reply = table.get("OPTIONS", "/api", {
+            "Origin": "http://example.com", "Access-Control-Request-Method": "PUT",
+            "Access-Control-Request-Headers": "X-Token",
+        })
+        self.assertEqual(reply.status, 204)
+        self.assertIn(("Access-Control-Allow-Origin", "http://example.com"), reply.headers)
+        self.assertIn(("Access-Control-Allow-Headers", "X-Token"), reply.headers)
+        self.assertIsNone(table.get("HEAD", "/page", {}))
+        self.assertIsNone(table.get("POST", "/favicon.ico", {}))
+
+    def test_static_files_and_handlers(self):
+        table = self.load([
+            {"method": "GET", "path": "/assets/*", "directory": "assets"},
+            {"method": "GET", "path": "/about", "file": "assets/site.css"},
+            {"path": "/tea*", "handler": "vibestudio.tests.test_routes:teapot"},
+        ])
+        reply = table.get("GET", "/assets/site.css?v=1", {})
+        self.assertEqual((reply.status, reply.body), (200, b"body {}"))
+        self.assertEqual(reply.headers, [("Content-Type", "text/css")])
+        self.assertEqual(table.get("GET", "/assets/../secret.txt", {}).status, 404)
+        self.assertEqual(table.get("GET", "/assets/%2e%2e/secret.txt", {}).status, 404)
+        self.assertEqual(table.get("GET", "/about", {}).body, b"body {}")
+        os.unlink(os.path.join(self.dir, "assets", "site.css"))
+        self.assertEqual(table.get("GET", "/about", {}).status, 404)
+        self.assertEqual(table.get("PUT", "/tea/brew", {}).status, 418)
+        # A handler returning None passes the request on
+        self.assertIsNone(table.get("GET", "/tea/pour", {}))
+        self.assertEqual(table.get("GET", "/favicon.ico", {}).status, 204)
+
+        stats = table.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (7, 1))
+        self.assertEqual([r["hits"] for r in stats["table"]], [3, 2, 1, 1, 0, 0, 0])
+        self.assertEqual(stats["table"][0], {"method": "GET", "path": "/assets/*", "kind": "directory", "hits": 3})
+
+    def test_defaults_can_be_left_out(self):
+        table = self.load({"defaults": False, "routes": [{"method": "GET, HEAD", "path": "/ping", "body": "pong"}]})
+        self.assertEqual(len(table), 1)
+        self.assertEqual(table.get("HEAD", "/ping", {}).body, b"pong")
+        self.assertIsNone(table.get("GET", "/favicon.ico", {}))
+
+    def test_unknown_handler(self):
+        with self.assertRaises(ValueError):
+            RouteTable([{"path": "/x", "handler": "missing"}])
+
+
+class RoutedProxyTest(unittest.TestCase):
+    def setUp(self):
+        self.patchers = [
+            mock.patch.object(studio, "ROUTES", None),
+            mock.patch.object(studio, "FROZEN", None),
+            mock.patch.object(
+                studio.ProxyHandler, "call_llm", return_value="HTTP/1.1 200 OK\nContent-Type: text/html\n\nmodel"
+            ),
+        ]
+        for p in self.patchers:
+            p.start()
+        studio.LOGS = []
+        studio.META_LOGS = []
+        studio.CONVERSATION = []
+        self.assertIsNotNone(studio.load_routes("default"))
+
+    def tearDown(self):
+        for p in self.patchers:
+            p.stop()
+
+    def request(self, port, method, path, headers=None):
+        conn = HTTPConnection("localhost", port)
+        conn.request(method, path, headers=headers or {})
+        resp = conn.getresponse()
+        body = resp.read()
+        conn.close()
+        return resp, body
+
+    def assert_routed(self, port):
+        self.assertEqual(self.request(port, "GET", "/favicon.ico")[0].status, 204)
+        resp, body = self.request(port, "GET", "/robots.txt")
+        self.assertEqual((resp.status, resp.getheader("Content-Type")), (200, "text/plain"))
+        resp, _ = self.request(port, "OPTIONS", "/api", {"Origin": "http://a", "Access-Control-Request-Method": "POST"})
+        self.assertEqual((resp.status, resp.getheader("Access-Control-Allow-Origin")), (204, "http://a"))
+        self.assertEqual(self.request(port, "GET", "/page")[1], b"model")
+        # Nothing stored for the page, so HEAD is not answered with made-up headers
+        resp, body = self.request(port, "HEAD", "/page")
+        self.assertEqual((resp.status, resp.getheader("Content-Type"), body), (200, "text/html", b""))
+        self.assertEqual(studio.ProxyHandler.call_llm.call_count, 2)
+        self.assertEqual(len(studio.CONVERSATION), 4)
+        routed = [e.get("routed", False) for e in studio.LOGS if e["type"] == "http"]
+        self.assertEqual(routed, [True, True, True, False, False])
+        stats = studio._stats()["routes"]
+        self.assertEqual((stats["hits"], stats["misses"]), (3, 2))
+
+    def test_threaded_proxy_answers_routes(self):
+        thread = _ServerThread(8029)
+        thread.start()
+        try:
+            self.assert_routed(8029)
+        finally:
+            thread.stop()
+            thread.join()
+
+    def test_async_proxy_answers_routes(self):
+        thread = AsyncProxyServerThread(studio, port=8030)
+        thread.start()
+        try:
+            self.assert_routed(8030)
+        finally:
+            thread.stop()
+            thread.join()
+
+    def test_head_uses_the_frozen_get_reply(self):
+        frozen = mock.Mock()
+        frozen.get.return_value = CachedReply(200, [("Content-Type", "text/css")], b"body {}")
+        with mock.patch.object(studio, "FROZEN", frozen):
+            reply, source = studio._fixed_reply("HEAD", "/site.css", {})
+        self.assertEqual((reply.body, source), (b"body {}", "routed"))
+        frozen.get.assert_called_once_with("GET", "/site.css")
+
+    def test_head_without_a_stored_reply_is_not_routed(self):
+        self.assertEqual(studio._fixed_reply("HEAD", "/unknown", {}), (None, None))
+
+    def test_head_uses_the_cached_get_reply_without_counting_it(self):
+        cache = studio.ResponseCache()
+        with mock.patch.object(studio, "RESPONSE_CACHE", cache):
+            key, _ = studio._cache_lookup("GET", "/cached", {})
+            cache.put(key, 200, [("Content-Type", "text/html")], b"cached")
+            reply, source = studio._fixed_reply("HEAD", "/cached", {})
+        self.assertEqual((reply.body, source), (b"cached", "routed"))
+        # Only the GET lookup above counts
+        self.assertEqual((cache.stats()["hits"], cache.stats()["misses"]), (0, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
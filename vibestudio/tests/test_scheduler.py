@@ -0,0 +1,209 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+import unittest
+from http.client import HTTPConnection
+from unittest import mock
+
+from vibestudio import studio
+from vibestudio.aioproxy import AsyncProxyServerThread
+from vibestudio.scheduler import CallScheduler, Overloaded
+
+
+class _ServerThread(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.server = studio.ThreadingHTTPServer(("localhost", 8024), studio.ProxyHandler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class CallSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.order = []
+        self.errors = []
+        self.threads = []
+
+    def queue(self, scheduler, priority, client, name):
+        """Start a call that records ``name`` once admitted, and wait until it is queued."""
+        def seen():
+            stats = scheduler.stats()
+            return stats["queued"] + stats["displaced"]
+
+        before = seen()
+
+        def call():
+            try:
+                admitted = scheduler.acquire(priority, client)
+            except Overloaded as exc:
+                self.errors.append((name, exc))
+                return
+            self.order.append(name)
+            scheduler.release(admitted)
+
+        thread = threading.Thread(target=call)
+        thread.start()
+        self.threads.append(thread)
+        deadline = time.monotonic() + 5
+        while seen() == before and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+    def drain(self, scheduler, admitted):
+        scheduler.release(admitted)
+        for thread in self.threads:
+            thread.join(5)
+
+    def test_higher_priority_is_admitted_first(self):
+        scheduler = CallScheduler(max_concurrent=1)
+        admitted = scheduler.acquire()
+        self.queue(scheduler, "background", "a", "prefetch")
+        self.queue(scheduler, "interactive", "a", "page")
+        self.queue(scheduler, "meta", "studio", "chat")
+        self.drain(scheduler, admitted)
+        self.assertEqual(self.order, ["chat", "page", "prefetch"])
+
+    def test_clients_take_turns_within_a_priority(self):
+        scheduler = CallScheduler(max_concurrent=1)
+        admitted = scheduler.acquire()
+        for name in ("a1", "a2", "a3"):
+            self.queue(scheduler, "interactive", "a", name)
+        self.queue(scheduler, "interactive", "b", "b1")
+        self.drain(scheduler, admitted)
+        self.assertEqual(self.order, ["a1", "b1", "a2", "a3"])
+        stats = scheduler.stats()
+        self.assertEqual((stats["admitted"], stats["active"], stats["queued"]), (5, 0, 0))
+
+    def test_full_queue_sheds_the_least_important_call(self):
+        scheduler = CallScheduler(max_concurrent=1, max_queue=2)
+        admitted = scheduler.acquire()
+        self.queue(scheduler, "background", "a", "prefetch1")
+        self.queue(scheduler, "background", "a", "prefetch2")
+        # Client "a" already holds the whole background queue
+        with self.assertRaises(Overloaded) as caught:
+            scheduler.acquire("background", "a")
+        self.assertGreaterEqual(caught.exception.retry_after, 1)
+        self.queue(scheduler, "interactive", "b", "page")
+        self.drain(scheduler, admitted)
+        self.assertEqual(self.order, ["page", "prefetch1"])
+        self.assertEqual([name for name, _ in self.errors], ["prefetch2"])
+        stats = scheduler.stats()
+        self.assertEqual((stats["rejected"], stats["displaced"]), (1, 1))
+
+    def test_busy_client_yields_its_queue_space(self):
+        scheduler = CallScheduler(max_concurrent=1, max_queue=2)
+        admitted = scheduler.acquire()
+        self.queue(scheduler, "interactive", "a", "a1")
+        self.queue(scheduler, "interactive", "a", "a2")
+        self.queue(scheduler, "interactive", "b", "b1")
+        self.drain(scheduler, admitted)
+        self.assertEqual(self.order, ["a1", "b1"])
+        self.assertEqual([name for name, _ in self.errors], ["a2"])
+
+    def test_wait_times_out(self):
+        scheduler = CallScheduler(max_concurrent=1, timeout=0.05)
+        admitted = scheduler.acquire()
+        with self.assertRaises(Overloaded):
+            scheduler.acquire("interactive", "a")
+        scheduler.release(admitted)
+        stats = scheduler.stats()
+        self.assertEqual((stats["timeouts"], stats["queued"], stats["active"]), (1, 0, 0))
+
+    def test_slot_is_held_until_lingering_attempts_finish(self):
+        scheduler = CallScheduler(max_concurrent=1)
+        done = concurrent.futures.Future()
+        done.set_result(None)
+        scheduler.release_after(scheduler.acquire(), [done])
+        self.assertEqual(scheduler.stats()["active"], 0)
+        running = concurrent.futures.Future()
+        scheduler.release_after(scheduler.acquire(), [done, running])
+        stats = scheduler.stats()
+        self.assertEqual((stats["active"], stats["lingering"]), (1, 1))
+        running.set_result(None)
+        stats = scheduler.stats()
+        self.assertEqual((stats["active"], stats["lingering"]), (0, 0))
+
+    def test_async_waiters_are_woken(self):
+        scheduler = CallScheduler(max_concurrent=1)
+
+        async def main():
+            admitted = await scheduler.acquire_async()
+            waiter = asyncio.ensure_future(scheduler.acquire_async("interactive", "a"))
+            await asyncio.sleep(0.01)
+            self.assertFalse(waiter.done())
+            # Released from another thread, as a threaded request would
+            threading.Thread(target=scheduler.release, args=(admitted,)).start()
+            scheduler.release(await asyncio.wait_for(waiter, 5))
+
+        asyncio.run(main())
+        self.assertEqual(scheduler.stats()["admitted"], 2)
+
+
+class SheddingProxyTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = CallScheduler(max_concurrent=1, max_queue=0)
+
+        def fake_call(self, messages):
+            return "HTTP/1.1 200 OK\nContent-Type: text/plain\n\nhello"
+
+        self.patchers = [
+            mock.patch.object(studio.ProxyHandler, "call_llm", fake_call),
+            mock.patch.object(studio, "SCHEDULER", self.scheduler),
+        ]
+        for p in self.patchers:
+            p.start()
+        studio.LOGS = []
+        studio.META_LOGS = []
+        studio.CONVERSATION = []
+
+    def tearDown(self):
+        for p in self.patchers:
+            p.stop()
+
+    def assert_shed(self, port):
+        admitted = self.scheduler.acquire()
+        conn = HTTPConnection("localhost", port)
+        conn.request("GET", "/page")
+        resp = conn.getresponse()
+        body = resp.read()
+        conn.close()
+        self.assertEqual(resp.status, 503)
+        self.assertEqual(resp.getheader("Retry-After"), "1")
+        self.assertIn(b"overloaded", body)
+        # Shed requests never reach the conversation
+        self.assertEqual(studio.CONVERSATION, [])
+        self.assertTrue(studio.LOGS[-1]["shed"])
+        self.scheduler.release(admitted)
+
+        conn = HTTPConnection("localhost", port)
+        conn.request("GET", "/page")
+        self.assertEqual(conn.getresponse().status, 200)
+        conn.close()
+        self.assertEqual(self.scheduler.stats()["admitted_interactive"], 2)
+
+    def test_threaded_proxy_sheds_with_retry_after(self):
+        thread = _ServerThread()
+        thread.start()
+        try:
+            self.assert_shed(8024)
+        finally:
+            thread.stop()
+            thread.join()
+
+    def test_async_proxy_sheds_with_retry_after(self):
+        thread = AsyncProxyServerThread(studio, port=8025)
+        thread.start()
+        try:
+            self.assert_shed(8025)
+        finally:
+            thread.stop()
+            thread.join()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import threading
+import unittest
+from http.client import HTTPConnection
+from unittest import mock
+
+from vibestudio import studio
+from vibestudio.sessions import SessionManager
+
+
+class _ServerThread(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.server = studio.HTTPServer(("localhost", 8005), studio.ProxyHandler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SessionManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.manager = SessionManager(
+            lambda: [{"role": "system", "content": "base"}],
+            idle_timeout=10,
+            max_sessions=2,
+            clock=lambda: self.now,
+        )
+
+    def test_cookie_and_header_lookup(self):
+        session, created = self.manager.lookup({})
+        self.assertTrue(created)
+        again, created = self.manager.lookup({"Cookie": f"a=1; vibe_session={session.id}"})
+        self.assertIs(again, session)
+        self.assertFalse(created)
+        again, _ = self.manager.lookup({"X-Vibe-Session": session.id})
+        self.assertIs(again, session)
+
+    def test_conversations_are_independent(self):
+        a, _ = self.manager.lookup({})
+        b, _ = self.manager.lookup({})
+        a.conversation.append({"role": "user", "content": "a"})
+        self.assertEqual(len(b.conversation), 1)
+
+    def test_idle_expiry(self):
+        session, _ = self.manager.lookup({})
+        self.now = 11
+        again, created = self.manager.lookup({"X-Vibe-Session": session.id})
+        self.assertTrue(created)
+        self.assertIsNot(again, session)
+        self.assertEqual(self.manager.stats()["expired"], 1)
+
+    def test_lru_eviction(self):
+        a, _ = self.manager.lookup({})
+        b, _ = self.manager.lookup({})
+        self.manager.lookup({"X-Vibe-Session": a.id})
+        self.manager.lookup({})
+        self.assertEqual(len(self.manager), 2)
+        _, created = self.manager.lookup({"X-Vibe-Session": b.id})
+        self.assertTrue(created)
+
+
+class SessionProxyTest(unittest.TestCase):
+    def setUp(self):
+        self.captured = []
+        outer = self
+
+        def fake_call(self, messages):
+            outer.captured.append(list(messages))
+            return "HTTP/1.1 200 OK\nContent-Type: text/plain\n\nok"
+
+        studio.LOGS = []
+        studio.META_LOGS = []
+        studio.CONVERSATION = [{"role": "system", "content": "{{{meta}}}"}]
+        self.patchers = [
+            mock.patch.object(studio.ProxyHandler, "call_llm", fake_call),
+            mock.patch.object(studio, "SESSIONS", SessionManager(studio._new_session_conversation)),
+        ]
+        for p in self.patchers:
+            p.start()
+        self.thread = _ServerThread()
+        self.thread.start()
+
+    def tearDown(self):
+        self.thread.stop()
+        self.thread.join()
+        for p in self.patchers:
+            p.stop()
+
+    def fetch(self, path, headers=None):
+        conn = HTTPConnection("localhost", 8005)
+        conn.request("GET", path, headers=headers or {})
+        resp = conn.getresponse()
+        resp.read()
+        conn.close()
+        return resp
+
+    def test_clients_get_separate_history(self):
+        first = self.fetch("/a")
+        cookie = first.getheader("Set-Cookie").split(";")[0]
+        second = self.fetch("/b", {"Cookie": cookie})
+        self.assertIsNone(second.getheader("Set-Cookie"))
+        self.fetch("/c")
+        self.assertEqual(len(self.captured[1]), 4)
+        self.assertIn("GET /a", self.captured[1][1]["content"])
+        self.assertEqual(len(self.captured[2]), 2)
+        self.assertEqual(studio.CONVERSATION, [{"role": "system", "content": "{{{meta}}}"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,223 @@
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+from http.client import HTTPConnection
+
+from vibestudio import studio
+from vibestudio.context import ContextWindow
+from vibestudio.sessions import SessionManager
+from vibestudio.sharedstate import LogTailer, SharedLog, SharedState
+from vibestudio.workers import WorkerPool
+
+PROMPTS = [{"role": "system", "content": "{{meta}}"}, {"role": "user", "content": "{{prompt}}"}]
+
+
+def message(text, role="user"):
+    return {"role": role, "content": text}
+
+
+class SharedStateTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "shared.db")
+        self.state = SharedState(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_conversation_is_seen_by_other_connections(self):
+        conversation = self.state.conversation(initial=PROMPTS)
+        conversation.append(message("GET /"))
+        other = SharedState(self.path).conversation()
+        self.assertEqual(list(other), PROMPTS + [message("GET /")])
+        self.assertEqual(len(other), 3)
+        self.assertEqual(other[-1], message("GET /"))
+        self.assertTrue(other == PROMPTS + [message("GET /")])
+        self.assertEqual(other.append_and_read(message("GET /a"))[-1], message("GET /a"))
+
+    def test_rewrite_sees_messages_written_meanwhile(self):
+        conversation = self.state.conversation(initial=[message(str(i)) for i in range(6)])
+        stale = list(conversation)
+        # Another process compacts and appends after the snapshot was taken
+        other = SharedState(self.path).conversation()
+        other.rewrite(lambda messages: [message("summary", "assistant")] + messages[4:])
+        other.append(message("new"))
+        seen, rewritten = conversation.rewrite(lambda messages: messages[:1] + messages[-1:])
+        self.assertNotEqual(seen, stale)
+        self.assertEqual([m["content"] for m in rewritten], ["summary", "new"])
+        self.assertEqual(list(conversation), rewritten)
+        self.assertEqual(conversation.rewrite(lambda messages: None), (rewritten, None))
+        self.assertEqual(list(conversation), rewritten)
+
+    def test_shared_conversation_is_compacted_in_place(self):
+        conversation = self.state.conversation(initial=PROMPTS)
+        for i in range(5):
+            conversation.append(message(f"GET /{i} HTTP/1.1"))
+            conversation.append(message("HTTP/1.1 200 OK\n\nok", "assistant"))
+        studio._compact_conversation(conversation, ContextWindow(max_messages=6, policy="drop"))
+        contents = [m["content"] for m in conversation]
+        self.assertEqual(len(contents), 6)
+        self.assertEqual(contents[:2], ["{{meta}}", "{{prompt}}"])
+        self.assertEqual(contents[-2], "GET /4 HTTP/1.1")
+
+    def test_sessions_are_resumed_by_other_processes(self):
+        def manager():
+            sessions = SessionManager(lambda: list(PROMPTS))
+            sessions.bind = self.state.conversation
+            sessions.resume = lambda sid: self.state.conversation(sid) if self.state.has_conversation(sid) else None
+            return sessions
+
+        first, second = manager(), manager()
+        session, created = first.lookup({})
+        session.conversation.append(message("GET /"))
+        resumed, created_again = second.lookup({"X-Vibe-Session": session.id})
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(resumed.id, session.id)
+        self.assertEqual(list(resumed.conversation), PROMPTS + [message("GET /")])
+        self.state.drop_sessions()
+        fresh, created = manager().lookup({"X-Vibe-Session": session.id})
+        self.assertTrue(created)
+        self.assertNotEqual(fresh.id, session.id)
+
+    def age_sessions(self, seconds):
+        self.state._conn().execute("UPDATE sessions SET last_used = last_used - ?", (seconds,))
+
+    def stored_sessions(self):
+        rows = self.state._conn().execute("SELECT DISTINCT conversation FROM messages WHERE conversation != ''")
+        return sorted(row[0] for row in rows)
+
+    def test_expired_and_evicted_sessions_are_deleted(self):
+        now = [0.0]
+        sessions = SessionManager(lambda: list(PROMPTS), idle_timeout=10, max_sessions=2, clock=lambda: now[0])
+        sessions.bind = self.state.conversation
+        sessions.drop = self.state.drop_session
+        a, _ = sessions.lookup({})
+        b, _ = sessions.lookup({})
+        c, _ = sessions.lookup({})
+        # Evicting "a" deletes its rows
+        self.assertEqual(self.stored_sessions(), sorted([b.id, c.id]))
+        now[0] = 11
+        # "b" was used by another process meanwhile, so only "c" goes
+        self.age_sessions(11)
+        self.state.conversation(b.id).append(message("GET /elsewhere"))
+        d, _ = sessions.lookup({})
+        self.assertEqual(self.stored_sessions(), sorted([b.id, d.id]))
+        self.assertEqual(sessions.stats()["expired"], 2)
+
+    def test_idle_sessions_are_not_resumed(self):
+        conversation = self.state.conversation("idle", initial=PROMPTS)
+        self.assertTrue(self.state.has_conversation("idle", 10))
+        self.age_sessions(11)
+        self.assertFalse(self.state.has_conversation("idle", 10))
+        self.assertEqual(len(conversation), 0)
+        # The shared conversation never expires
+        self.state.conversation(initial=PROMPTS)
+        self.assertTrue(self.state.has_conversation("", 0))
+
+    def test_config_generations(self):
+        self.assertEqual(self.state.config(), (0, {}))
+        self.state.publish(prompt="a")
+        self.assertEqual(self.state.publish(prompt="b"), 2)
+        self.assertEqual(SharedState(self.path).config(), (2, {"prompt": "b"}))
+
+    def test_worker_logs_reach_the_studio_in_order(self):
+        log = SharedLog(self.state, "traffic")
+        meta = SharedLog(self.state, "meta")
+        log.append({"type": "http", "request": "/a"})
+        meta.append({"direction": "in", "text": "hi"})
+        log.append({"type": "http", "request": "/b"})
+        received = []
+        tailer = LogTailer(self.state, lambda name, entry: received.append((name, entry)))
+        self.assertEqual(tailer.poll(), 3)
+        self.assertEqual([(name, e.get("request") or e["text"]) for name, e in received],
+                         [("traffic", "/a"), ("meta", "hi"), ("traffic", "/b")])
+        self.assertEqual(received[0][1]["worker"], os.getpid())
+        self.assertEqual(tailer.poll(), 0)
+
+    def test_worker_stats_keep_the_latest_publication(self):
+        self.state.publish_stats(1, {"llm": {"calls": 1}})
+        self.state.publish_stats(1, {"llm": {"calls": 2}})
+        self.state.publish_stats(2, {"llm": {"calls": 5}})
+        stats = SharedState(self.path).worker_stats()
+        self.assertEqual({pid: s["llm"]["calls"] for pid, s in stats.items()}, {1: 2, 2: 5})
+        self.assertIn("updated", stats[1])
+
+    def test_proxy_appends_atomically_to_shared_conversation(self):
+        conversation = self.state.conversation(initial=PROMPTS)
+        llm_request = studio._append_request(conversation, "GET / HTTP/1.1")
+        self.assertEqual(llm_request, PROMPTS + [message("GET / HTTP/1.1")])
+
+
+class WorkerPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "shared.db")
+        self.state = SharedState(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def publish(self, prompt):
+        self.state.publish(prompt=prompt, meta_prompt="meta", model="mock-model")
+        prompts = [{"role": "system", "content": "{{meta}}"}, {"role": "user", "content": f"{{{{{prompt}}}}}"}]
+        self.state.conversation(initial=prompts)
+
+    def get(self, path):
+        conn = HTTPConnection("localhost", 8028, timeout=10)
+        conn.request("GET", path, headers={"Connection": "close"})
+        resp = conn.getresponse()
+        body = resp.read()
+        conn.close()
+        return resp.status, body
+
+    def wait_until_serving(self, pool):
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline:
+            self.assertEqual(pool.stats()["alive"], 2)
+            try:
+                socket.create_connection(("localhost", 8028), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.05)
+        self.fail("workers did not start")
+
+    def test_workers_share_the_conversation_and_follow_the_studio(self):
+        self.publish("first")
+        env = dict(os.environ, VIBESTUDIO_BACKEND="mock")
+        pool = WorkerPool(2, self.path, port=8028, env=env)
+        pool.start()
+        try:
+            self.wait_until_serving(pool)
+            deadline = time.monotonic() + 10
+            while len(pool.stats()["processes"]) < 2 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(set(pool.stats()["processes"]), {p.pid for p in pool.processes})
+            replies = [self.get(f"/page{i}") for i in range(6)]
+            self.assertEqual({status for status, _ in replies}, {200})
+            conversation = list(self.state.conversation())
+            self.assertEqual(len(conversation), 2 + 12)
+            self.assertEqual(conversation[1]["content"], "{{first}}")
+            # A restart in the Studio: new prompts and a fresh conversation
+            self.publish("second")
+            status, body = self.get("/after")
+            self.assertEqual(status, 200)
+            self.assertIn(b"3 messages", body)
+            self.assertEqual(list(self.state.conversation())[1]["content"], "{{second}}")
+        finally:
+            pool.stop()
+            pool.join()
+        entries = [entry for log, entry in self.state.take_logs() if entry["type"] == "http"]
+        self.assertEqual(len(entries), 7)
+        self.assertLessEqual({e["worker"] for e in entries}, {p.pid for p in pool.processes})
+        self.assertEqual(pool.stats()["alive"], 0)
+        # Each worker published its own counters on the way out
+        published = self.state.worker_stats()
+        self.assertEqual(sum(stats["llm"]["calls"] for stats in published.values()), 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from unittest import mock
+
+from vibestudio import studio
+from vibestudio.aioproxy import AsyncProxyServerThread
+from vibestudio.singleflight import SingleFlight
+
+FOLLOWERS = 4
+
+
+class _ServerThread(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.server = studio.ThreadingHTTPServer(("localhost", 8012), studio.ProxyHandler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SingleFlightTest(unittest.TestCase):
+    def test_followers_share_the_leaders_result(self):
+        flights = SingleFlight()
+        flight, leader = flights.join("k")
+        other, follower_leads = flights.join("k")
+        self.assertTrue(leader)
+        self.assertFalse(follower_leads)
+        self.assertIs(other, flight)
+        threading.Timer(0.02, flights.finish, (flight, "reply")).start()
+        self.assertEqual(flights.wait(other, 5), "reply")
+        # A finished flight is forgotten, the next request leads a new one
+        self.assertTrue(flights.join("k")[1])
+        self.assertEqual(flights.stats()["followers"], 1)
+
+    def test_timeout_and_failure_return_none(self):
+        flights = SingleFlight()
+        flight, _ = flights.join("k")
+        self.assertIsNone(flights.wait(flight, 0.01))
+        flights.finish(flight, None)
+        flights.finish(flight, "too late")
+        self.assertIsNone(flights.wait(flight, 0))
+        stats = flights.stats()
+        self.assertEqual((stats["timeouts"], stats["failures"], stats["in_flight"]), (1, 1, 0))
+
+    def test_wait_async(self):
+        flights = SingleFlight()
+        flight, _ = flights.join("k")
+
+        async def follow():
+            threading.Timer(0.02, flights.finish, (flight, "reply")).start()
+            return await flights.wait_async(flight, 5)
+
+        self.assertEqual(asyncio.run(follow()), "reply")
+        self.assertEqual(asyncio.run(flights.wait_async(flight, 5)), "reply")
+
+
+class CoalescingProxyTest(unittest.TestCase):
+    def setUp(self):
+        self.calls = 0
+        self.release = threading.Event()
+        outer = self
+
+        def fake_call(self, messages):
+            outer.calls += 1
+            outer.release.wait(5)
+            return f"HTTP/1.1 200 OK\nContent-Type: text/plain\n\ncall {outer.calls}"
+
+        self.coalescer = SingleFlight()
+        self.patchers = [
+            mock.patch.object(studio.ProxyHandler, "call_llm", fake_call),
+            mock.patch.object(studio, "COALESCER", self.coalescer),
+        ]
+        for p in self.patchers:
+            p.start()
+        studio.LOGS = []
+        studio.META_LOGS = []
+        studio.CONVERSATION = []
+
+    def tearDown(self):
+        for p in self.patchers:
+            p.stop()
+
+    def get(self, port, path="/burst"):
+        conn = HTTPConnection("localhost", port)
+        conn.request("GET", path)
+        resp = conn.getresponse()
+        body = resp.read()
+        conn.close()
+        return resp.status, body
+
+    def burst(self, port):
+        def release_when_all_joined():
+            deadline = time.monotonic() + 5
+            while self.coalescer.stats()["followers"] < FOLLOWERS and time.monotonic() < deadline:
+                time.sleep(0.005)
+            self.release.set()
+
+        threading.Thread(target=release_when_all_joined, daemon=True).start()
+        with ThreadPoolExecutor(FOLLOWERS + 1) as pool:
+            return list(pool.map(lambda _: self.get(port), range(FOLLOWERS + 1)))
+
+    def assert_coalesced(self, results):
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [(200, b"call 1")] * (FOLLOWERS + 1))
+        exchanges = [e for e in studio.LOGS if e["type"] == "llm_exchange"]
+        coalesced = [e for e in studio.LOGS if e.get("coalesced")]
+        self.assertEqual(len(exchanges), 1)
+        self.assertEqual(len(coalesced), FOLLOWERS)
+        self.assertEqual(len(studio.CONVERSATION), 2)
+
+    def test_threaded_burst_makes_one_call(self):
+        thread = _ServerThread()
+        thread.start()
+        try:
+            self.assert_coalesced(self.burst(8012))
+        finally:
+            thread.stop()
+            thread.join()
+
+    def test_async_burst_makes_one_call(self):
+        thread = AsyncProxyServerThread(studio, port=8013)
+        thread.start()
+        try:
+            self.assert_coalesced(self.burst(8013))
+        finally:
+            thread.stop()
+            thread.join()
+
+    def test_follower_gives_up_after_wait_limit(self):
+        thread = _ServerThread()
+        thread.start()
+        try:
+            with mock.patch.object(studio, "COALESCE_WAIT", 0.05):
+                with ThreadPoolExecutor(2) as pool:
+                    first = pool.submit(self.get, 8012)
+                    while self.calls < 1:
+                        time.sleep(0.005)
+                    second = pool.submit(self.get, 8012)
+                    while self.calls < 2:
+                        time.sleep(0.005)
+                    self.release.set()
+                    first.result(), second.result()
+        finally:
+            thread.stop()
+            thread.join()
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.coalescer.stats()["timeouts"], 1)
+
+    def test_post_is_never_coalesced(self):
+        self.release.set()
+        thread = _ServerThread()
+        thread.start()
+        try:
+            conn = HTTPConnection("localhost", 8012)
+            conn.request("POST", "/burst", body="a=1")
+            conn.getresponse().read()
+            conn.close()
+        finally:
+            thread.stop()
+            thread.join()
+        self.assertEqual(self.coalescer.stats()["leaders"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
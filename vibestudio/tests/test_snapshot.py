@@ -0,0 +1,209 @@
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stdout
+from http.client import HTTPConnection
+from unittest import mock
+
+from vibestudio import snapshot, studio
+from vibestudio.aioproxy import AsyncProxyServerThread
+from vibestudio.snapshot import Snapshot, prompt_fingerprint, routes_from_logs, write_snapshot
+
+
+def exchange(request_line, reply):
+    return {
+        "type": "llm_exchange",
+        "request": [{"role": "user", "content": f"{request_line} HTTP/1.1\nHost: x\n"}],
+        "response": reply,
+    }
+
+
+LOGS = [
+    exchange("GET /page?b=2&a=1", "HTTP/1.1 200 OK\nContent-Type: text/html\n\nold"),
+    {"type": "http", "request": "/page?b=2&a=1", "status": 200, "response": "old"},
+    exchange("GET /page?b=2&a=1", "{{{meta}}}\nHTTP/1.1 200 OK\nContent-Type: text/html\nX-A: 1\n\n<p>frozen</p>"),
+    exchange("POST /form", "HTTP/1.1 200 OK\n\nposted"),
+    exchange("GET /broken", "HTTP/1.1 500 Internal Server Error\n\nno"),
+    exchange("GET /missing", "HTTP/1.1 404 Not Found\n\ngone"),
+]
+
+
+class _ServerThread(threading.Thread):
+    def __init__(self, port, handler):
+        super().__init__(daemon=True)
+        self.server = studio.ThreadingHTTPServer(("localhost", port), handler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SnapshotFileTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".vsnap")
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_routes_keep_latest_cacheable_reply(self):
+        routes = routes_from_logs(LOGS)
+        self.assertEqual(sorted(routes), ["GET /missing", "GET /page?a=1&b=2"])
+        reply = routes["GET /page?a=1&b=2"]
+        self.assertEqual(reply.body, b"<p>frozen</p>")
+        self.assertEqual(reply.headers, [("Content-Type", "text/html"), ("X-A", "1")])
+
+    def test_round_trip_through_mapped_file(self):
+        write_snapshot(self.path, routes_from_logs(LOGS), "fp")
+        frozen = Snapshot(self.path)
+        reply = frozen.get("GET", "/page?a=1&b=2")
+        self.assertIsInstance(reply.body, memoryview)
+        self.assertEqual(bytes(reply.body), b"<p>frozen</p>")
+        self.assertEqual(frozen.get("HEAD", "/page?b=2&a=1").status, 200)
+        self.assertEqual(frozen.get("GET", "/missing").status, 404)
+        self.assertIsNone(frozen.get("GET", "/other"))
+        self.assertEqual(frozen.fingerprint, "fp")
+        stats = frozen.stats()
+        self.assertEqual((stats["routes"], stats["hits"], stats["misses"]), (2, 3, 1))
+
+    def test_rejects_other_files(self):
+        with open(self.path, "wb") as fh:
+            fh.write(b"not a snapshot at all")
+        with self.assertRaises(ValueError):
+            Snapshot(self.path)
+
+    def test_command_line_compiles_transcript(self):
+        transcript = os.path.join(tempfile.mkdtemp(), "transcript.json")
+        with open(transcript, "w", encoding="utf-8") as fh:
+            json.dump({"prompt": "p", "meta_prompt": "m", "logs": LOGS}, fh)
+        with redirect_stdout(io.StringIO()) as out:
+            self.assertEqual(snapshot.main([transcript, self.path]), 0)
+        os.unlink(transcript)
+        self.assertIn("2 routes", out.getvalue())
+        self.assertEqual(Snapshot(self.path).fingerprint, prompt_fingerprint("p", "m"))
+
+
+class FreezeModeTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".vsnap")
+        os.close(fd)
+        self.patchers = [
+            mock.patch.object(studio, "FROZEN", None),
+            mock.patch.object(studio, "FREEZE_PATH", self.path),
+            mock.patch.object(
+                studio.ProxyHandler, "call_llm", return_value="HTTP/1.1 200 OK\n\nfrom the model"
+            ),
+        ]
+        for p in self.patchers:
+            p.start()
+        studio.LOGS = list(LOGS)
+        studio.META_LOGS = []
+        studio.CONVERSATION = []
+        studio.freeze(self.path)
+        self.assertIsNotNone(studio.load_snapshot())
+        studio.LOGS = []
+
+    def tearDown(self):
+        for p in self.patchers:
+            p.stop()
+        os.unlink(self.path)
+
+    def get(self, port, path, method="GET"):
+        conn = HTTPConnection("localhost", port)
+        conn.request(method, path)
+        resp = conn.getresponse()
+        body = resp.read()
+        conn.close()
+        return resp, body
+
+    def assert_frozen(self, port):
+        resp, body = self.get(port, "/page?a=1&b=2")
+        self.assertEqual((resp.status, body), (200, b"<p>frozen</p>"))
+        self.assertEqual(resp.getheader("X-A"), "1")
+        resp, body = self.get(port, "/page?b=2&a=1", "HEAD")
+        self.assertEqual((resp.status, body), (200, b""))
+        self.assertEqual(self.get(port, "/new")[1], b"from the model")
+        self.assertEqual(studio.ProxyHandler.call_llm.call_count, 1)
+        self.assertEqual([e.get("frozen", False) for e in studio.LOGS if e["type"] == "http"], [True, True, False])
+        self.assertEqual(len(studio.CONVERSATION), 2)
+
+    def test_threaded_proxy_serves_frozen_routes(self):
+        thread = _ServerThread(8016, studio.ProxyHandler)
+        thread.start()
+        try:
+            self.assert_frozen(8016)
+        finally:
+            thread.stop()
+            thread.join()
+
+    def test_async_proxy_serves_frozen_routes(self):
+        thread = AsyncProxyServerThread(studio, port=8017)
+        thread.start()
+        try:
+            self.assert_frozen(8017)
+        finally:
+            thread.stop()
+            thread.join()
+
+    def test_prompt_change_drops_snapshot(self):
+        studio._invalidate_caches()
+        self.assertIsNotNone(studio.FROZEN)
+        with mock.patch.object(studio, "PROMPT", "a different service"):
+            studio._invalidate_caches()
+            self.assertIsNone(studio.FROZEN)
+            # A stale snapshot is not loaded again either
+            self.assertIsNone(studio.load_snapshot())
+
+    def test_freeze_endpoint(self):
+        studio.LOGS = list(LOGS[:3])
+        thread = _ServerThread(8505, studio.StudioHandler)
+        thread.start()
+        try:
+            conn = HTTPConnection("localhost", 8505)
+            conn.request("POST", "/api/freeze", body="{}", headers={"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            data = json.loads(resp.read())
+            conn.close()
+        finally:
+            thread.stop()
+            thread.join()
+        self.assertEqual(resp.status, 200)
+        self.assertEqual((data["path"], data["routes"], data["serving"]), (self.path, 1, True))
+        self.assertEqual(len(studio.FROZEN), 1)
+
+    def test_freeze_endpoint_rejects_forms_and_other_paths(self):
+        studio.LOGS = list(LOGS[:3])
+        fd, other = tempfile.mkstemp()
+        os.close(fd)
+        thread = _ServerThread(8512, studio.StudioHandler)
+        thread.start()
+        try:
+            conn = HTTPConnection("localhost", 8512)
+            conn.request(
+                "POST", "/api/freeze", body="path=x", headers={"Content-Type": "application/x-www-form-urlencoded"}
+            )
+            form = conn.getresponse()
+            form.read()
+            body = json.dumps({"path": other})
+            conn.request("POST", "/api/freeze", body=body, headers={"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            data = json.loads(resp.read())
+            conn.close()
+        finally:
+            thread.stop()
+            thread.join()
+            size = os.path.getsize(other)
+            os.unlink(other)
+        self.assertEqual(form.status, 415)
+        # The body cannot pick the file; only VIBESTUDIO_FREEZE is written
+        self.assertEqual((resp.status, data["path"], size), (200, self.path, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import threading
+import unittest
+from http.client import HTTPConnection
+from unittest import mock
+
+from vibestudio import studio
+
+REPLY = (
+    "{{{ meta }}}\n"
+    "HTTP/1.1 201 Created\n"
+    "Content-Type: text/html\n"
+    "Content-Length: 3\n"
+    "\n"
+    "<html>\n"
+    "STREAMED\n"
+    "</html>\n"
+    "\n"
+    "{{{ done }}}\n"
+)
+
+
+class _ServerThread(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.server = studio.HTTPServer(("localhost", 8003), studio.ProxyHandler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StreamingProxyTest(unittest.TestCase):
+    def setUp(self):
+        def fake_stream(self, messages):
+            for i in range(0, len(REPLY), 7):
+                yield REPLY[i:i + 7]
+
+        self.patchers = [
+            mock.patch.object(studio.ProxyHandler, "stream_llm", fake_stream),
+            mock.patch.object(studio, "STREAMING", True),
+        ]
+        for p in self.patchers:
+            p.start()
+        studio.LOGS = []
+        studio.META_LOGS = []
+        studio.CONVERSATION = []
+        self.thread = _ServerThread()
+        self.thread.start()
+
+    def tearDown(self):
+        self.thread.stop()
+        self.thread.join()
+        for p in self.patchers:
+            p.stop()
+
+    def test_chunked_response(self):
+        conn = HTTPConnection("localhost", 8003)
+        conn.request("GET", "/stream")
+        resp = conn.getresponse()
+        body = resp.read().decode()
+        conn.close()
+        self.assertEqual(resp.status, 201)
+        self.assertEqual(resp.getheader("Transfer-Encoding"), "chunked")
+        self.assertIsNone(resp.getheader("Content-Length"))
+        self.assertEqual(body, "<html>\nSTREAMED\n</html>")
+        self.assertEqual(studio.LOGS[-2]["request"], "/stream")
+        self.assertEqual(studio.LOGS[-1], {"type": "meta_in", "text": "done"})
+        self.assertEqual(studio.CONVERSATION[-1]["content"], REPLY)
+
+    def test_head_request(self):
+        conn = HTTPConnection("localhost", 8003)
+        conn.request("HEAD", "/stream")
+        resp = conn.getresponse()
+        self.assertEqual(resp.read(), b"")
+        conn.close()
+        self.assertEqual(resp.getheader("Content-Type"), "text/html")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,190 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.client import HTTPConnection
+from unittest import mock
+
+from vibestudio import studio
+from vibestudio.testjobs import TestRunner
+
+TEMPLATE = """import time
+import unittest
+
+
+class Case(unittest.TestCase):
+    def test_it(self):
+        time.sleep({sleep})
+        self.assertTrue({passes})
+"""
+
+
+class _StudioThread(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.server = studio.ThreadingHTTPServer(("localhost", 8509), studio.StudioHandler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _Modules:
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def module(self, name, sleep=0, passes=True):
+        path = os.path.join(self.dir, f"{name}.py")
+        with open(path, "w") as fh:
+            fh.write(TEMPLATE.format(sleep=sleep, passes=passes))
+        return name, path
+
+
+class TestRunnerTest(_Modules, unittest.TestCase):
+    def test_runs_in_parallel_and_reports_each_module(self):
+        runner = TestRunner(self.dir, workers=2)
+        modules = [self.module("test_a", 1), self.module("test_b", 1, passes=False)]
+        started = time.monotonic()
+        job = runner.submit(modules, "config")
+        self.assertTrue(job.wait(10))
+        self.assertLess(time.monotonic() - started, 1.9)
+        result = job.to_dict()
+        self.assertEqual(result["status"], "failed")
+        self.assertEqual([(t["module"], t["status"]) for t in result["tests"]],
+                         [("test_a", "passed"), ("test_b", "failed")])
+        self.assertIn("AssertionError", result["tests"][1]["output"])
+        events = [(e["type"], e.get("module"), e["status"]) for e in job.events]
+        self.assertEqual(events[0], ("job", None, "running"))
+        self.assertEqual(events[-1], ("job", None, "failed"))
+        self.assertEqual(len(events), 6)
+
+    def test_results_are_cached_per_configuration_and_source(self):
+        runner = TestRunner(self.dir)
+        modules = [self.module("test_a")]
+        runner.submit(modules, "config").wait(10)
+        job = runner.submit(modules, "config")
+        self.assertTrue(job.done)
+        self.assertTrue(job.to_dict()["tests"][0]["cached"])
+        self.assertEqual((runner.stats()["runs"], runner.stats()["cache_hits"]), (1, 1))
+
+        for changed in (dict(fingerprint="other"), dict(force=True)):
+            job = runner.submit(modules, changed.get("fingerprint", "config"), changed.get("force", False))
+            job.wait(10)
+            self.assertFalse(job.to_dict()["tests"][0]["cached"])
+        self.module("test_a", passes=False)
+        job = runner.submit(modules, "config")
+        job.wait(10)
+        self.assertEqual(job.status, "failed")
+        self.assertEqual(runner.stats()["runs"], 4)
+
+    def test_least_recently_used_results_are_forgotten(self):
+        runner = TestRunner(self.dir, max_results=2)
+        a, b, c = self.module("test_a"), self.module("test_b"), self.module("test_c")
+        for modules in ([a], [b], [a], [c]):
+            runner.submit(modules, "config").wait(10)
+        # test_a was used again, so test_b made room for test_c
+        self.assertEqual(runner.stats()["cached_results"], 2)
+        self.assertTrue(runner.submit([a], "config").done)
+        job = runner.submit([b], "config")
+        job.wait(10)
+        self.assertFalse(job.to_dict()["tests"][0]["cached"])
+        self.assertEqual(runner.stats()["runs"], 4)
+
+    def test_timeouts_and_cancellation(self):
+        runner = TestRunner(self.dir, workers=1, timeout=0.5)
+        job = runner.submit([self.module("test_slow", 30)], "config")
+        self.assertTrue(job.wait(10))
+        self.assertEqual(job.to_dict()["tests"][0]["status"], "timeout")
+
+        runner.timeout = 30
+        job = runner.submit([self.module("test_slow", 30), self.module("test_queued")], "config")
+        while job.results["test_slow"]["status"] != "running":
+            time.sleep(0.01)
+        started = time.monotonic()
+        runner.cancel(job.id)
+        self.assertTrue(job.wait(10))
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(job.status, "cancelled")
+        self.assertEqual([t["status"] for t in job.to_dict()["tests"]], ["cancelled", "cancelled"])
+        stats = runner.stats()
+        self.assertEqual((stats["timeouts"], stats["cancelled"], stats["cached_results"]), (1, 2, 0))
+
+    def test_empty_job_is_finished(self):
+        job = TestRunner(self.dir).submit([], "config")
+        self.assertEqual((job.status, job.done), ("passed", True))
+        self.assertTrue(list(job.events)[-1]["final"])
+
+
+class TestJobEndpointTest(_Modules, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        modules = dict([self.module("test_a"), self.module("test_b", 0.5)])
+        self.patchers = [
+            mock.patch.object(studio, "TEST_RUNNER", TestRunner(self.dir, workers=2)),
+            mock.patch.object(studio, "_test_modules", lambda: modules),
+        ]
+        for p in self.patchers:
+            p.start()
+        self.thread = _StudioThread()
+        self.thread.start()
+
+    def tearDown(self):
+        self.thread.stop()
+        self.thread.join()
+        for p in self.patchers:
+            p.stop()
+        super().tearDown()
+
+    def request(self, method, path, body=None):
+        conn = HTTPConnection("localhost", 8509, timeout=10)
+        conn.request(method, path, body=json.dumps(body) if body is not None else None)
+        resp = conn.getresponse()
+        data = resp.read()
+        conn.close()
+        return resp.status, data
+
+    def test_submit_stream_and_poll(self):
+        status, body = self.request("POST", "/api/test_jobs", {})
+        self.assertEqual(status, 202)
+        job = json.loads(body)
+        self.assertEqual([t["module"] for t in job["tests"]], ["test_a", "test_b"])
+
+        # The event stream ends after the job's final event
+        status, body = self.request("GET", f"/api/test_jobs/{job['id']}/events")
+        events = [json.loads(line[6:]) for line in body.decode().splitlines() if line.startswith("data: ")]
+        self.assertTrue(events[-1]["final"])
+        self.assertEqual(events[-1]["status"], "passed")
+        finished = [e["module"] for e in events if e["type"] == "test" and e["status"] == "passed"]
+        self.assertEqual(sorted(finished), ["test_a", "test_b"])
+
+        status, body = self.request("GET", f"/api/test_jobs/{job['id']}")
+        self.assertEqual(json.loads(body)["status"], "passed")
+        self.assertEqual(len(json.loads(self.request("GET", "/api/test_jobs")[1])), 1)
+
+    def test_errors(self):
+        self.assertEqual(self.request("POST", "/api/test_jobs", {"modules": ["test_missing"]})[0], 400)
+        for body in ({"modules": "test_a"}, {"modules": [1]}, ["test_a"], "test_a"):
+            self.assertEqual(self.request("POST", "/api/test_jobs", body)[0], 400)
+        self.assertEqual(studio.TEST_RUNNER.stats()["jobs"], 0)
+        self.assertEqual(self.request("GET", "/api/test_jobs/99")[0], 404)
+        self.assertEqual(self.request("POST", "/api/test_jobs/99/cancel")[0], 404)
+
+    def test_run_tests_waits_for_the_job(self):
+        status, body = self.request("POST", "/api/run_tests")
+        result = json.loads(body)
+        self.assertEqual(result["returncode"], 0)
+        self.assertIn("== test_b (passed)", result["output"])
+        self.assertEqual(studio._stats()["tests"]["runs"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
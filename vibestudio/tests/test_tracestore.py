@@ -0,0 +1,146 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.client import HTTPConnection
+from unittest import mock
+
+from vibestudio import studio
+from vibestudio.aioproxy import AsyncProxyServerThread
+from vibestudio.tracestore import TraceReplayer, TraceStore, iter_exchanges
+
+
+class _ServerThread(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.server = studio.ThreadingHTTPServer(("localhost", 8018), studio.ProxyHandler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def record(store, path, body, status=200, method="GET"):
+    store.record(
+        method, path, f"{method} {path} HTTP/1.1\n", [{"role": "user", "content": path}],
+        f"HTTP/1.1 {status} X\n\n{body}", status, [("Content-Type", "text/plain")], body.encode(), [],
+    )
+
+
+class TraceStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "trace.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_rows_are_written_in_batches(self):
+        store = TraceStore(self.path, batch_size=3)
+        for i in range(7):
+            record(store, f"/p{i}", str(i))
+        store.close()
+        rows = list(iter_exchanges(self.path))
+        self.assertEqual([r["path"] for r in rows], [f"/p{i}" for i in range(7)])
+        self.assertEqual(rows[0]["body"], b"0")
+        self.assertEqual(rows[0]["headers"], [("Content-Type", "text/plain")])
+        stats = store.stats()
+        self.assertEqual((stats["written"], stats["pending"], stats["dropped"]), (7, 0, 0))
+        self.assertGreaterEqual(stats["batches"], 3)
+        self.assertEqual([r["path"] for r in iter_exchanges(self.path, since=rows[4]["id"])], ["/p5", "/p6"])
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        release = threading.Event()
+        store = TraceStore(self.path, batch_size=1, max_pending=1)
+        write = store._write
+        with mock.patch.object(store, "_write", lambda conn, batch: (release.wait(5), write(conn, batch))):
+            for i in range(4):
+                record(store, f"/p{i}", "x")
+            release.set()
+            store.close()
+        stats = store.stats()
+        self.assertGreater(stats["dropped"], 0)
+        self.assertEqual(stats["written"] + stats["dropped"], 4)
+
+    def test_replayer_serves_replies_in_recorded_order(self):
+        store = TraceStore(self.path)
+        record(store, "/a?y=2&x=1", "first")
+        record(store, "/a?x=1&y=2", "second")
+        record(store, "/b", "b", method="POST")
+        store.close()
+        replay = TraceReplayer(self.path)
+        bodies = [replay.get("GET", "/a?x=1&y=2").body for _ in range(3)]
+        self.assertEqual(bodies, [b"first", b"second", b"second"])
+        self.assertIsNone(replay.get("GET", "/b"))
+        self.assertEqual(replay.get("POST", "/b").body, b"b")
+        replay.rewind()
+        self.assertEqual(replay.get("GET", "/a?y=2&x=1").body, b"first")
+        self.assertEqual(replay.stats()["misses"], 1)
+
+
+class RecordReplayProxyTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "trace.db")
+        self.calls = 0
+        outer = self
+
+        def fake_call(self, messages):
+            outer.calls += 1
+            return f"{{{{{{note}}}}}}\nHTTP/1.1 200 OK\nContent-Type: text/plain\n\ncall {outer.calls}"
+
+        self.patcher = mock.patch.object(studio.ProxyHandler, "call_llm", fake_call)
+        self.patcher.start()
+        studio.LOGS = []
+        studio.META_LOGS = []
+        studio.CONVERSATION = []
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.dir)
+
+    def get(self, port, path):
+        conn = HTTPConnection("localhost", port)
+        conn.request("GET", path)
+        resp = conn.getresponse()
+        body = resp.read()
+        conn.close()
+        return resp.status, body
+
+    def test_recorded_run_replays_without_model_calls(self):
+        store = TraceStore(self.path)
+        thread = _ServerThread()
+        thread.start()
+        try:
+            with mock.patch.object(studio, "TRACE_STORE", store):
+                recorded = [self.get(8018, p) for p in ("/one", "/two", "/one")]
+        finally:
+            thread.stop()
+            thread.join()
+        store.close()
+        row = next(iter_exchanges(self.path))
+        self.assertEqual((row["method"], row["path"], row["status"]), ("GET", "/one", 200))
+        self.assertEqual(row["meta"], ["note"])
+        self.assertIn("llm_ms", row["timings"])
+        self.assertTrue(row["request_text"].startswith("GET /one HTTP/1.1"))
+        self.assertEqual(row["messages"][-1]["content"], row["request_text"])
+
+        thread = AsyncProxyServerThread(studio, port=8019)
+        thread.start()
+        try:
+            with mock.patch.object(studio, "TRACE_REPLAY", TraceReplayer(self.path)):
+                replayed = [self.get(8019, p) for p in ("/one", "/two", "/one")]
+        finally:
+            thread.stop()
+            thread.join()
+        self.assertEqual(replayed, recorded)
+        self.assertEqual(self.calls, 3)
+        self.assertEqual(sum(1 for e in studio.LOGS if e.get("replayed")), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
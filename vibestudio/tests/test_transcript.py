@@ -0,0 +1,149 @@
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+import zlib
+from http.client import HTTPConnection
+
+from vibestudio import studio
+from vibestudio.logbuffer import LogBuffer
+from vibestudio.transcript import export_lines, parse_options, read_transcript, write_lines
+
+HEADER = {"prompt": "p", "meta_prompt": "m"}
+
+
+class _StudioThread(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.server = studio.ThreadingHTTPServer(("localhost", 8508), studio.StudioHandler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def buffer(count, start_ts=100.0):
+    clock = iter(start_ts + i for i in range(count))
+    buf = LogBuffer(capacity=count, clock=lambda: next(clock))
+    for i in range(count):
+        buf.append({"type": "http", "n": i})
+    return buf
+
+
+def records(data):
+    return [json.loads(line) for line in data.decode("utf-8").splitlines()]
+
+
+class ExportTest(unittest.TestCase):
+    def test_pages_and_time_ranges(self):
+        logs = {"logs": list(buffer(10)), "meta_logs": list(buffer(3))}
+        options = parse_options("since_logs=2&since_meta_logs=2&limit=3")
+        lines = [json.loads(l) for l in export_lines(HEADER, logs, options)]
+        self.assertEqual(lines[0], {"type": "transcript", **HEADER})
+        self.assertEqual([r["entry"]["seq"] for r in lines if r.get("log") == "logs"], [3, 4, 5])
+        self.assertEqual([r["entry"]["seq"] for r in lines if r.get("log") == "meta_logs"], [3])
+        self.assertEqual(lines[-1], {
+            "type": "end",
+            "logs": {"entries": 3, "next": 5, "more": True},
+            "meta_logs": {"entries": 1, "next": 3, "more": False},
+        })
+
+        options = parse_options("log=logs&start=103&end=106")
+        lines = [json.loads(l) for l in export_lines(HEADER, logs, options)]
+        self.assertEqual([r["entry"]["n"] for r in lines[1:-1]], [3, 4, 5])
+        self.assertNotIn("meta_logs", lines[-1])
+
+    def test_each_log_has_its_own_cursor(self):
+        logs = {"logs": list(buffer(10)), "meta_logs": list(buffer(3))}
+        lines = [json.loads(l) for l in export_lines(HEADER, logs, parse_options("since_logs=8"))]
+        self.assertEqual([r["entry"]["seq"] for r in lines if r.get("log") == "logs"], [9, 10])
+        self.assertEqual([r["entry"]["seq"] for r in lines if r.get("log") == "meta_logs"], [1, 2, 3])
+        self.assertEqual(parse_options("log=meta_logs&since=2").since, {"logs": 0, "meta_logs": 2})
+
+    def test_bad_options(self):
+        for query in ("log=logs&since=x", "since_logs=x", "log=other", "end=soon", "since=2"):
+            with self.assertRaises(ValueError):
+                parse_options(query)
+        self.assertTrue(parse_options("gzip=1").compress)
+        self.assertFalse(parse_options("gzip=0").compress)
+
+    def test_gzip_chunks_can_be_read_as_they_arrive(self):
+        out = io.BytesIO()
+        chunks = []
+        out.flush = lambda: chunks.append(len(out.getvalue()))
+        lines = (json.dumps({"n": i, "pad": "x" * 100}) for i in range(100))
+        written = write_lines(out, lines, compress=True, chunk_size=1024)
+        self.assertGreater(len(chunks), 5)
+        # Everything flushed with the first chunk decompresses on its own
+        partial = zlib.decompressobj(zlib.MAX_WBITS | 16).decompress(out.getvalue()[:chunks[0]])
+        self.assertGreaterEqual(len(partial), 1024)
+        self.assertEqual(partial.split(b"\n")[0], json.dumps({"n": 0, "pad": "x" * 100}).encode())
+        data = gzip.decompress(out.getvalue())
+        self.assertEqual(len(data), written)
+        self.assertEqual(len(data.splitlines()), 100)
+
+    def test_read_transcript_formats(self):
+        logs = {"logs": list(buffer(2)), "meta_logs": list(buffer(1))}
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            with gzip.open(path, "wb") as fh:
+                write_lines(fh, export_lines(HEADER, logs, parse_options("")))
+            loaded = read_transcript(path)
+            self.assertEqual(loaded, {**HEADER, **logs})
+            with open(path, "w", encoding="utf-8") as fh:
+                json.dump({**HEADER, **logs}, fh, indent=2)
+            self.assertEqual(read_transcript(path), loaded)
+        finally:
+            os.unlink(path)
+
+
+class ExportEndpointTest(unittest.TestCase):
+    def setUp(self):
+        studio.LOGS = buffer(5)
+        studio.META_LOGS = buffer(2)
+        self.thread = _StudioThread()
+        self.thread.start()
+
+    def tearDown(self):
+        self.thread.stop()
+        self.thread.join()
+
+    def get(self, path):
+        conn = HTTPConnection("localhost", 8508)
+        conn.request("GET", path)
+        resp = conn.getresponse()
+        body = resp.read()
+        conn.close()
+        return resp, body
+
+    def test_ndjson_export(self):
+        resp, body = self.get("/api/transcript/export?log=logs&since=1&limit=2")
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(resp.getheader("Content-Type"), "application/x-ndjson")
+        lines = records(body)
+        self.assertEqual(lines[0]["prompt"], studio.PROMPT)
+        self.assertEqual([r["entry"]["seq"] for r in lines[1:-1]], [2, 3])
+        self.assertEqual(lines[-1]["logs"], {"entries": 2, "next": 3, "more": True})
+
+    def test_gzip_export(self):
+        resp, body = self.get("/api/transcript/export?gzip=1")
+        self.assertEqual(resp.getheader("Content-Type"), "application/gzip")
+        self.assertIn("ndjson.gz", resp.getheader("Content-Disposition"))
+        lines = records(gzip.decompress(body))
+        self.assertEqual(len(lines), 1 + 5 + 2 + 1)
+
+    def test_bad_query(self):
+        self.assertEqual(self.get("/api/transcript/export?limit=all")[0].status, 400)
+        # One cursor for both logs would skip entries of one of them
+        self.assertEqual(self.get("/api/transcript/export?since=1")[0].status, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
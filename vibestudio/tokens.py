@@ -0,0 +1,33 @@
+"""Offline token estimates for chat messages."""
+
+import functools
+import re
+
+# Words and individual punctuation marks are roughly one token each
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+# Per-message framing added by chat APIs (role markers and separators)
+MESSAGE_OVERHEAD = 4
+
+# Messages whose estimates are remembered; a conversation is estimated on
+# every call, so only the messages added since the last one are counted
+MESSAGE_CACHE_SIZE = 65536
+
+
+def estimate_text_tokens(text):
+    """Return an approximate token count for ``text``.
+
+    Long words are counted as one token per four characters, which tracks
+    BPE tokenisers closely enough for budgeting without loading one.
+    """
+    return sum((len(m) + 3) // 4 for m in _TOKEN_RE.findall(text))
+
+
+@functools.lru_cache(maxsize=MESSAGE_CACHE_SIZE)
+def _message_tokens(content):
+    return estimate_text_tokens(content) + MESSAGE_OVERHEAD
+
+
+def estimate_tokens(messages):
+    """Return the approximate prompt size of a list of chat messages."""
+    return sum(_message_tokens(m["content"]) for m in messages)
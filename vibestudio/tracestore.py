@@ -0,0 +1,223 @@
+"""Persistent record of proxy exchanges and replay of recorded replies.
+
+:class:`TraceStore` appends every exchange to an SQLite database from a
+background thread; the request path only puts a row on a queue.
+:class:`TraceReplayer` loads a recorded trace and answers requests with the
+replies it holds, in recorded order, so a run can be reproduced without
+calling the model.
+"""
+
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from .cache import CachedReply
+from .snapshot import route_key
+
+LOGGER = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exchanges (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    method TEXT NOT NULL,
+    path TEXT NOT NULL,
+    route TEXT NOT NULL,
+    request_text TEXT NOT NULL,
+    messages TEXT NOT NULL,
+    reply TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    body BLOB NOT NULL,
+    meta TEXT NOT NULL,
+    timings TEXT NOT NULL,
+    flags TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS exchanges_route ON exchanges (route, id);
+"""
+
+_INSERT = (
+    "INSERT INTO exchanges (ts, method, path, route, request_text, messages, reply, status, headers, body,"
+    " meta, timings, flags) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+# Marks the end of the queue for the writer thread
+_STOP = object()
+
+
+def connect(path):
+    """Open a trace database, creating the schema if needed."""
+    conn = sqlite3.connect(path, timeout=30)
+    # WAL lets readers and the writer work at the same time
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def iter_exchanges(path, since=0):
+    """Yield recorded exchanges with ``id > since`` as dicts, oldest first."""
+    conn = connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        for row in conn.execute("SELECT * FROM exchanges WHERE id > ? ORDER BY id", (since,)):
+            item = dict(row)
+            for field in ("messages", "headers", "meta", "timings", "flags"):
+                item[field] = json.loads(item[field])
+            item["headers"] = [tuple(h) for h in item["headers"]]
+            yield item
+    finally:
+        conn.close()
+
+
+class TraceStore:
+    """Append exchanges to an SQLite trace through a batching writer thread.
+
+    :meth:`record` never blocks: rows wait on a queue of at most
+    ``max_pending`` and are dropped (and counted) when the writer falls that
+    far behind.  The writer commits up to ``batch_size`` rows per
+    transaction, waiting at most ``flush_interval`` seconds to fill a batch.
+    """
+
+    def __init__(self, path, batch_size=100, flush_interval=0.2, max_pending=10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Create the schema up front so configuration errors surface here
+        connect(path).close()
+        self._queue = queue.Queue(max_pending)
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.errors = 0
+        self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self._thread.start()
+
+    def record(self, method, path, request_text, messages, reply, status, headers, body, meta,
+               timings=None, flags=None):
+        """Queue one exchange for writing."""
+        row = (
+            time.time(), method, path, route_key(method, path), request_text,
+            json.dumps(messages), reply, status, json.dumps([list(h) for h in headers]), bytes(body),
+            json.dumps(meta), json.dumps(timings or {}), json.dumps(flags or {}),
+        )
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return
+        with self._lock:
+            self.recorded += 1
+
+    def _run(self):
+        conn = connect(self.path)
+        try:
+            while True:
+                row = self._queue.get()
+                if row is _STOP:
+                    self._queue.task_done()
+                    return
+                batch = [row]
+                deadline = time.monotonic() + self.flush_interval
+                stop = False
+                while len(batch) < self.batch_size:
+                    try:
+                        row = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                    if row is _STOP:
+                        stop = True
+                        break
+                    batch.append(row)
+                self._write(conn, batch)
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _write(self, conn, batch):
+        try:
+            with conn:
+                conn.executemany(_INSERT, batch)
+        except sqlite3.Error as exc:
+            LOGGER.error("Could not write %d trace rows: %s", len(batch), exc)
+            with self._lock:
+                self.errors += len(batch)
+            return
+        with self._lock:
+            self.written += len(batch)
+            self.batches += 1
+
+    def flush(self):
+        """Block until every queued exchange has been written."""
+        self._queue.join()
+
+    def close(self):
+        """Write the remaining rows and stop the writer thread."""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "path": self.path,
+                "recorded": self.recorded,
+                "written": self.written,
+                "pending": self._queue.qsize(),
+                "dropped": self.dropped,
+                "batches": self.batches,
+                "errors": self.errors,
+            }
+
+
+class TraceReplayer:
+    """Serve recorded replies for a trace, one route at a time in recorded order.
+
+    The n-th request for a route gets the n-th reply recorded for it; once
+    they run out the last one is repeated.  Only the exchanges with an id
+    above ``since`` are used.
+    """
+
+    def __init__(self, path, since=0):
+        self.path = path
+        self._replies = defaultdict(list)
+        for item in iter_exchanges(path, since):
+            self._replies[item["route"]].append(CachedReply(item["status"], item["headers"], item["body"]))
+        self._served = defaultdict(int)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return sum(len(replies) for replies in self._replies.values())
+
+    def get(self, method, path):
+        """Return the next recorded reply for a request, ``None`` on a miss."""
+        route = route_key(method, path)
+        replies = self._replies.get(route)
+        with self._lock:
+            if not replies:
+                self.misses += 1
+                return None
+            index = min(self._served[route], len(replies) - 1)
+            self._served[route] += 1
+            self.hits += 1
+        return replies[index]
+
+    def rewind(self):
+        """Start every route from its first recorded reply again."""
+        with self._lock:
+            self._served.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"path": self.path, "exchanges": len(self), "routes": len(self._replies),
+                    "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,159 @@
+"""Streaming transcript export.
+
+``GET /api/transcript/export`` writes the Studio logs as newline-delimited
+JSON, compressed with gzip on request, one line at a time::
+
+    {"type": "transcript", "prompt": ..., "meta_prompt": ..., "model": ...}
+    {"type": "entry", "log": "logs", "entry": {...}}
+    {"type": "entry", "log": "meta_logs", "entry": {...}}
+    {"type": "end", "logs": {"entries": 2, "next": 57, "more": false}, ...}
+
+The logs are captured as lists of entry references, which is cheap, and
+entries are serialised while they are written, so an export never holds the
+whole transcript as text.  The ``end`` line carries a ``next`` cursor per
+log for fetching the following page, passed back as ``since_<log>``.
+"""
+
+import gzip
+import json
+import zlib
+from collections import namedtuple
+from urllib.parse import parse_qs
+
+LOG_NAMES = ("logs", "meta_logs")
+
+# Bytes of serialised lines collected before each write to the client
+CHUNK_SIZE = 64 * 1024
+
+# ``since`` maps each exported log to its cursor
+ExportOptions = namedtuple("ExportOptions", "logs since limit start end compress")
+
+
+def parse_options(query):
+    """Return :class:`ExportOptions` for an export query string.
+
+    Each log has its own cursor, ``since_logs`` and ``since_meta_logs``; a
+    plain ``since`` is only accepted when a single ``log`` is exported.
+    Raises ``ValueError`` for an unknown log, a malformed number or a
+    ``since`` that would apply to both logs.
+    """
+    params = parse_qs(query)
+
+    def number(name, cast):
+        if name not in params:
+            return None
+        try:
+            return cast(params[name][0])
+        except ValueError:
+            raise ValueError(f"{name} must be a number") from None
+
+    logs = params.get("log", list(LOG_NAMES))
+    for name in logs:
+        if name not in LOG_NAMES:
+            raise ValueError(f"unknown log {name!r}")
+    since = {name: number(f"since_{name}", int) or 0 for name in LOG_NAMES}
+    if "since" in params:
+        # The logs number their entries separately, one cursor cannot fit both
+        if len(set(logs)) != 1:
+            raise ValueError("since needs a single log; use since_logs and since_meta_logs")
+        since[logs[0]] = number("since", int) or 0
+    return ExportOptions(
+        logs=logs,
+        since=since,
+        limit=number("limit", int),
+        start=number("start", float),
+        end=number("end", float),
+        compress=params.get("gzip", ["0"])[0] not in ("", "0", "false"),
+    )
+
+
+def export_lines(header, logs, options):
+    """Yield the export as JSON lines for ``logs``, a mapping of name to entries.
+
+    Each log is paged independently: entries after its ``since`` cursor, at
+    most ``limit`` of them, with a ``ts`` in ``[start, end)``.
+    """
+    yield json.dumps({"type": "transcript", **header})
+    summary = {}
+    for name in options.logs:
+        since = options.since[name]
+        count, last, more = 0, since, False
+        for position, entry in enumerate(logs[name], 1):
+            seq = entry.get("seq", position)
+            ts = entry.get("ts")
+            if seq <= since:
+                continue
+            if options.start is not None and (ts is None or ts < options.start):
+                continue
+            if options.end is not None and (ts is None or ts >= options.end):
+                continue
+            if options.limit is not None and count >= options.limit:
+                more = True
+                break
+            yield json.dumps({"type": "entry", "log": name, "entry": entry}, default=str)
+            count += 1
+            last = seq
+        summary[name] = {"entries": count, "next": last, "more": more}
+    yield json.dumps({"type": "end", **summary})
+
+
+def write_lines(out, lines, compress=False, chunk_size=CHUNK_SIZE):
+    """Write ``lines`` to the binary stream ``out`` in chunks and flush each one.
+
+    With ``compress`` the output is one gzip member whose data is flushed
+    with every chunk, so the client can decompress what it has received.
+    Returns the number of uncompressed bytes written.
+    """
+    target = gzip.GzipFile(fileobj=out, mode="wb") if compress else out
+    written = 0
+    batch = []
+    size = 0
+    for line in lines:
+        data = line.encode("utf-8") + b"\n"
+        batch.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            written += _write_chunk(target, out, batch, compress)
+            batch, size = [], 0
+    if batch:
+        written += _write_chunk(target, out, batch, compress)
+    if compress:
+        target.close()
+        out.flush()
+    return written
+
+
+def _write_chunk(target, out, batch, compress):
+    data = b"".join(batch)
+    target.write(data)
+    if compress:
+        target.flush(zlib.Z_SYNC_FLUSH)
+    out.flush()
+    return len(data)
+
+
+def read_transcript(path):
+    """Load a saved transcript: ``/api/transcript`` JSON or an export, gzipped or not.
+
+    Returns a dict in the ``/api/transcript`` layout.
+    """
+    with open(path, "rb") as fh:
+        compressed = fh.read(2) == b"\x1f\x8b"
+    opener = gzip.open if compressed else open
+    with opener(path, "rt", encoding="utf-8") as fh:
+        first = fh.readline()
+        try:
+            record = json.loads(first)
+        except ValueError:
+            record = None
+        if not isinstance(record, dict) or record.get("type") != "transcript":
+            # A plain JSON transcript spread over several lines
+            return json.loads(first + fh.read())
+        transcript = {k: v for k, v in record.items() if k != "type"}
+        for name in LOG_NAMES:
+            transcript[name] = []
+        for line in fh:
+            record = json.loads(line)
+            if record.get("type") == "entry":
+                transcript[record["log"]].append(record["entry"])
+    return transcript
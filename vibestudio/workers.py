@@ -0,0 +1,133 @@
+"""Proxy worker processes sharing one port.
+
+``VIBESTUDIO_PROXY_WORKERS=N`` makes the Studio start ``N`` copies of the
+proxy as separate processes instead of a proxy thread, so request handling,
+reply parsing and logging use every core instead of sharing one GIL.  Each
+worker binds the proxy port with ``SO_REUSEPORT`` and the kernel spreads
+incoming connections over them.  Conversations, logs and the prompts live in
+a :class:`~vibestudio.sharedstate.SharedState` file.  Token budgets,
+admission control and metrics stay per process; each worker publishes its
+counters to the file, where :meth:`WorkerPool.stats` collects them.
+
+Run one worker by hand with::
+
+    python -m vibestudio.workers --state /tmp/vibestudio.db --port 8000
+"""
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+
+from .sharedstate import SharedState
+
+LOGGER = logging.getLogger(__name__)
+
+# Seconds between a worker's publications of its counters
+STATS_INTERVAL = 2.0
+
+
+class WorkerPool:
+    """Start, stop and watch the proxy worker processes.
+
+    Has the ``start``/``stop``/``join`` interface of the proxy server
+    threads, so the Studio restarts it the same way.
+    """
+
+    def __init__(self, count, state_path, host="localhost", port=8000, engine="threading", env=None):
+        if not hasattr(socket, "SO_REUSEPORT"):
+            raise RuntimeError("proxy workers need SO_REUSEPORT, which this platform lacks")
+        self.count = count
+        self.state_path = state_path
+        self.host = host
+        self.port = port
+        self.engine = engine
+        self.env = env
+        self.processes = []
+        self._state = None
+
+    def start(self):
+        command = [
+            sys.executable, "-m", "vibestudio.workers", "--state", self.state_path,
+            "--host", self.host, "--port", str(self.port), "--engine", self.engine,
+        ]
+        env = dict(os.environ if self.env is None else self.env)
+        # Workers import this package from wherever the Studio did
+        package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_root, env.get("PYTHONPATH")]))
+        for _ in range(self.count):
+            self.processes.append(subprocess.Popen(command, env=env))
+        LOGGER.info("Started %d proxy workers on http://%s:%s", self.count, self.host, self.port)
+
+    def stop(self):
+        LOGGER.info("Stopping %d proxy workers", len(self.processes))
+        for process in self.processes:
+            if process.poll() is None:
+                process.terminate()
+
+    def join(self, timeout=10):
+        for process in self.processes:
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                LOGGER.warning("Proxy worker %d did not stop, killing it", process.pid)
+                process.kill()
+                process.wait()
+
+    def stats(self):
+        if self._state is None:
+            self._state = SharedState(self.state_path)
+        alive = {p.pid for p in self.processes if p.poll() is None}
+        processes = {pid: stats for pid, stats in self._state.worker_stats().items() if pid in alive}
+        return {
+            "workers": self.count,
+            "alive": len(alive),
+            # Budgets and limits apply per worker, so the totals are summed here
+            "total_tokens": sum(stats["tokens"]["total_tokens"] for stats in processes.values()),
+            "llm_calls": sum(stats["llm"]["calls"] for stats in processes.values()),
+            "processes": processes,
+        }
+
+
+def serve(state_path, host="localhost", port=8000, engine="threading"):
+    """Run one proxy worker until it receives SIGTERM or SIGINT."""
+    from . import studio
+
+    studio.attach_shared_state(state_path, worker=True)
+    studio.load_routes()
+    studio.load_snapshot()
+    if engine == "asyncio":
+        from .aioproxy import AsyncProxyServerThread
+
+        server = AsyncProxyServerThread(studio, host, port, reuse_port=True)
+    else:
+        server = studio._ProxyServerThread(host, port, reuse_port=True)
+    stopping = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stopping.set())
+    server.start()
+    LOGGER.info("Proxy worker %d serving on http://%s:%s", os.getpid(), host, port)
+    studio.SHARED_STATE.publish_stats(os.getpid(), studio._stats())
+    while not stopping.wait(STATS_INTERVAL):
+        studio.SHARED_STATE.publish_stats(os.getpid(), studio._stats())
+    server.stop()
+    server.join()
+    studio.SHARED_STATE.publish_stats(os.getpid(), studio._stats())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run one VibeStudio proxy worker.")
+    parser.add_argument("--state", required=True, help="shared state file written by the Studio")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--engine", choices=("threading", "asyncio"), default="threading")
+    args = parser.parse_args(argv)
+    serve(args.state, args.host, args.port, args.engine)
+
+
+if __name__ == "__main__":
+    main()